@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+'''Measure how long ``import safe`` takes in a fresh interpreter and
+fail if it goes over budget. Run it from the root of the repository.
+
+    $ python benchmarks/import_time.py --budget 0.05
+'''
+
+import sys
+import argparse
+import subprocess
+import timeit
+
+
+def run(statement, repeat):
+    command = [sys.executable, '-c', statement]
+    timings = timeit.repeat(lambda: subprocess.check_call(command),
+                            number=1, repeat=repeat)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='Allowed import time in seconds')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of runs, the fastest is kept')
+    args = parser.parse_args()
+
+    baseline = run('pass', args.repeat)
+    measured = run('import safe', args.repeat) - baseline
+
+    print('import safe: {:.1f}ms (budget {:.1f}ms)'.format(measured * 1000,
+                                                          args.budget * 1000))
+    if measured > args.budget:
+        print('over budget!')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,42 @@
 # Author(s)
 # Simon Gomizelj <sgomizelj@sangoma.com>
 
+import sys
 from .api import api
-from .library import APIError, CommitFailed, CommitIncomplete
-from .parser import parse_from_url
+
+# Everything else is loaded on first access, keeping requests off the
+# import path of tools which only work with local specification files
+_lazy = {
+    'APIError': 'library',
+    'CommitFailed': 'library',
+    'CommitIncomplete': 'library',
+    'parse_from_url': 'parser',
+}
+
+_submodules = ('adapters', 'cache', 'cli', 'codec', 'concurrency', 'drift',
+               'index', 'journal', 'library', 'monitor', 'parser', 'plan',
+               'profiler', 'raw', 'record', 'registry', 'specdiff',
+               'transport', 'url', 'utils', 'watch')
+
+if sys.version_info >= (3, 7):
+    import importlib
+
+    def __getattr__(name):
+        if name in _submodules:
+            return importlib.import_module('.' + name, __name__)
+
+        try:
+            module = _lazy[name]
+        except KeyError:
+            raise AttributeError('module {!r} has no attribute '
+                                 '{!r}'.format(__name__, name))
+
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy) | set(_submodules))
+else:
+    from .library import APIError, CommitFailed, CommitIncomplete
+    from .parser import parse_from_url
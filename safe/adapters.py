@@ -0,0 +1,202 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Transport adapters which can be mounted on the session used to talk
+to a device, usually through the ``adapter`` argument of
+:func:`safe.api`.
+'''
+
+import time
+import gzip
+import base64
+import threading
+import collections
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlsplit
+from . import codec
+
+
+def endpoint(request):
+    '''Identify what a request is for: its http method, then the
+    section, method, module and object of its SAFe url, leaving out
+    the keys of collection members.'''
+    segments = [s for s in urlsplit(request.url).path.split('/') if s]
+    # /SAFe/sng_rest/<section>/<method>/<module>/<object>/...
+    return (request.method,) + tuple(segments[2:6])
+
+
+class LimitedAdapter(BaseAdapter):
+    '''Wrap another adapter, holding every request to a slot of an
+    :class:`safe.concurrency.AdaptiveLimiter`. Server errors, transport
+    errors and latency, per :func:`endpoint`, are fed back to the
+    limiter.
+
+    :param limiter: The limiter to take slots from.
+    :param adapter: The adapter to send requests through, by default a
+        plain :class:`requests.adapters.HTTPAdapter`.
+    '''
+
+    def __init__(self, limiter, adapter=None):
+        super(LimitedAdapter, self).__init__()
+        self.limiter = limiter
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        token = self.limiter.acquire()
+        start = time.time()
+        failed = True
+        try:
+            response = self.adapter.send(request, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.limiter.release(token, time.time() - start, failed,
+                                 endpoint(request))
+
+    def close(self):
+        self.adapter.close()
+
+
+def open_cassette(path, mode):
+    '''Open a cassette file, gzip compressed if its name ends in
+    ``.gz``.'''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def encode_body(body):
+    if body is None:
+        return None
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    return base64.b64encode(body).decode('ascii')
+
+
+def decode_body(body):
+    if body is None:
+        return None
+    return base64.b64decode(body)
+
+
+class RecordingAdapter(BaseAdapter):
+    '''Record every request and response passing through another
+    adapter into a cassette file, one json document per line. Request
+    headers, and so the api token, are not recorded.
+
+    The cassette is gzip compressed if its name ends in ``.gz``, in
+    which case it's only complete once the adapter, or the session
+    it's mounted on, is closed::
+
+        >>> recorder = safe.adapters.RecordingAdapter('session.jsonl.gz')
+        >>> api = safe.api('10.10.9.100', adapter=recorder)
+        >>> ...
+        >>> api.session.close()
+
+    :param path: The cassette file to write.
+    :param adapter: The adapter to send requests through, by default a
+        plain :class:`requests.adapters.HTTPAdapter`.
+    '''
+
+    def __init__(self, path, adapter=None):
+        super(RecordingAdapter, self).__init__()
+        self.adapter = adapter or HTTPAdapter()
+        self.fp = open_cassette(path, 'wb')
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        response = self.adapter.send(request, **kwargs)
+        elapsed = time.time() - start
+
+        entry = {
+            'method': request.method,
+            'url': request.url,
+            'body': encode_body(request.body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'content': encode_body(response.content),
+            'elapsed': round(elapsed, 6),
+        }
+
+        with self.lock:
+            self.fp.write(codec.dumps(entry) + b'\n')
+            self.fp.flush()
+        return response
+
+    def close(self):
+        self.adapter.close()
+        with self.lock:
+            self.fp.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    '''Serve the responses of a cassette written by
+    :class:`RecordingAdapter`, without touching the network.
+
+    Requests are matched on method and url, in recorded order,
+    preferring a recording with the same body. Once the recordings for
+    a request are exhausted, the last one keeps being served.
+
+    :param path: The cassette file to read.
+    :param latency: Simulated latency for every response, in seconds.
+        Pass ``'recorded'`` to replay the latency observed while
+        recording.
+    '''
+
+    def __init__(self, path, latency=0.0):
+        super(ReplayAdapter, self).__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries = collections.defaultdict(list)
+
+        with open_cassette(path, 'rb') as fp:
+            for line in fp:
+                if line.strip():
+                    entry = codec.loads(line)
+                    key = (entry['method'], entry['url'])
+                    self.entries[key].append(entry)
+
+    def match(self, request):
+        key = (request.method, request.url)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise requests.ConnectionError(
+                    'No recorded response for {} {}'.format(*key),
+                    request=request)
+
+            body = encode_body(request.body)
+            index = next((i for i, entry in enumerate(entries)
+                          if entry['body'] == body), 0)
+            if len(entries) > 1:
+                return entries.pop(index)
+            return entries[index]
+
+    def send(self, request, **kwargs):
+        entry = self.match(request)
+
+        if self.latency == 'recorded':
+            time.sleep(entry.get('elapsed', 0))
+        elif self.latency:
+            time.sleep(self.latency)
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = decode_body(entry['content']) or b''
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
@@ -6,13 +6,18 @@
 # Simon Gomizelj <sgomizelj@sangoma.com>
 
 import re
-import json
+import copy
 import keyword
-import requests
 import logging
-from .url import url_builder, unpack_rest_response
-from .library import CommitIncomplete, parse_messages
-from .parser import parse
+import weakref
+from . import codec
+from .concurrency import ReadAhead, SingleFlight, limiter_for
+from .url import APIResponse, quote_segment, url_builder, unpack_rest_response
+from .index import CollectionIndex
+from .parser import SpecIndex, parse, split_path
+from .profiler import phase
+from .record import as_payload, record_type
+from .specdiff import share
 from .utils import deprecated
 
 
@@ -61,11 +66,17 @@ def make_docstring(description):
 
 
 class APIWrapper(object):
-    def __init__(self, node, version, session, builder):
+    def __init__(self, node, version, session, builder, indexes=None,
+                 flights=None, cache=None):
         self.node = node
         self.version = version
         self.session = session
         self.builder = builder
+        self.indexes = indexes if indexes is not None else []
+        self.flights = flights if flights is not None else \
+            SingleFlight(copy.deepcopy)
+        self.cache = cache
+        self.element_type = None
 
     @property
     def interface(self):
@@ -77,14 +88,29 @@ class APIWrapper(object):
         if self.node:
             return [node.tag for node in self.node.methods]
 
+    @property
+    def record_type(self):
+        return record_type(self.node)
+
     def __contains__(self, key):
         return key in self.interface
 
+    def descend(self, node):
+        '''Create the wrapper for a child object of this node.'''
+        return APIWrapper(node, self.version, self.session,
+                          self.builder.join(node.tag), flights=self.flights,
+                          cache=self.cache)
+
+    def member(self, key):
+        '''Create the wrapper for a single member of this collection.'''
+        return APIWrapper(self.node, self.version, self.session,
+                          self.builder.join(key), self.indexes, self.flights,
+                          self.cache)
+
     def get_child(self, key):
-        new_builder = self.builder.join(key)
-        new_api = APIWrapper(self.node, self.version,
-                             self.session, new_builder)
-        return build_type(self.node, new_api, APIObject)(key)
+        if self.element_type is None:
+            self.element_type = build_type(self.node, APIElement)
+        return self.element_type(self, key)
 
     def get_config(self):
         safe_url = self.builder.url(None, section='config')
@@ -97,68 +123,156 @@ class APIWrapper(object):
 
         files = {'archive': (filename, payload)}
         safe_url = self.builder.url('upload')
-        return unpack_rest_response(self.session.post(safe_url, files=files))
+        response = unpack_rest_response(self.session.post(safe_url,
+                                                          files=files))
+        self.invalidate()
+        return response
+
+    def fetch(self, safe_url, params=None):
+        return unpack_rest_response(self.session.get(safe_url, params=params))
 
     def get(self, method, path=None, params=None):
+        '''Issue a GET request. Identical requests already in flight
+        from other threads are not repeated: the callers each get a
+        copy of the first one's response.'''
+        if self.cache is not None and method == 'retrieve' and not params:
+            return self.cached_get(method, path)
+
         safe_url = self.builder.url(method, path=path)
-        return unpack_rest_response(self.session.get(safe_url, params=params))
+        key = (safe_url, repr(sorted(params.items())) if params else None)
+        return self.flights.do(key, self.fetch, safe_url, params)
+
+    def cache_key(self, method, path=None):
+        from .cache import make_key
+
+        objpath = self.builder.path
+        if path:
+            objpath += ''.join(quote_segment(p) + '/' for p in path)
+        return make_key(self.builder.base, self.version, objpath, method)
+
+    def cached_get(self, method, path=None):
+        key = self.cache_key(method, path)
+        content = self.cache.get(key)
+        if content is not None:
+            return APIResponse.fromcontent(content)
+
+        safe_url = self.builder.url(method, path=path)
+        response = self.flights.do((safe_url, None), self.fetch, safe_url)
+        if response.mimetype == 'application/json':
+            self.cache.set(key, response.content)
+        return response
+
+    def invalidate(self):
+        '''Drop every cached entry for this object and its children.'''
+        if self.cache is not None:
+            from .cache import make_prefix
+            self.cache.invalidate(make_prefix(self.builder.base, self.version,
+                                              self.builder.path))
 
     def post(self, method, path=None, data=None, params=None):
-        postdata = json.dumps(data) if data else None
+        postdata = codec.dumps(data) if data else None
         safe_url = self.builder.url(method, path=path)
         data = self.session.post(safe_url, data=postdata,
                                  params=params,
                                  headers={'Content-Type': 'application/json'})
-        return unpack_rest_response(data)
+        response = unpack_rest_response(data)
+        # Searching is the one POST which doesn't change anything
+        if method != 'list':
+            self.invalidate()
+        return response
 
 
-def api_wrapper(session, builder):
+def api_wrapper(session, builder, cache=None):
     version_url = builder.url('retrieve', path=['nsc', 'version'])
     version_data = unpack_rest_response(session.get(version_url)).data
     version = (int(version_data['major_version']),
                int(version_data['minor_version']),
                int(version_data['patch_version']))
 
-    return APIWrapper(None, version, session, builder)
+    return APIWrapper(None, version, session, builder, cache=cache)
+
+
+def apply_configuration(configuration, service, smartapply=True):
+    '''Apply the staged configuration of a device, through whichever
+    mechanism it supports. Works on anything exposing the methods of the
+    ``nsc/configuration`` and ``nsc/service`` objects.
+
+    :raises CommitIncomplete: if changes are still pending afterwards.
+    '''
+    from .library import CommitIncomplete, parse_messages
+
+    if smartapply:
+        logger.info('Applying configuration')
+        configuration.smartapply()
+        state = configuration.status()
+    else:
+        logger.info('Attempting to apply configuration...')
+        state = configuration.status()
+
+        # Attempt to just reload the NSC configuration
+        if state['modified'] and state['can_reload']:
+            logger.info('Trying reload...')
+            configuration.reload()
+            state = configuration.status()
+
+        # Changes may still now require us to restart the nsc service
+        # to apply
+        if state['modified']:
+            status = service.status()['status_text']
+            if status == 'RUNNING':
+                logger.info('Suspending NSC')
+                service.stop()
+            logger.info('Trying apply...')
+            configuration.apply()
+            if status == 'RUNNING':
+                service.start()
+            state = configuration.status()
+
+    if state['modified']:
+        raise CommitIncomplete(parse_messages(state))
 
 
 class API(object):
+    def __init__(self, api, index=None):
+        self.api = api
+        self.spec_index = index
+        self._resolved = {}
+
+    def resolve(self, path):
+        '''Return the generated object at path, for example
+        ``api.resolve('sip/profile')`` for ``api.sip.profile``.
+
+        :raises KeyError: if the specification has no such object.
+        '''
+        path = split_path(path)
+        try:
+            return self._resolved[path]
+        except KeyError:
+            pass
+
+        if self.spec_index is not None and path not in self.spec_index:
+            raise KeyError('/'.join(path))
+
+        obj = self
+        for segment in path:
+            try:
+                obj = getattr(obj, make_typename(segment))
+            except AttributeError:
+                raise KeyError('/'.join(path))
+        self._resolved[path] = obj
+        return obj
+
     def config(self):
         return self.api.get_config().content
 
     def changelog(self):
+        from .library import parse_messages
         return parse_messages(self.nsc.configuration.status())
 
     def commit(self):
-        if 'smartapply' in self.nsc.configuration.api.methods:
-            logger.info('Applying configuration')
-            self.nsc.configuration.smartapply()
-            state = self.nsc.configuration.status()
-        else:
-            logger.info('Attempting to apply configuration...')
-            state = self.nsc.configuration.status()
-
-            # Attempt to just reload the NSC configuration
-            if state['modified'] and state['can_reload']:
-                logger.info('Trying reload...')
-                self.nsc.configuration.reload()
-                state = self.nsc.configuration.status()
-
-            # Changes may still now require us to restart the nsc service
-            # to apply
-            if state['modified']:
-                status = self.nsc.service.status()['status_text']
-                if status == 'RUNNING':
-                    logger.info('Suspending NSC')
-                    self.nsc.service.stop()
-                logger.info('Trying apply...')
-                self.nsc.configuration.apply()
-                if status == 'RUNNING':
-                    self.nsc.service.start()
-                state = self.nsc.configuration.status()
-
-        if state['modified']:
-            raise CommitIncomplete(parse_messages(state))
+        configuration = self.nsc.configuration
+        apply_configuration(configuration, self.nsc.service,
+                            'smartapply' in configuration.api.methods)
 
     @property
     def session(self):
@@ -166,22 +280,83 @@ class API(object):
 
 
 class APICollection(object):
+    def __init__(self, api):
+        self.api = api
+
     def create(self, key, data):
+        data = as_payload(data)
         if 'display-name' in self.api.interface and 'display-name' not in data:
             data['display-name'] = key
 
         self.api.post('create', path=[key], data=data)
+        if self.api.indexes:
+            record = self.retrieve(key)
+            for index in self.api.indexes:
+                index.insert(key, record)
         return self[key]
 
     def delete(self, key):
         self.api.post('delete', path=[key])
+        for index in self.api.indexes:
+            index.discard(key)
 
     def update(self, key, data):
+        data = as_payload(data)
         self.api.post('update', path=[key], data=data)
+        for index in self.api.indexes:
+            index.merge(key, data)
 
     def retrieve(self, key):
         return self.api.get('retrieve', path=[key]).data
 
+    def record(self, key):
+        '''Retrieve an object as a compact :class:`safe.record.Record`.'''
+        return self.api.record_type.fromjson(self.retrieve(key))
+
+    def snapshot(self):
+        '''Retrieve every object in the collection, returning a
+        dictionary mapping each key to its data.'''
+        return dict((key, self.retrieve(key)) for key in self.keys())
+
+    def prefetch(self, window=8, keys=None):
+        '''Iterate over ``(key, data)`` for every object in the
+        collection, in order. Up to window objects are retrieved in the
+        background while the caller processes the current one. Stopping
+        early, or closing the iterator, cancels the retrieves not yet
+        started.
+
+        :param window: The number of objects to retrieve ahead.
+        :param keys: The keys to retrieve, every key by default.
+        '''
+        if keys is None:
+            keys = self.keys()
+
+        reader = ReadAhead(self.retrieve, keys, window)
+        try:
+            for key, data in reader:
+                yield key, data
+        finally:
+            reader.close()
+
+    def records(self):
+        '''Like :meth:`snapshot`, but with every object stored as a
+        compact :class:`safe.record.Record`.'''
+        fromjson = self.api.record_type.fromjson
+        return dict((key, fromjson(self.retrieve(key)))
+                    for key in self.keys())
+
+    def index(self, *fields):
+        '''Build in-memory hash indexes over the given fields from a
+        snapshot of the collection. The index is kept up to date by any
+        create, update or delete made through this api.
+
+        :param fields: The names of the fields to index.
+        :returns: A :class:`safe.index.CollectionIndex`.
+        '''
+        index = CollectionIndex(self, fields)
+        self.api.indexes.append(index)
+        return index
+
     def keys(self):
         return self.api.get('list').data
 
@@ -225,13 +400,20 @@ class APICollection(object):
 
 
 class APIObject(object):
-    def __init__(self, name=None):
+    def __init__(self, api, name=None):
+        self.api = api
         if name:
             self.ident = name
 
     def __contains__(self, key):
         return key in self.api.interface
 
+    def watch(self, method='retrieve', interval=5.0, *args, **kwargs):
+        '''Poll a GET method of this object, yielding its data whenever
+        it changes. See :func:`safe.watch.watch`.'''
+        from .watch import watch
+        return watch(self, method, interval, *args, **kwargs)
+
     def __repr__(self):
         try:
             return '{}({!r})'.format(self.__class__.__name__, self.retrieve())
@@ -239,6 +421,48 @@ class APIObject(object):
             return '{}()'.format(self.__class__.__name__)
 
 
+class APIElement(APIObject):
+    '''Base for the members of a collection. A single type is generated
+    per collection and shared by all its members, so the key and the
+    collection's wrapper are held as instance state and the member's own
+    wrapper is only created when first needed.'''
+
+    def __init__(self, parent, name):
+        self.parent = parent
+        self.ident = name
+        self._api = None
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api = self.parent.member(self.ident)
+        return self._api
+
+
+class ChildObject(object):
+    '''Descriptor exposing a child object of the specification. The
+    child's type is generated on first use and the instance, bound to
+    the wrapper of the object it was accessed through, is cached on that
+    object.'''
+
+    def __init__(self, node):
+        self.node = node
+        self.name = make_typename(node.tag)
+        self.cls = None
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        if self.cls is None:
+            base = APICollection if self.node.collection else APIObject
+            self.cls = build_type(self.node, base)
+
+        child = self.cls(instance.api.descend(self.node))
+        instance.__dict__[self.name] = child
+        return child
+
+
 def add_methods(ast, reserved=None):
     '''Compile all the methods specified in the json 'methods' section.
     Prefer specialized implementations of common and important rest
@@ -270,10 +494,20 @@ def add_methods(ast, reserved=None):
             return self.api.get('retrieve').data
         return retrieve
 
+    def make_record_method(nodeid):
+        def record(self):
+            return self.api.record_type.fromjson(self.retrieve())
+        record.__doc__ = 'Retrieve as a compact :class:`safe.record.Record`.'
+        return 'record', record
+
     @method_builder
     def make_update_method(nodeid):
         def update(self, data):
-            return self.api.post('update', data=data).data
+            data = as_payload(data)
+            result = self.api.post('update', data=data).data
+            for index in self.api.indexes:
+                index.merge(self.ident, data)
+            return result
         return update
 
     def make_getitem_method(nodeit):
@@ -312,6 +546,7 @@ def add_methods(ast, reserved=None):
         elif node.tag == 'retrieve':
             yield make_retrieve_method(node)
             yield make_getitem_method(node)
+            yield make_record_method(node)
         elif node.tag == 'update':
             yield make_update_method(node)
             yield make_setitem_method(node)
@@ -325,28 +560,98 @@ def add_methods(ast, reserved=None):
             yield make_post_method(node)
 
 
-def build_type(node, api, base):
-    typename = make_typename(node.get('name', None))
-    docstring = make_docstring(node.get('description'))
+_types = weakref.WeakValueDictionary()
 
-    namespace = {'__doc__': docstring, 'api': api}
-    namespace.update(add_children(node.objs, api))
-    namespace.update(add_methods(node.methods, base.__dict__))
-    return type(typename, (base,), namespace)
 
+def build_type(node, base):
+    '''Generate the type for an object node of the specification. Types
+    are shared by every node with the same digest, so an api built for
+    an upgraded device only generates types for the objects which
+    changed.'''
+    with phase('types'):
+        key = (node.digest, base)
+        cls = _types.get(key)
+        if cls is not None:
+            return cls
 
-def add_children(ast, api):
-    for node in ast:
-        new_builder = api.builder.join(node.tag)
-        new_api = APIWrapper(node, api.version, api.session, new_builder)
+        typename = make_typename(node.get('name', None))
+        docstring = make_docstring(node.get('description'))
 
-        typename = make_typename(node.tag)
-        base = APICollection if node.collection else APIObject
-        yield typename, build_type(node, new_api, base)()
+        namespace = {'__doc__': docstring}
+        namespace.update(add_children(node.objs))
+        namespace.update(add_methods(node.methods, base.__dict__))
+        cls = _types[key] = type(typename, (base,), namespace)
+        return cls
+
+
+def add_children(ast):
+    for node in ast:
+        child = ChildObject(node)
+        yield child.name, child
+
+
+def make_session(host, port=80, scheme='http', token=None, timeout=None,
+                 adapter=None, limiter=None, transport=None):
+    '''Create the transport used to talk to a device, by default a
+    :class:`safe.transport.RequestsTransport`. Adapters, and so
+    limiters, can only be mounted on transports built on requests. The
+    token is added to the requests sent through a transport given by
+    the caller without changing its headers, so it can be shared with
+    other devices.'''
+    from .transport import HeaderTransport, RequestsTransport
+
+    owned = transport is None
+    if owned:
+        transport = RequestsTransport(timeout=timeout)
+        if token:
+            transport.headers['X-API-KEY'] = token
+    if limiter is True:
+        limiter = limiter_for(host, port, scheme)
+    if limiter:
+        from .adapters import LimitedAdapter
+        adapter = LimitedAdapter(limiter, adapter)
+    if adapter:
+        if not hasattr(transport, 'mount'):
+            raise ValueError('Adapters need a transport built on requests')
+        transport.mount('{}://{}:{}'.format(scheme, host, port), adapter)
+    if token and not owned:
+        transport = HeaderTransport(transport, {'X-API-KEY': token})
+    return transport
+
+
+def fetch_spec(session, builder, specfile=None, cache=None, version=None):
+    '''Load the json specification, either from the device, the cache,
+    or from a local file.'''
+    with phase('spec'):
+        if not specfile:
+            if cache is not None:
+                from .cache import SPEC_TTL, make_key
+                key = make_key(builder.base, version, '', 'doc')
+                spec = cache.get(key)
+                if spec is not None:
+                    return spec
+
+            logger.info('Retrieving specification from NSC')
+            r = session.get(builder.url(None, section='doc'))
+            spec = unpack_rest_response(r).content
+            if cache is not None:
+                cache.set(key, spec, SPEC_TTL)
+            return spec
+
+        with open(specfile, 'rb') as fp:
+            return codec.load(fp)
+
+
+def build_api(wrapper, ast):
+    '''Compile a parsed specification into a new api object bound to
+    wrapper.'''
+    namespace = dict(add_children(ast))
+    product_cls = type('API', (API,), namespace)
+    return product_cls(wrapper, SpecIndex(ast))
 
 
 def api(host, port=80, scheme='http', token=None, specfile=None, timeout=None,
-        adapter=None):
+        adapter=None, limiter=None, cache=None, transport=None):
     '''Connects to a remote device, download the json specification
     describing the supported rest calls and dynamically compile a new
     object to wrap the rest.
@@ -357,26 +662,20 @@ def api(host, port=80, scheme='http', token=None, specfile=None, timeout=None,
     :type port: int
     :param scheme: Specify the scheme of the request url.
     :type scheme: str
+    :param limiter: Adaptively limit the number of concurrent requests
+        to the device. Pass True to share a limiter with every api
+        talking to the same device in this process, or pass an
+        :class:`safe.concurrency.AdaptiveLimiter`.
+    :param cache: An optional cache for the specification and retrieved
+        objects, see :mod:`safe.cache`.
+    :param transport: The transport to send requests through, see
+        :mod:`safe.transport`.
     :returns: the dynamically generated code.
     '''
     builder = url_builder(host, port, scheme)
-    session = requests.session()
-    if timeout:
-        session.timeout = timeout
-    if token:
-        session.headers['X-API-KEY'] = token
-    if adapter:
-        session.mount('{}://{}:{}'.format(scheme, host, port), adapter)
+    session = make_session(host, port, scheme, token, timeout, adapter,
+                           limiter, transport)
 
-    api = api_wrapper(session, builder)
-    if not specfile:
-        logger.info('Retrieving specification from NSC')
-        r = session.get(builder.url(None, section='doc'))
-        spec = unpack_rest_response(r).content
-    else:
-        with open(specfile) as fp:
-            spec = json.load(fp)
-
-    namespace = dict(add_children(parse(spec), api), api=api)
-    product_cls = type('API', (API,), namespace)
-    return product_cls()
+    wrapper = api_wrapper(session, builder, cache)
+    spec = fetch_spec(session, builder, specfile, cache, wrapper.version)
+    return build_api(wrapper, share(parse(spec)))
@@ -0,0 +1,175 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Read caches for specifications and retrieved objects.
+
+Passing a cache to :func:`safe.api` stores the downloaded specification
+and the result of every ``retrieve`` under a key made of the device,
+its firmware version and the object path. Any write made through the
+library invalidates the entries below the object written to.
+
+:class:`SQLiteCache` keeps its entries in a database file, so every
+process on the host sharing the file shares the cache::
+
+    >>> cache = safe.cache.SQLiteCache('/var/cache/safepy2.db', ttl=300)
+    >>> api = safe.api('10.10.9.100', token=token, cache=cache)
+'''
+
+import time
+import sqlite3
+import threading
+from . import codec
+
+
+#: Time to live of cached specifications. They're keyed by firmware
+#: version, so they only go stale if the firmware is rebuilt in place.
+SPEC_TTL = 7 * 24 * 60 * 60
+
+
+def make_key(base, version, path, method):
+    '''Build a cache key. The object path is expected to be quoted and
+    end in a slash, so that invalidating an object also invalidates its
+    children but not its siblings.'''
+    version = '.'.join(str(part) for part in version or ())
+    return u'{}|{}|{}|{}'.format(base, version, path, method)
+
+
+def make_prefix(base, version, path):
+    '''Build the prefix of every key below an object path.'''
+    return make_key(base, version, path, '')[:-1]
+
+
+class MemoryCache(object):
+    '''A cache local to the current process.
+
+    :param ttl: Default time to live of entries, in seconds.
+    '''
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+
+        # Values are stored encoded so callers can't modify the cached
+        # copy through the objects they get back
+        return codec.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (ttl if ttl is not None else self.ttl)
+        value = codec.dumps(value)
+        with self.lock:
+            self.entries[key] = (value, expires)
+
+    def invalidate(self, prefix):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def close(self):
+        self.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SQLiteCache(object):
+    '''A cache backed by an SQLite database, shared between every
+    process using the same file. Values are stored json encoded.
+
+    :param path: The database file.
+    :param ttl: Default time to live of entries, in seconds.
+    '''
+
+    def __init__(self, path, ttl=60, timeout=5.0):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+        with self.connection as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                       'key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+
+    @property
+    def connection(self):
+        # sqlite connections can't be shared between threads
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            # Only ever used by this thread, but closed by whichever
+            # thread closes the cache
+            db = sqlite3.connect(self.path, timeout=self.timeout,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+            with self.lock:
+                self.connections.append(db)
+        return db
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT value, expires FROM entries WHERE key = ?',
+            (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return codec.loads(bytes(row[0]))
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (ttl if ttl is not None else self.ttl)
+        with self.connection as db:
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                       (key, sqlite3.Binary(codec.dumps(value)), expires))
+
+    def invalidate(self, prefix):
+        # A range scan, rather than LIKE, so the primary key index is used
+        with self.connection as db:
+            db.execute('DELETE FROM entries WHERE key >= ? AND key < ?',
+                       (prefix, prefix + u'\uffff'))
+
+    def purge(self):
+        '''Delete every expired entry.'''
+        with self.connection as db:
+            db.execute('DELETE FROM entries WHERE expires < ?',
+                       (time.time(),))
+
+    def clear(self):
+        with self.connection as db:
+            db.execute('DELETE FROM entries')
+
+    def close(self):
+        '''Close the connection of every thread which used the cache.
+        Using it again opens new ones.'''
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.local = threading.local()
+        for db in connections:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,343 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Run a stream of SAFe operations against one or many devices.
+
+Operations are read one json document per line, from a file or stdin::
+
+    {"op": "create", "path": "sip/profile", "key": "example", "data": {"sip-ip": "ip_3", "sip-port": 5080}}
+    {"op": "update", "path": "sip/profile", "key": "example", "data": {"sip-port": 5090}}
+    {"op": "call", "path": "sip/profile", "method": "stop", "args": ["example"]}
+    {"op": "delete", "path": "sip/profile", "key": "example"}
+
+Every operation runs against every host given on the command line,
+unless it names its own ``host``. Operations on the same object of the
+same host run in input order; an object is named by its path and key,
+or for calls by the first of their ``args``. Operations on different
+objects run concurrently and in no particular order, so the input must
+not rely on one object being changed before another, such as creating
+a network ip before the profile referencing it. Run such inputs as
+separate jobs, or with a single worker, ``-j 1``, to keep every
+operation in input order. Input is consumed as it's executed, so
+memory use stays constant no matter how large the input is.
+
+Failures are written to stdout as json documents, progress to stderr.
+Once everything ran, configuration is committed on every host which
+saw no failures.
+
+With ``--journal``, every operation is journaled per host as it runs.
+Running the same input again with the same journal resumes the job:
+operations already done are skipped, and those interrupted in flight,
+left without an answer by a timeout or connection error, or failed
+are checked on the device before being sent again. See
+:mod:`safe.journal`.
+'''
+
+import sys
+import time
+import logging
+import argparse
+import threading
+import six
+from six.moves import queue
+from . import codec
+from .journal import DONE, FAILED, PLANNED, Journal, applied, operation_id
+from .raw import RawClient
+
+
+logger = logging.getLogger('safepy2')
+
+
+def read_operations(fp):
+    '''Yield (line number, operation) for every operation in fp.
+    Undecodable lines are yielded as the exception raised decoding
+    them.'''
+    for lineno, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            continue
+        try:
+            yield lineno, codec.loads(line)
+        except ValueError as e:
+            yield lineno, e
+
+
+def target(host, operation):
+    '''Identify the object an operation changes on a host.'''
+    key = operation.get('key')
+    if key is None and operation.get('op') == 'call':
+        key = next(iter(operation.get('args') or ()), None)
+    return repr((host, operation.get('path'), key))
+
+
+def in_doubt(client, error):
+    '''Whether an operation failing with error may still have been
+    applied, because the device never answered.'''
+    import requests
+
+    # The device answered, however the transport classifies it
+    if isinstance(error, requests.HTTPError):
+        return False
+
+    errors = (requests.ConnectionError, requests.Timeout)
+    session = getattr(client, 'session', None)
+    errors += tuple(getattr(session, 'connection_errors', ()))
+    return isinstance(error, errors)
+
+
+def execute(client, operation):
+    '''Run a single operation with a :class:`safe.raw.RawClient`.'''
+    kind = operation.get('op')
+    path = operation['path']
+    data = operation.get('data')
+
+    if kind == 'create':
+        return client.create(path, operation['key'], data or {})
+    elif kind == 'update':
+        return client.update(path, data or {}, operation.get('key'))
+    elif kind == 'delete':
+        return client.delete(path, operation['key'])
+    elif kind == 'call':
+        args = operation.get('args') or ()
+        params = operation.get('params') or {}
+        return client.call(path, operation['method'], *args, data=data,
+                           **params)
+    raise ValueError('Unknown operation: {!r}'.format(kind))
+
+
+class Runner(object):
+    '''Execute operations on a fixed pool of worker threads, each fed
+    by its own bounded queue.
+
+    :param clients: Map of host name to :class:`safe.raw.RawClient`.
+    :param workers: The number of worker threads.
+    :param progress: Seconds between progress reports.
+    '''
+
+    def __init__(self, clients, workers=8, progress=5.0, output=None,
+                 status=None, journal=None):
+        self.clients = clients
+        self.workers = workers
+        self.progress = progress
+        self.output = output or sys.stdout
+        self.status = status or sys.stderr
+        self.journal = journal
+
+        self.queues = [queue.Queue(maxsize=4) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.done = 0
+        self.skipped = 0
+        self.failures = dict((host, 0) for host in clients)
+        self.rejected = 0
+        self.start = None
+
+    @property
+    def failed(self):
+        return sum(self.failures.values()) + self.rejected
+
+    def report(self, final=False):
+        elapsed = max(time.time() - self.start, 1e-6)
+        skipped = ', {} skipped'.format(self.skipped) if self.skipped else ''
+        self.status.write('{}{} done, {} failed{}, {:.1f} ops/s\n'.format(
+            'total: ' if final else '', self.done, self.failed, skipped,
+            self.done / elapsed))
+        self.status.flush()
+
+    def fail(self, lineno, host, operation, error):
+        record = {'line': lineno, 'host': host, 'error': str(error)}
+        if isinstance(operation, dict):
+            for field in ('op', 'path', 'key', 'method'):
+                if field in operation:
+                    record[field] = operation[field]
+
+        with self.lock:
+            self.done += 1
+            if host is None:
+                for host in self.failures:
+                    self.failures[host] += 1
+            elif isinstance(host, six.string_types) and host in self.failures:
+                self.failures[host] += 1
+            else:
+                # Named a host it can't run on, which doesn't stop the
+                # other hosts from committing
+                self.rejected += 1
+            self.output.write(codec.dumps(record).decode('utf-8') + '\n')
+            self.output.flush()
+
+    def work(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+
+            lineno, host, operation, ident, state = task
+            try:
+                self.apply(host, operation, ident, state)
+            except Exception as e:
+                # Without an answer from the device the operation may
+                # well have gone through, leave it planned so it's
+                # checked before being sent again
+                if self.journal is not None and \
+                        not in_doubt(self.clients[host], e):
+                    self.journal.failed(host, ident, e)
+                self.fail(lineno, host, operation, e)
+            else:
+                with self.lock:
+                    self.done += 1
+
+    def apply(self, host, operation, ident, state):
+        client = self.clients[host]
+        if self.journal is None:
+            execute(client, operation)
+            return
+
+        # An operation left planned was interrupted in flight, and one
+        # which failed may have failed because an earlier attempt went
+        # through, check before sending it again
+        if state not in (PLANNED, FAILED) or not applied(client, operation):
+            self.journal.plan(host, ident, operation)
+            execute(client, operation)
+        self.journal.done(host, ident)
+
+    def reporter(self, finished):
+        while not finished.wait(self.progress):
+            self.report()
+
+    def submit(self, lineno, operation):
+        if not isinstance(operation, dict):
+            self.fail(lineno, None, operation, operation)
+            return
+
+        hosts = [operation['host']] if 'host' in operation else self.clients
+        for host in hosts:
+            if not isinstance(host, six.string_types) or \
+                    host not in self.clients:
+                self.fail(lineno, host, operation, 'Unknown host')
+                continue
+
+            ident = state = None
+            if self.journal is not None:
+                ident = operation_id(lineno, operation)
+                state = self.journal.state(host, ident)
+                if state == DONE:
+                    with self.lock:
+                        self.skipped += 1
+                    continue
+
+            # Route every operation on the same object to the same
+            # worker so they're applied in order
+            tasks = self.queues[hash(target(host, operation)) % self.workers]
+            tasks.put((lineno, host, operation, ident, state))
+
+    def run(self, operations):
+        self.start = time.time()
+        threads = [threading.Thread(target=self.work, args=(tasks,))
+                   for tasks in self.queues]
+
+        finished = threading.Event()
+        reporter = threading.Thread(target=self.reporter, args=(finished,))
+        reporter.daemon = True
+
+        for thread in threads:
+            thread.start()
+        reporter.start()
+
+        try:
+            for lineno, operation in operations:
+                self.submit(lineno, operation)
+        finally:
+            for tasks in self.queues:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+            finished.set()
+
+        self.report(final=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='safe', description='Run a stream of SAFe operations, one '
+        'json document per line, against one or many devices.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='File to read operations from, stdin by default')
+    parser.add_argument('-H', '--host', action='append', required=True,
+                        dest='hosts', help='Device to run against, '
+                        'may be given multiple times')
+    parser.add_argument('-p', '--port', type=int, default=80)
+    parser.add_argument('-s', '--scheme', default='http')
+    parser.add_argument('-t', '--token', help='The REST api token')
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--spec', help='Local specification to validate '
+                        'operations against, otherwise downloaded from '
+                        'each device once a call needs it')
+    parser.add_argument('-j', '--workers', type=int, default=8,
+                        help='Number of concurrent operations, 1 to run '
+                        'every operation in input order')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Adaptively limit concurrency per device')
+    parser.add_argument('--progress', type=float, default=5.0,
+                        help='Seconds between progress reports')
+    parser.add_argument('--journal', help='Journal operations to this '
+                        'file, resuming the job it records if it exists')
+    parser.add_argument('--no-commit', action='store_true',
+                        help="Don't commit the configuration at the end")
+    parser.add_argument('--force-commit', action='store_true',
+                        help='Commit even on hosts which saw failures')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def make_client(host, args):
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=args.workers)
+    return RawClient(host, args.port, args.scheme, args.token,
+                     spec=args.spec, timeout=args.timeout, adapter=adapter,
+                     limiter=args.adaptive or None)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    clients = dict((host, make_client(host, args)) for host in args.hosts)
+    journal = Journal(args.journal) if args.journal else None
+    runner = Runner(clients, workers=args.workers, progress=args.progress,
+                    journal=journal)
+
+    try:
+        if args.input == '-':
+            stream = getattr(sys.stdin, 'buffer', sys.stdin)
+            runner.run(read_operations(stream))
+        else:
+            with open(args.input, 'rb') as fp:
+                runner.run(read_operations(fp))
+    finally:
+        if journal is not None:
+            journal.close()
+
+    status = 0 if not runner.failed else 1
+    if args.no_commit:
+        return status
+
+    for host, client in sorted(clients.items()):
+        if runner.failures[host] and not args.force_commit:
+            logger.warning('Not committing %s, %d operations failed', host,
+                           runner.failures[host])
+            continue
+
+        try:
+            client.commit()
+        except Exception as e:
+            logger.error('Commit failed on %s: %s', host, e)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''JSON encoding and decoding for SAFe payloads.
+
+The fastest available backend is picked on first use, preferring
+:mod:`orjson`, then :mod:`ujson` and finally falling back to the
+standard library. The choice can be forced with the ``SAFEPY_JSON``
+environment variable or :func:`set_backend`.
+
+Documents are decoded straight from the raw response bytes, avoiding an
+intermediate text copy. Every backend encodes dictionaries with keys
+other than strings, such as numbers, the way the standard library does,
+by converting the keys to strings. Pretty documents, meant for files,
+are always encoded by the standard library, so they're byte for byte
+the same whichever backend is selected.
+'''
+
+import os
+import six
+
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _pretty(obj):
+    import json
+    return json.dumps(obj, sort_keys=True, indent=4,
+                      separators=(',', ': ')).encode('utf-8')
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj, pretty=False):
+        if pretty:
+            return _pretty(obj)
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return orjson.loads, dumps
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj, pretty=False):
+        if pretty:
+            return _pretty(obj)
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    return ujson.loads, dumps
+
+
+def _json():
+    import json
+
+    def loads(data):
+        # Python 3 before 3.6 can only decode text
+        if not six.PY2 and isinstance(data, six.binary_type):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def dumps(obj, pretty=False):
+        if pretty:
+            return _pretty(obj)
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    return loads, dumps
+
+
+_loaders = {'orjson': _orjson, 'ujson': _ujson, 'json': _json}
+
+
+# Selecting a backend means trying to import it, so it's deferred until
+# the codec is first used. The first call rebinds loads and dumps to the
+# selected backend's functions.
+def loads(data):
+    '''Decode a document from bytes or text.'''
+    if backend is None:
+        set_backend(os.environ.get('SAFEPY_JSON') or None)
+    return loads(data)
+
+
+def dumps(obj, pretty=False):
+    '''Encode obj to bytes. With pretty, keys are sorted and the
+    document indented by four spaces, for files meant to be read by
+    people, the same way by every backend.'''
+    if backend is None:
+        set_backend(os.environ.get('SAFEPY_JSON') or None)
+    return dumps(obj, pretty)
+
+
+backend = None
+
+
+def set_backend(name=None):
+    '''Select the json backend to use. With no name, select the first
+    importable backend in :data:`BACKENDS`.
+
+    :param name: One of ``'orjson'``, ``'ujson'`` or ``'json'``.
+    :raises ImportError: if the requested backend is not installed.
+    '''
+    global backend, loads, dumps
+
+    if name is not None:
+        candidates = (name,)
+    else:
+        candidates = BACKENDS
+
+    for candidate in candidates:
+        try:
+            loader = _loaders[candidate]
+        except KeyError:
+            raise ValueError('Unknown json backend: {!r}'.format(candidate))
+
+        try:
+            loads, dumps = loader()
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+
+        backend = candidate
+        return backend
+
+
+def load(fp):
+    '''Decode a document from a file opened in either text or binary
+    mode.'''
+    return loads(fp.read())
+
+
+def decode(response):
+    '''Decode the body of a :class:`requests.Response`.'''
+    return loads(response.content)
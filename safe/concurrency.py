@@ -0,0 +1,381 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Primitives for sharing an api between threads.'''
+
+import sys
+import threading
+import collections
+import six
+
+
+class Call(object):
+    '''A call in flight, and eventually its outcome.'''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            six.reraise(*self.error)
+        return self.result
+
+
+class SingleFlight(object):
+    '''Deduplicate identical concurrent calls. The first caller for a
+    key runs the function while every other caller arriving before it
+    finishes waits and shares its result, or its exception.
+
+    :param copy: Optional function, such as :func:`copy.deepcopy`,
+        giving every caller of a shared call its own copy of the
+        result, so none of them sees another change it. By default
+        they all get the very same object.
+    '''
+
+    def __init__(self, copy=None):
+        self.copy = copy
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                leader = False
+                call.followers += 1
+            else:
+                leader = True
+                call = self.calls[key] = Call()
+
+        if not leader:
+            result = call.wait()
+            return self.copy(result) if self.copy is not None else result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException:
+            # Even KeyboardInterrupt and SystemExit, or the followers
+            # would take the missing result for a successful None
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+        # Nobody can join once the call is gone, and the original is
+        # only left untouched for the followers to copy if the leader
+        # takes a copy as well
+        if self.copy is not None and call.followers:
+            return self.copy(call.result)
+        return call.result
+
+
+class AdaptiveLimiter(object):
+    '''Limit the number of concurrent requests to a device, discovering
+    the highest sustainable parallelism with additive-increase,
+    multiplicative-decrease.
+
+    Each successful request grows the limit by roughly one per window
+    of requests. A failed request, or one whose latency climbs past
+    tolerance times the baseline latency, multiplies it by backoff.
+    Only one decrease is applied per window, so a burst of failures
+    from requests sent together counts as a single congestion event.
+
+    A baseline is kept per endpoint, since some calls, such as
+    downloading a backup or applying the configuration, are always far
+    slower than others and are no sign of congestion.
+
+    :param initial: The initial concurrency limit.
+    :param minimum: The lowest the limit can go.
+    :param maximum: The highest the limit can go.
+    :param backoff: Factor applied to the limit on congestion.
+    :param tolerance: Latency, relative to the baseline, considered
+        congestion.
+    '''
+
+    def __init__(self, initial=4, minimum=1, maximum=64, backoff=0.5,
+                 tolerance=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.baselines = {}
+        self.inflight = 0
+        self.epoch = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        '''Wait for a free slot. Returns a token to pass to
+        :meth:`release`.'''
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+            return self.epoch
+
+    def release(self, token, latency=None, failed=False, endpoint=None):
+        '''Return a slot, feeding back how the request went.
+
+        :param token: The token returned by :meth:`acquire`.
+        :param latency: How long the request took, in seconds.
+        :param failed: Whether the request failed.
+        :param endpoint: What was requested, its latency only being
+            compared to that of the same endpoint.
+        '''
+        with self.cond:
+            self.inflight -= 1
+
+            congested = failed
+            if latency is not None:
+                baseline = self.baselines.get(endpoint)
+                if baseline is None or latency < baseline:
+                    baseline = latency
+                else:
+                    # Let the baseline drift up slowly so it can recover
+                    # should the device get permanently slower
+                    baseline += (latency - baseline) * 0.01
+                self.baselines[endpoint] = baseline
+                if latency > baseline * self.tolerance:
+                    congested = True
+
+            if congested:
+                if token >= self.epoch:
+                    self.epoch += 1
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+            elif self.inflight + 1 >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self.cond.notify_all()
+
+    def __repr__(self):
+        return '{}(limit={:.1f}, inflight={})'.format(self.__class__.__name__,
+                                                    self.limit, self.inflight)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host, port=80, scheme='http'):
+    '''Return the :class:`AdaptiveLimiter` shared by every api talking
+    to the same device in this process.'''
+    key = (host, port, scheme)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveLimiter()
+        return limiter
+
+
+class GraphRunner(object):
+    '''Run a function over the nodes of a dependency graph on a pool of
+    threads. A node is only started once every one of its prerequisites
+    completed successfully, so independent branches run in parallel.
+    Nodes downstream of a failure are skipped.
+
+    :param prerequisites: Map of every node to the nodes which must
+        complete before it. Prerequisites outside the map are ignored.
+    :param workers: The number of threads to use.
+    :raises ValueError: if the graph has a cycle.
+    '''
+
+    def __init__(self, prerequisites, workers=8):
+        self.workers = workers
+        self.waiting = dict((node, set(deps) & set(prerequisites))
+                            for node, deps in six.iteritems(prerequisites))
+        self.successors = dict((node, set()) for node in self.waiting)
+        for node, deps in six.iteritems(self.waiting):
+            for dep in deps:
+                self.successors[dep].add(node)
+
+        self.check()
+        self.cond = threading.Condition()
+        self.ready = [node for node, deps in six.iteritems(self.waiting)
+                      if not deps]
+        self.remaining = len(self.waiting)
+        self.failures = {}
+        self.skipped = set()
+
+    def check(self):
+        counts = dict((node, len(deps))
+                      for node, deps in six.iteritems(self.waiting))
+        ready = [node for node, count in six.iteritems(counts) if not count]
+        while ready:
+            node = ready.pop()
+            for successor in self.successors[node]:
+                counts[successor] -= 1
+                if not counts[successor]:
+                    ready.append(successor)
+
+        cycle = sorted(node for node, count in six.iteritems(counts) if count)
+        if cycle:
+            raise ValueError('Dependency cycle between: {}'.format(
+                ', '.join(str(node) for node in cycle)))
+
+    def skip(self, node):
+        # Called with the condition held
+        stack = list(self.successors[node])
+        while stack:
+            successor = stack.pop()
+            if successor not in self.skipped:
+                self.skipped.add(successor)
+                self.remaining -= 1
+                stack.extend(self.successors[successor])
+
+    def finish(self, node, error):
+        with self.cond:
+            self.remaining -= 1
+            if error is not None:
+                self.failures[node] = error
+                self.skip(node)
+            else:
+                for successor in self.successors[node]:
+                    deps = self.waiting[successor]
+                    deps.discard(node)
+                    if not deps and successor not in self.skipped:
+                        self.ready.append(successor)
+            self.cond.notify_all()
+
+    def work(self, func):
+        while True:
+            with self.cond:
+                while not self.ready and self.remaining > 0:
+                    self.cond.wait()
+                if not self.ready:
+                    return
+                node = self.ready.pop()
+
+            try:
+                func(node)
+            except Exception as e:
+                self.finish(node, e)
+            else:
+                self.finish(node, None)
+
+    def run(self, func):
+        '''Call func on every node. Returns a dictionary of the nodes
+        which failed to the exception raised, and the set of nodes
+        skipped because a prerequisite failed.'''
+        threads = [threading.Thread(target=self.work, args=(func,))
+                   for _ in range(max(1, min(self.workers, self.remaining)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.failures, self.skipped
+
+
+class ReadAhead(object):
+    '''Iterate over ``(item, func(item))`` for every item, in order,
+    while up to window calls run ahead on background threads. At most
+    window results are held waiting for the consumer, however far
+    behind it falls.
+
+    Closing the iterator stops any further calls from starting. Calls
+    already in flight complete in the background and their results are
+    dropped.
+
+    :param func: The function to call on each item.
+    :param items: An iterable of items, consumed lazily.
+    :param window: The number of calls to run ahead of the consumer.
+    '''
+
+    def __init__(self, func, items, window=8):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+
+        self.func = func
+        self.items = iter(items)
+        self.window = window
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.slots = threading.Semaphore(window)
+        self.pending = collections.deque()
+        self.exhausted = False
+
+        for _ in range(window):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+
+    def next_item(self):
+        # Called with the lock held
+        call = Call()
+        try:
+            item = next(self.items)
+        except StopIteration:
+            self.stop()
+            return None, None
+        except Exception:
+            # Hand the error to the consumer in place of the item
+            item, call.error = None, sys.exc_info()
+            call.event.set()
+            self.stop()
+
+        self.pending.append((item, call))
+        self.ready.notify()
+        return item, call
+
+    def work(self):
+        while True:
+            self.slots.acquire()
+            with self.lock:
+                if self.exhausted:
+                    return
+                item, call = self.next_item()
+            if call is None or call.event.is_set():
+                return
+
+            try:
+                call.result = self.func(item)
+            except Exception:
+                call.error = sys.exc_info()
+            finally:
+                call.event.set()
+
+    def stop(self):
+        # Called with the lock held. Wake every worker waiting for a
+        # slot so it can exit
+        if not self.exhausted:
+            self.exhausted = True
+            for _ in range(self.window):
+                self.slots.release()
+            self.ready.notify_all()
+
+    def close(self):
+        '''Stop reading ahead and drop any results not yet consumed.'''
+        with self.lock:
+            self.stop()
+            self.pending.clear()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.lock:
+            while not self.pending and not self.exhausted:
+                self.ready.wait()
+            if not self.pending:
+                raise StopIteration
+            item, call = self.pending.popleft()
+
+        self.slots.release()
+        return item, call.wait()
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
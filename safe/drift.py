@@ -0,0 +1,298 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Detect configuration drift across a fleet of devices.
+
+A configuration is reduced to a tree of digests: every value is hashed,
+and every object, collection and finally the whole device is given the
+digest of its children. Two configurations are compared by descending
+only into the subtrees whose digests differ, and the digests alone are
+enough to do so, so a golden configuration only needs to be digested
+once::
+
+    >>> golden = safe.drift.digest(safe.drift.configuration(golden_api))
+    >>> golden.save('golden.json')
+    >>> report = safe.drift.fleet(safe.drift.DigestTree.load('golden.json'),
+    ...                           {'gw1': gw1, 'gw2': gw2},
+    ...                           store='fleet.json')
+    >>> report['gw2'].changed
+    [(u'sip', u'profile', u'internal', u'sip-port')]
+
+Devices expose their whole configuration in one call, which is used
+when it's available. Otherwise every configurable object is retrieved,
+reading ahead in parallel.
+'''
+
+import os
+import json
+import hashlib
+import six
+from . import codec
+from .concurrency import ReadAhead
+from .parser import split_path
+
+
+class DigestTree(object):
+    '''The digest of a value and, for dictionaries, of each of its
+    items.'''
+
+    __slots__ = ('digest', 'children')
+
+    def __init__(self, digest, children=None):
+        self.digest = digest
+        self.children = children
+
+    def get(self, path):
+        '''Return the subtree at path, or None.'''
+        tree = self
+        for segment in split_path(path):
+            if not tree.children or segment not in tree.children:
+                return None
+            tree = tree.children[segment]
+        return tree
+
+    def todict(self):
+        if self.children is None:
+            return [self.digest]
+        return [self.digest, dict((key, child.todict()) for key, child
+                                  in six.iteritems(self.children))]
+
+    @classmethod
+    def fromdict(cls, data):
+        if len(data) == 1:
+            return cls(data[0])
+        return cls(data[0], dict((key, cls.fromdict(child)) for key, child
+                                 in six.iteritems(data[1])))
+
+    def save(self, path):
+        with open(path, 'wb') as fp:
+            fp.write(codec.dumps(self.todict()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fp:
+            return cls.fromdict(codec.load(fp))
+
+    def __eq__(self, other):
+        if not isinstance(other, DigestTree):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.digest)
+
+
+def digest(data):
+    '''Build the :class:`DigestTree` of a decoded json document.'''
+    if isinstance(data, dict):
+        children = dict((key, digest(value))
+                        for key, value in six.iteritems(data))
+        h = hashlib.sha1(b'd')
+        for key in sorted(children):
+            h.update(key.encode('utf-8') + b'\0')
+            h.update(children[key].digest.encode('ascii'))
+        return DigestTree(h.hexdigest(), children)
+
+    # Canonical encoding, so equal values always hash the same
+    value = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return DigestTree(hashlib.sha1(b'v' + value.encode('utf-8')).hexdigest())
+
+
+class Drift(object):
+    '''The differences between a device's configuration and the
+    expected one. Each of :attr:`added`, :attr:`removed` and
+    :attr:`changed` is a sorted list of paths, given as tuples.
+
+    :ivar modified: Whether the device's configuration changed since
+        the previous run, or None if it wasn't seen before.
+    '''
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        self.modified = None
+
+    def asdict(self):
+        '''Return the report as plain, json serializable, data.'''
+        return {'added': [list(path) for path in self.added],
+                'removed': [list(path) for path in self.removed],
+                'changed': [list(path) for path in self.changed],
+                'modified': self.modified}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '{}(added={!r}, removed={!r}, changed={!r})'.format(
+            self.__class__.__name__, self.added, self.removed, self.changed)
+
+
+def compare(expected, actual):
+    '''Compare two digest trees, returning a :class:`Drift`.'''
+    drift = Drift()
+
+    def visit(a, b, path):
+        if a.digest == b.digest:
+            return
+        if a.children is None or b.children is None:
+            drift.changed.append(path)
+            return
+
+        for key in set(a.children) | set(b.children):
+            left, right = a.children.get(key), b.children.get(key)
+            if left is None:
+                drift.added.append(path + (key,))
+            elif right is None:
+                drift.removed.append(path + (key,))
+            else:
+                visit(left, right, path + (key,))
+
+    visit(expected, actual, ())
+    drift.added.sort()
+    drift.removed.sort()
+    drift.changed.sort()
+    return drift
+
+
+def config_paths(index):
+    '''Return the paths of every object in a
+    :class:`safe.parser.SpecIndex` marked configurable, which can be
+    retrieved without knowing the key of a parent.'''
+    paths = []
+    for path, node in six.iteritems(index.objects):
+        methods = index.methods[path]
+        if not node.get('configurable') or 'retrieve' not in methods:
+            continue
+        if node.collection and 'list' not in methods:
+            continue
+        if any(index.objects[path[:i]].collection
+               for i in range(1, len(path))):
+            continue
+        paths.append(path)
+    return sorted(paths)
+
+
+def configuration(api, paths=None, window=8):
+    '''Read the configuration of a device as nested dictionaries.
+
+    :param api: The generated api of the device.
+    :param paths: The objects to read. By default the device's whole
+        configuration is downloaded, falling back to retrieving every
+        object returned by :func:`config_paths` if the device can't
+        provide it.
+    :param window: The number of objects retrieved in parallel.
+    '''
+    from requests import HTTPError
+
+    if paths is None:
+        try:
+            config = api.config()
+        except HTTPError:
+            config = None
+        if isinstance(config, dict):
+            return config
+        paths = config_paths(api.spec_index)
+
+    tree = {}
+    for path in sorted(split_path(path) for path in paths):
+        obj = api.resolve(path)
+        if hasattr(obj, 'prefetch'):
+            data = dict(obj.prefetch(window))
+        else:
+            data = obj.retrieve()
+
+        parent = tree
+        for segment in path[:-1]:
+            parent = parent.setdefault(segment, {})
+
+        # Children are read after their parent, whose data they join
+        existing = parent.get(path[-1])
+        if isinstance(existing, dict) and isinstance(data, dict):
+            existing.update(data)
+        else:
+            parent[path[-1]] = data
+    return tree
+
+
+class DigestStore(object):
+    '''Digest trees of many devices, kept in a json file between runs.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.trees = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as fp:
+                self.trees = codec.load(fp)
+
+    def get(self, name):
+        data = self.trees.get(name)
+        if data is not None:
+            return DigestTree.fromdict(data)
+
+    def set(self, name, tree):
+        self.trees[name] = tree.todict()
+
+    def save(self):
+        # Write a copy then move it over, so an interrupted run never
+        # leaves a truncated file behind
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as fp:
+            fp.write(codec.dumps(self.trees))
+        os.rename(temporary, self.path)
+
+
+def fleet(golden, apis, paths=None, workers=8, store=None):
+    '''Compare the configuration of many devices to a golden one.
+
+    :param golden: The :class:`DigestTree` of the expected
+        configuration, restricted to the same paths.
+    :param apis: Map of device name to generated api.
+    :param paths: The objects to compare, see :func:`configuration`.
+    :param workers: The number of devices read in parallel.
+    :param store: Optional file keeping every device's digests between
+        runs, used to tell whether devices changed since.
+    :returns: A map of device name to its :class:`Drift`, or to the
+        exception raised reading it.
+    '''
+    if store is not None:
+        store = DigestStore(store)
+
+    def read(name):
+        try:
+            return digest(configuration(apis[name], paths))
+        except Exception as e:
+            return e
+
+    report = {}
+    with ReadAhead(read, sorted(apis), workers) as reader:
+        for name, tree in reader:
+            if isinstance(tree, Exception):
+                report[name] = tree
+                continue
+
+            drift = report[name] = compare(golden, tree)
+            if store is not None:
+                previous = store.get(name)
+                if previous is not None:
+                    drift.modified = previous.digest != tree.digest
+                store.set(name, tree)
+
+    if store is not None:
+        store.save()
+    return report
@@ -0,0 +1,145 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''In-memory secondary indexes over collection snapshots.
+
+Answering questions like "which ip object holds this address" through
+REST costs a filtered list call, and often a retrieve per result. An
+index instead takes one snapshot of a collection and builds hash tables
+over the requested fields so equality lookups can be answered locally::
+
+    >>> index = api.network.ip.index('address')
+    >>> index.lookup('address', '198.51.100.5')
+    [u'ip_3']
+'''
+
+import threading
+import six
+
+
+def hashable(value):
+    '''Normalize a field value into something usable as a dictionary
+    key. SAFe reports most scalars back as strings, so numbers are
+    compared by their text representation.'''
+
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, six.integer_types + (float,)):
+        return six.text_type(value)
+    if isinstance(value, list):
+        return tuple(hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, hashable(v)) for k, v in six.iteritems(value)))
+    return value
+
+
+class CollectionIndex(object):
+    '''Hash indexes over a set of fields of a single collection.
+
+    :param collection: The :class:`safe.api.APICollection` to index.
+    :param fields: The names of the fields to index.
+    '''
+
+    def __init__(self, collection, fields):
+        self.collection = collection
+        self.fields = tuple(fields)
+        self.records = {}
+        self.tables = dict((field, {}) for field in self.fields)
+        self.lock = threading.RLock()
+        self.rebuild()
+
+    def rebuild(self):
+        '''Throw away the current contents and rebuild the index from a
+        fresh snapshot of the collection.'''
+        snapshot = self.collection.snapshot()
+        with self.lock:
+            self.records = {}
+            for table in six.itervalues(self.tables):
+                table.clear()
+            for key, data in six.iteritems(snapshot):
+                self.insert(key, data)
+
+    def insert(self, key, data):
+        '''Add or replace the record stored under key.'''
+        with self.lock:
+            self.discard(key)
+            self.records[key] = data
+            for field, table in six.iteritems(self.tables):
+                value = hashable(data.get(field))
+                table.setdefault(value, set()).add(key)
+
+    def merge(self, key, data):
+        '''Apply a partial update to the record stored under key.'''
+        with self.lock:
+            record = dict(self.records.get(key, {}))
+            record.update(data)
+            self.insert(key, record)
+
+    def discard(self, key):
+        '''Remove the record stored under key, if any.'''
+        with self.lock:
+            data = self.records.pop(key, None)
+            if data is None:
+                return
+
+            for field, table in six.iteritems(self.tables):
+                value = hashable(data.get(field))
+                keys = table.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del table[value]
+
+    def close(self):
+        '''Stop tracking changes made through the api.'''
+        indexes = self.collection.api.indexes
+        if self in indexes:
+            indexes.remove(self)
+
+    def lookup(self, field, value):
+        '''Return the sorted keys of every record whose field equals
+        value.
+
+        :raises KeyError: if the field is not indexed.
+        '''
+        try:
+            table = self.tables[field]
+        except KeyError:
+            raise KeyError('Field {!r} is not indexed'.format(field))
+
+        with self.lock:
+            return sorted(table.get(hashable(value), ()))
+
+    def find(self, filter_expr):
+        '''Return the sorted keys of every record matching all the
+        field/value pairs of filter_expr, mirroring
+        :meth:`safe.api.APICollection.find`.'''
+        with self.lock:
+            matches = None
+            for field, value in six.iteritems(filter_expr):
+                keys = set(self.lookup(field, value))
+                matches = keys if matches is None else matches & keys
+                if not matches:
+                    break
+
+            if matches is None:
+                return sorted(self.records)
+            return sorted(matches)
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return '{}(fields={!r}, records={})'.format(self.__class__.__name__,
+                                                    self.fields,
+                                                    len(self.records))
@@ -0,0 +1,181 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''An append-only journal making bulk jobs resumable.
+
+Every operation is recorded as planned before it's sent to a device,
+and as done or failed once the device answered. An operation the
+device never answered, because of a timeout or a lost connection, is
+left planned as its outcome is in doubt. Resuming a job after a crash
+skips everything recorded as done and only re-checks operations left
+planned or failed, so recovery only costs as much as the work that
+didn't go through::
+
+    >>> journal = safe.journal.Journal('provision.journal')
+    >>> for key, data in profiles:
+    ...     if journal.state('gw1', key) == safe.journal.DONE:
+    ...         continue
+    ...     journal.plan('gw1', key)
+    ...     api.sip.profile.create(key, data)
+    ...     journal.done('gw1', key)
+
+The ``safe`` command line tool keeps one with ``--journal``.
+'''
+
+import os
+import json
+import hashlib
+import threading
+import six
+from . import codec
+
+
+PLANNED = 'planned'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def operation_id(lineno, operation):
+    '''Identify an operation of an input stream by its position and
+    content, so an edited input isn't mistaken for the one journaled.'''
+    content = json.dumps(operation, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    return '{}:{}'.format(lineno, digest[:12])
+
+
+class Journal(object):
+    '''A journal of operations per device, appended to a file. The
+    latest state of every operation already in the file is loaded when
+    it's opened.
+
+    :param path: The journal file, created if missing.
+    :param sync: Force every entry to disk, rather than only to the
+        operating system, surviving a power loss as well as a crash at
+        the cost of throughput.
+    '''
+
+    def __init__(self, path, sync=False):
+        self.path = path
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.states = {}
+
+        torn = False
+        try:
+            with open(path, 'rb') as fp:
+                torn = self.replay(fp)
+        except IOError:
+            pass
+
+        self.fp = open(path, 'ab')
+        if torn:
+            # Terminate the entry interrupted mid-write, so the next one
+            # doesn't get appended to it
+            self.fp.write(b'\n')
+
+    def replay(self, fp):
+        '''Load the states recorded in fp. Returns whether the last
+        entry was left unterminated.'''
+        line = b''
+        for line in fp:
+            try:
+                entry = codec.loads(line)
+                self.states[entry['host'], entry['id']] = entry['state']
+            except (ValueError, KeyError, TypeError):
+                continue
+        return bool(line) and not line.endswith(b'\n')
+
+    def state(self, host, ident):
+        '''Return the last recorded state of an operation, or None.'''
+        return self.states.get((host, ident))
+
+    def record(self, host, ident, state, **extra):
+        entry = {'host': host, 'id': ident, 'state': state}
+        entry.update(extra)
+        line = codec.dumps(entry) + b'\n'
+
+        with self.lock:
+            self.fp.write(line)
+            self.fp.flush()
+            if self.sync:
+                os.fsync(self.fp.fileno())
+            self.states[host, ident] = state
+
+    def plan(self, host, ident, operation=None):
+        '''Record that an operation is about to be sent.'''
+        if operation is not None:
+            self.record(host, ident, PLANNED, op=operation)
+        else:
+            self.record(host, ident, PLANNED)
+
+    def done(self, host, ident):
+        '''Record that an operation completed.'''
+        self.record(host, ident, DONE)
+
+    def failed(self, host, ident, error):
+        '''Record that an operation failed. It's checked, and run again
+        if it didn't go through, on resume.'''
+        self.record(host, ident, FAILED, error=six.text_type(error))
+
+    def pending(self, host=None):
+        '''Return the operations left in doubt.'''
+        return sorted(ident for (h, ident), state in six.iteritems(self.states)
+                      if state == PLANNED and (host is None or h == host))
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fetch(client, path, key):
+    '''Retrieve an object with a :class:`safe.raw.RawClient`, or return
+    None if it doesn't exist.
+
+    Devices don't agree on how to report a missing object: some answer
+    404, others 400 or another client error with a message. A client
+    error is only taken to mean the object is missing once listing the
+    collection confirms it.'''
+    from requests import HTTPError
+
+    try:
+        return client.retrieve(path, key)
+    except HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status == 404:
+            return None
+        if status is None or not 400 <= status < 500:
+            raise
+        if key not in client.list(path):
+            return None
+        raise
+
+
+def applied(client, operation):
+    '''Check whether an operation left in doubt took effect. Only the
+    outcome of creates and deletes can be checked; anything else is
+    reported as not applied, and so is run again.'''
+    kind = operation.get('op')
+    if kind not in ('create', 'delete'):
+        return False
+
+    current = fetch(client, operation['path'], operation['key'])
+    if kind == 'delete':
+        return current is None
+    if current is None:
+        return False
+
+    # Devices may hand back numbers as strings
+    for field, value in six.iteritems(operation.get('data') or {}):
+        actual = current.get(field)
+        if actual != value and six.text_type(actual) != six.text_type(value):
+            return False
+    return True
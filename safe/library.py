@@ -7,6 +7,7 @@
 
 import six
 import requests
+from .profiler import phase
 
 
 class APIError(requests.HTTPError):
@@ -76,9 +77,11 @@ def flatten_reason(reasons):
         yield reason['description']
 
 
-def raise_from_json(r):
-    """Return stored :class:`APIError`, if one occurred."""
-    data = r.json()
+def raise_from_json(r, data=None):
+    """Return stored :class:`APIError`, if one occurred. The already
+    decoded body of the response may be passed in as data."""
+    if data is None:
+        data = r.json()
     api_error_message = None
 
     # Beware the bizarre formatting of error messages! The error field
@@ -146,20 +149,22 @@ def raise_from_json(r):
 
 
 def parse_messages(status):
-    messages = []
-
-    # NSC 2.2 and newer splits the pending changes into three
-    # different sections, depending on the type of the configuration
-    # and the running state of NSC... because.
-    for section in ('reload', 'restart', 'apply'):
-        pending = status.get(section)
+    with phase('errors'):
+        messages = []
+
+        # NSC 2.2 and newer splits the pending changes into three
+        # different sections, depending on the type of the configuration
+        # and the running state of NSC... because.
+        for section in ('reload', 'restart', 'apply'):
+            pending = status.get(section)
+            if pending:
+                messages.extend(Status.fromjson(item)
+                                for item in pending['items'])
+
+        # NSC 2.1 compatability
+        pending = status.get('reloadable')
         if pending:
-            messages.extend(Status.fromjson(item) for item in pending['items'])
-
-    # NSC 2.1 compatability
-    pending = status.get('reloadable')
-    if pending:
-        messages.extend(Status(k, v['configuration'])
-                        for k, v in six.iteritems(pending))
+            messages.extend(Status(k, v['configuration'])
+                            for k, v in six.iteritems(pending))
 
-    return messages
+        return messages
@@ -0,0 +1,294 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Monitor the health of a fleet of devices.
+
+A :class:`Monitor` polls the NSC service and configuration status of
+every device on a schedule, a bounded number of devices at a time, and
+records each sample into fixed size ring buffers backed by
+:mod:`array`, so memory use stays constant however long it runs::
+
+    >>> monitor = safe.monitor.Monitor({'gw1': gw1, 'gw2': gw2}, interval=30)
+    >>> monitor.start()
+    >>> monitor.latest('gw1', 'service')
+    u'RUNNING'
+    >>> monitor.percentile('gw1', 'latency', 95)
+    0.0412
+    >>> monitor.transitions('gw2', 'service')
+    [(1466000000.0, u'RUNNING', u'STOPPED')]
+
+The metrics recorded for every device are listed in :data:`METRICS`.
+'''
+
+import math
+import time
+import array
+import threading
+import six
+from .concurrency import ReadAhead
+from .library import parse_messages
+
+
+#: Each metric and the array type code its samples are stored as:
+#: whether the device answered, the latency of the service status
+#: request in seconds, the service state, whether the configuration has
+#: pending changes and how many.
+METRICS = {
+    'up': 'b',
+    'latency': 'd',
+    'service': 'h',
+    'modified': 'b',
+    'pending': 'i',
+}
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class RingBuffer(object):
+    '''A fixed size series of timestamped samples, overwriting the
+    oldest once full.
+
+    :param size: The number of samples kept.
+    :param typecode: The :mod:`array` type code of the values.
+    '''
+
+    def __init__(self, size, typecode='d'):
+        self.size = size
+        self.times = array.array('d', [0.0]) * size
+        self.values = array.array(typecode, [0]) * size
+        self.count = 0
+
+    def append(self, timestamp, value):
+        index = self.count % self.size
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.count += 1
+
+    def indices(self):
+        start = max(0, self.count - self.size)
+        return (i % self.size for i in range(start, self.count))
+
+    def items(self):
+        '''Return every sample kept, oldest first, as ``(timestamp,
+        value)`` pairs.'''
+        return [(self.times[i], self.values[i]) for i in self.indices()]
+
+    def latest(self):
+        '''Return the latest sample, or None.'''
+        if not self.count:
+            return None
+        index = (self.count - 1) % self.size
+        return self.times[index], self.values[index]
+
+    def percentile(self, q):
+        '''Return the q-th percentile of the values kept, by nearest
+        rank, or None if there are none.'''
+        values = sorted(self.values[i] for i in self.indices())
+        if not values:
+            return None
+        rank = int(math.ceil(q / 100.0 * len(values)))
+        return values[min(max(rank, 1), len(values)) - 1]
+
+    def transitions(self):
+        '''Return a ``(timestamp, old, new)`` triple for every sample
+        whose value differs from the one before.'''
+        changes = []
+        previous = None
+        for timestamp, value in self.items():
+            if previous is not None and value != previous:
+                changes.append((timestamp, previous, value))
+            previous = value
+        return changes
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+
+def status_object(api, path):
+    if hasattr(api, 'resolve'):
+        return api.resolve(path)
+    return api.object(path)
+
+
+class Monitor(object):
+    '''Poll the health of many devices.
+
+    :param apis: Map of host name to a generated api, or to a
+        :class:`safe.raw.RawClient`.
+    :param interval: Seconds between polls of every device.
+    :param workers: The number of devices polled concurrently.
+    :param size: The number of samples kept per device and metric.
+    '''
+
+    def __init__(self, apis, interval=30.0, workers=8, size=1024):
+        self.apis = apis
+        self.interval = interval
+        self.workers = workers
+        self.size = size
+
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.states = []
+        self.state_codes = {}
+        self.messages = {}
+        self.errors = {}
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self, host):
+        '''Poll a single device, returning the time of the sample and
+        either the latency, service state, whether the configuration
+        was modified and the pending changes, or the exception
+        raised.'''
+        api = self.apis[host]
+        now = time.time()
+        try:
+            start = clock()
+            service = status_object(api, 'nsc/service').status()
+            latency = clock() - start
+            configuration = status_object(api, 'nsc/configuration').status()
+            return now, (latency, service['status_text'],
+                         bool(configuration.get('modified')),
+                         parse_messages(configuration))
+        except Exception as e:
+            return now, e
+
+    def buffer(self, host, metric):
+        # Called with the lock held
+        buf = self.buffers.get((host, metric))
+        if buf is None:
+            buf = RingBuffer(self.size, METRICS[metric])
+            self.buffers[host, metric] = buf
+        return buf
+
+    def encode_state(self, state):
+        # Called with the lock held
+        code = self.state_codes.get(state)
+        if code is None:
+            code = self.state_codes[state] = len(self.states)
+            self.states.append(state)
+        return code
+
+    def record(self, host, timestamp, result):
+        with self.lock:
+            if isinstance(result, Exception):
+                self.buffer(host, 'up').append(timestamp, 0)
+                self.errors[host] = result
+                return
+
+            latency, service, modified, messages = result
+            self.buffer(host, 'up').append(timestamp, 1)
+            self.buffer(host, 'latency').append(timestamp, latency)
+            self.buffer(host, 'service').append(timestamp,
+                                                self.encode_state(service))
+            self.buffer(host, 'modified').append(timestamp, modified)
+            self.buffer(host, 'pending').append(timestamp, len(messages))
+            self.messages[host] = messages
+            self.errors.pop(host, None)
+
+    def poll(self):
+        '''Poll every device once.'''
+        with ReadAhead(self.sample, sorted(self.apis), self.workers) as reader:
+            for host, (timestamp, result) in reader:
+                self.record(host, timestamp, result)
+
+    def run(self):
+        '''Poll every device each interval until :meth:`stop` is
+        called.'''
+        while not self.stopped.is_set():
+            start = time.time()
+            self.poll()
+            self.stopped.wait(max(0, start + self.interval - time.time()))
+
+    def start(self):
+        '''Start polling on a background thread.'''
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''Stop polling, waiting for the poll in progress to finish.'''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def decode(self, metric, value):
+        if metric == 'service':
+            return self.states[value]
+        if METRICS[metric] == 'b':
+            return bool(value)
+        return value
+
+    def series(self, host, metric):
+        '''Return every sample of a metric kept for a device, oldest
+        first, as ``(timestamp, value)`` pairs.'''
+        with self.lock:
+            buf = self.buffers.get((host, metric))
+            if buf is None:
+                return []
+            return [(timestamp, self.decode(metric, value))
+                    for timestamp, value in buf.items()]
+
+    def last(self, host, metric):
+        # Called with the lock held
+        buf = self.buffers.get((host, metric))
+        sample = buf.latest() if buf is not None else None
+        if sample is not None:
+            return self.decode(metric, sample[1])
+
+    def rank(self, host, metric, q):
+        # Called with the lock held
+        buf = self.buffers.get((host, metric))
+        if buf is not None:
+            return buf.percentile(q)
+
+    def latest(self, host, metric):
+        '''Return the latest value of a metric for a device, or None.'''
+        with self.lock:
+            return self.last(host, metric)
+
+    def percentile(self, host, metric, q):
+        '''Return the q-th percentile of a numeric metric for a
+        device, or None.'''
+        with self.lock:
+            return self.rank(host, metric, q)
+
+    def transitions(self, host, metric):
+        '''Return a ``(timestamp, old, new)`` triple for every change
+        of a metric for a device, for example every time its service
+        stopped or started.'''
+        with self.lock:
+            buf = self.buffers.get((host, metric))
+            if buf is None:
+                return []
+            return [(timestamp, self.decode(metric, old),
+                     self.decode(metric, new))
+                    for timestamp, old, new in buf.transitions()]
+
+    def summary(self):
+        '''Return the latest state of every device as plain, json
+        serializable, data. Every device is reported as of one and the
+        same moment, never halfway through recording a sample.'''
+        report = {}
+        with self.lock:
+            for host in sorted(self.apis):
+                error = self.errors.get(host)
+                report[host] = {
+                    'up': self.last(host, 'up'),
+                    'service': self.last(host, 'service'),
+                    'modified': self.last(host, 'modified'),
+                    'pending': [six.text_type(message) for message
+                                in self.messages.get(host, ())],
+                    'latency_p50': self.rank(host, 'latency', 50),
+                    'latency_p95': self.rank(host, 'latency', 95),
+                    'error': six.text_type(error) if error is not None
+                    else None,
+                }
+        return report
@@ -11,6 +11,7 @@ represeting its structure.
 
 
 import six
+from .profiler import phase
 from .url import get_documentation
 
 
@@ -26,6 +27,7 @@ class Node(dict):
         self.cls = cls
         self.methods = methods
         self.update(spec)
+        self._digest = None
 
     @property
     def collection(self):
@@ -33,6 +35,24 @@ class Node(dict):
             return False
         return len(self.path) > 1 and not self.get('singleton', False)
 
+    @property
+    def digest(self):
+        '''A digest of the node and everything below it. Nodes with the
+        same digest describe the same object, even when parsed from
+        different specifications.'''
+        if self._digest is None:
+            import json
+            import hashlib
+
+            own = json.dumps([self.path, self], sort_keys=True)
+            digest = hashlib.sha1(own.encode('utf-8'))
+            for section in (self.objs, self.cls, self.methods):
+                digest.update(b'|')
+                for child in sorted(section or (), key=lambda n: n.tag):
+                    digest.update(child.digest.encode('ascii'))
+            self._digest = digest.hexdigest()
+        return self._digest
+
     def __repr__(self):
         return '{}(tag={}, cls={}, methods={}, objs={}, {})'.format(
             self.__class__.__name__, self.tag,
@@ -70,7 +90,159 @@ def _parse_object(tag, spec, path=(), cls=ObjectNode):
 
 
 def parse(spec):
-    return [_parse_object(*d) for d in six.iteritems(spec)]
+    with phase('parse'):
+        return [_parse_object(*d) for d in six.iteritems(spec)]
+
+
+def split_path(path):
+    '''Normalize an object path, given either as a ``/`` separated
+    string or a sequence of segments, into a tuple.'''
+    if isinstance(path, six.string_types):
+        return tuple(segment for segment in path.split('/') if segment)
+    return tuple(path)
+
+
+def field_rules(field):
+    '''Return the names of the validation rules of a field node, for
+    example ``['required', 'in_list']`` for ``required|in_list[a,b]``.'''
+    rules = field.get('rules') or ()
+    if isinstance(rules, six.string_types):
+        rules = rules.split('|')
+    return [rule.split('[', 1)[0].strip() for rule in rules
+            if isinstance(rule, six.string_types) and rule.strip()]
+
+
+def field_options(field):
+    '''Return the set of values a field node is restricted to, from
+    its ``in_list`` rule and, for dropdowns, the options offered, or
+    an empty set if it isn't restricted.'''
+    options = set()
+    rules = field.get('rules') or ()
+    if isinstance(rules, six.string_types):
+        rules = rules.split('|')
+    for rule in rules:
+        if not isinstance(rule, six.string_types):
+            continue
+        name, _, arguments = rule.partition('[')
+        if name.strip() == 'in_list':
+            options.update(argument.strip() for argument
+                           in arguments.rstrip().rstrip(']').split(',')
+                           if argument.strip())
+
+    value = field.get('value')
+    if field.get('type') == 'dropdown' and isinstance(value, dict):
+        options.update(value)
+    return options
+
+
+class SpecIndex(object):
+    '''Index a parsed specification by object path, method and field
+    so lookups and queries over it don't need to walk the tree::
+
+        >>> index = SpecIndex(ast)
+        >>> index.node('sip/profile')
+        ObjectNode(tag=profile, ...)
+        >>> [node.path for node in index.with_method('download')]
+        [(u'nsc', u'backup'), ...]
+
+    :ivar objects: Map of object path tuple to its node.
+    :ivar methods: Map of object path tuple to a map of method name to
+        its node.
+    :ivar fields: Map of object path tuple to a map of field name to
+        its node.
+    '''
+
+    def __init__(self, ast):
+        self.objects = {}
+        self.methods = {}
+        self.fields = {}
+        by_method, by_field, by_rule = {}, {}, {}
+
+        stack = list(ast)
+        while stack:
+            node = stack.pop()
+            self.objects[node.path] = node
+            self.methods[node.path] = dict((method.tag, method)
+                                           for method in node.methods)
+            self.fields[node.path] = dict((field.tag, field)
+                                          for field in node.cls)
+
+            for method in node.methods:
+                by_method.setdefault(method.tag, []).append(node)
+            for field in node.cls:
+                by_field.setdefault(field.tag, []).append(field)
+                for rule in field_rules(field):
+                    by_rule.setdefault(rule, []).append(field)
+            stack.extend(node.objs)
+
+        def freeze(groups):
+            return dict((name, tuple(sorted(nodes, key=lambda n: n.path)))
+                        for name, nodes in six.iteritems(groups))
+
+        self.by_method = freeze(by_method)
+        self.by_field = freeze(by_field)
+        self.by_rule = freeze(by_rule)
+
+    def node(self, path):
+        '''Return the node of the object at path.
+
+        :raises KeyError: if there's no such object.
+        '''
+        path = split_path(path)
+        try:
+            return self.objects[path]
+        except KeyError:
+            raise KeyError('/'.join(path))
+
+    def locate(self, path):
+        '''Return the path of the object in the specification that a
+        path to a live object refers to, leaving out the keys of
+        collection members along it. For example ``('sip', 'profile',
+        'gateway')`` for ``'sip/profile/internal/gateway'``.
+
+        :raises KeyError: if there's no such object.
+        '''
+        segments = split_path(path)
+        located, keyed = (), False
+        for segment in segments:
+            child = located + (segment,)
+            if child in self.objects:
+                located, keyed = child, False
+            elif located and not keyed and self.objects[located].collection:
+                keyed = True
+            else:
+                raise KeyError('/'.join(segments))
+
+        if not located:
+            raise KeyError('/'.join(segments))
+        return located
+
+    def method(self, path, method):
+        '''Return the node of a method of the object at path.'''
+        return self.methods[split_path(path)][method]
+
+    def field(self, path, field):
+        '''Return the node of a field of the object at path.'''
+        return self.fields[split_path(path)][field]
+
+    def with_method(self, method):
+        '''Return the nodes of every object implementing method.'''
+        return self.by_method.get(method, ())
+
+    def with_field(self, field):
+        '''Return the nodes of every field named field.'''
+        return self.by_field.get(field, ())
+
+    def with_rule(self, rule):
+        '''Return the nodes of every field validated by rule, for
+        example ``'in_list'``.'''
+        return self.by_rule.get(rule, ())
+
+    def __contains__(self, path):
+        return split_path(path) in self.objects
+
+    def __len__(self):
+        return len(self.objects)
 
 
 def parse_from_url(*args, **kwargs):
@@ -0,0 +1,299 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Dependency aware teardown and rebuild of objects.
+
+Objects reference each other by key: a sip profile's ``sip-ip`` field
+names a ``network/ip`` object. Deleting an object still referenced
+fails with an "In use by ..." error, and creating one before what it
+references fails validation. The planner learns these references from
+the specification, whose reference fields only accept the keys of the
+collection they refer to, and orders operations so they succeed the
+first time, running independent branches in parallel::
+
+    >>> objects = safe.plan.collect(api, ['network/ip', 'sip/profile'])
+    >>> planner = safe.plan.Planner(objects, index=api.spec_index)
+    >>> planner.teardown_set([('network/ip', 'ip_3')])
+    [('network/ip', 'ip_3'), ('sip/profile', 'external')]
+    >>> safe.plan.teardown(api, planner, [('network/ip', 'ip_3')])
+    >>> safe.plan.rebuild(api, planner)
+
+Objects are identified by ``(path, key)`` pairs.
+'''
+
+import logging
+import six
+from .concurrency import GraphRunner
+from .parser import field_options
+
+
+logger = logging.getLogger('safepy2')
+
+
+class PlanFailed(RuntimeError):
+    '''Raised when some steps of a plan failed.
+
+    :ivar failures: Map of each failed object to its exception.
+    :ivar skipped: The objects skipped because something they depend
+        on failed.
+    '''
+
+    def __init__(self, failures, skipped):
+        self.failures = failures
+        self.skipped = skipped
+
+    def __str__(self):
+        messages = ('{}/{}: {}'.format(path, key, error)
+                    for (path, key), error in sorted(self.failures.items()))
+        return u'{} failed, {} skipped:\n{}'.format(len(self.failures),
+                                                    len(self.skipped),
+                                                    '\n'.join(messages))
+
+
+def collect(api, paths):
+    '''Snapshot the given collections, returning a dictionary mapping
+    every ``(path, key)`` to the object's data.'''
+    objects = {}
+    for path in paths:
+        for key, data in six.iteritems(api.resolve(path).snapshot()):
+            objects[path, key] = data
+    return objects
+
+
+def field_values(value):
+    if isinstance(value, six.string_types):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, six.string_types):
+                yield item
+
+
+def spec_references(index, objects):
+    '''Derive which collections the fields of each collection of
+    objects reference from a :class:`safe.parser.SpecIndex`.
+
+    A reference field only accepts the keys of the collection it
+    references, so a field restricted to values, by an ``in_list`` rule
+    or as a dropdown, references the collection whose keys are most
+    like those values: more than half of the values and keys taken
+    together must be shared. A field whose values only happen to
+    include a key, such as ``'default'``, references nothing.
+
+    :returns: A map of collection path to a map of field name to the
+        set of referenced collection paths, as taken by
+        :class:`Planner`.
+    '''
+    keys = {}
+    for path, key in objects:
+        keys.setdefault(path, set()).add(key)
+
+    references = {}
+    for path in keys:
+        try:
+            fields = index.fields[index.locate(path)]
+        except KeyError:
+            continue
+
+        for name, field in six.iteritems(fields):
+            options = field_options(field)
+            if not options:
+                continue
+
+            shares = dict((other, len(members & options) /
+                           float(len(members | options)))
+                          for other, members in six.iteritems(keys))
+            best = max(shares.values())
+            if best > 0.5:
+                references.setdefault(path, {})[name] = set(
+                    other for other, share in six.iteritems(shares)
+                    if share == best)
+    return references
+
+
+class Planner(object):
+    '''Reference graph between a set of objects.
+
+    References are either declared, or derived from the specification
+    with :func:`spec_references`. Failing both, any field whose value
+    is the key of another object is guessed to reference it; guessed
+    references are good enough to order a rebuild, but
+    :func:`teardown` won't delete anything besides the objects it's
+    asked to on their account.
+
+    :param objects: Map of ``(path, key)`` to data, as returned by
+        :func:`collect`.
+    :param references: Optional map of collection path to a map of
+        field name to the path, or set of paths, of the referenced
+        collections, for example
+        ``{'sip/profile': {'sip-ip': 'network/ip'}}``.
+    :param index: Optional :class:`safe.parser.SpecIndex` to derive the
+        references from, usually ``api.spec_index``.
+    :ivar guessed: Whether the references were guessed.
+    '''
+
+    def __init__(self, objects, references=None, index=None):
+        if references is None and index is not None:
+            references = spec_references(index, objects)
+
+        self.objects = objects
+        self.references = references
+        self.guessed = references is None
+        self.dependencies = dict((node, set()) for node in objects)
+        self.dependents = dict((node, set()) for node in objects)
+
+        owners = {}
+        for path, key in objects:
+            owners.setdefault(key, set()).add(path)
+
+        for node, data in six.iteritems(objects):
+            path = node[0]
+            for field, value in six.iteritems(data or {}):
+                if references is not None:
+                    targets = references.get(path, {}).get(field)
+                    if not targets:
+                        continue
+                    if isinstance(targets, six.string_types):
+                        targets = set([targets])
+                else:
+                    targets = None
+
+                for item in field_values(value):
+                    for other in owners.get(item, ()):
+                        dependency = (other, item)
+                        if dependency == node:
+                            continue
+                        if targets is None or other in targets:
+                            self.add(node, dependency)
+
+    def add(self, node, dependency):
+        '''Record that node references dependency.'''
+        self.dependencies[node].add(dependency)
+        self.dependents[dependency].add(node)
+
+    def closure(self, nodes, edges):
+        seen = set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(edges.get(node, ()))
+        return seen
+
+    def teardown_set(self, nodes):
+        '''Return, sorted, every object deleting nodes means deleting:
+        the nodes themselves, and everything referencing them.'''
+        return sorted(self.closure(nodes, self.dependents))
+
+    def teardown_graph(self, nodes=None):
+        '''Map every object to delete to the objects which must be
+        deleted before it. Deleting an object requires deleting
+        everything referencing it first, so they're included.'''
+        if nodes is None:
+            nodes = set(self.objects)
+        else:
+            nodes = self.closure(nodes, self.dependents)
+        return dict((node, self.dependents[node] & nodes) for node in nodes)
+
+    def build_graph(self, nodes=None):
+        '''Map every object to create to the objects which must be
+        created before it.'''
+        nodes = set(self.objects if nodes is None else nodes)
+        return dict((node, self.dependencies[node] & nodes)
+                    for node in nodes)
+
+    @staticmethod
+    def levels(graph):
+        '''Group a graph into successive levels which can each run
+        fully in parallel.'''
+        remaining = dict((node, set(deps)) for node, deps in graph.items())
+        levels = []
+        while remaining:
+            level = sorted(node for node, deps in remaining.items()
+                           if not deps)
+            if not level:
+                raise ValueError('Dependency cycle between: {}'.format(
+                    ', '.join(str(node) for node in sorted(remaining))))
+            for node in level:
+                del remaining[node]
+            for deps in remaining.values():
+                deps.difference_update(level)
+            levels.append(level)
+        return levels
+
+
+def run(graph, func, workers):
+    failures, skipped = GraphRunner(graph, workers).run(func)
+    if failures or skipped:
+        raise PlanFailed(failures, skipped)
+
+
+def teardown(api, planner, nodes=None, workers=8, stop=True,
+             confirm=None):
+    '''Delete objects, and everything referencing them, in dependency
+    order.
+
+    :param api: The generated api.
+    :param planner: The :class:`Planner` describing the objects.
+    :param nodes: The objects to delete, all of them by default.
+    :param workers: The number of deletions to run concurrently.
+    :param stop: Stop objects, such as profiles, which have a stop
+        method before deleting them.
+    :param confirm: Optional function called with the sorted list of
+        every object about to be deleted, before anything is. Nothing
+        is deleted unless it returns true.
+    :returns: The sorted list of the objects deleted.
+    :raises ValueError: if deleting nodes means deleting other objects
+        as well, but the planner's references were only guessed.
+    :raises PlanFailed: if any deletion failed.
+    '''
+    from .library import APIError
+
+    graph = planner.teardown_graph(nodes)
+    doomed = sorted(graph)
+    if nodes is not None:
+        extra = sorted(set(graph) - set(nodes))
+        if extra and planner.guessed:
+            raise ValueError(
+                'Deleting these objects means deleting {}, which only '
+                'seem to reference them; give the planner the references '
+                'or the specification index'.format(', '.join(
+                    '{}/{}'.format(path, key) for path, key in extra)))
+        if extra:
+            logger.info('Also deleting %s, referencing what is deleted',
+                        ', '.join('{}/{}'.format(*node) for node in extra))
+
+    if confirm is not None and not confirm(doomed):
+        return []
+
+    def delete(node):
+        path, key = node
+        collection = api.resolve(path)
+        if stop and 'stop' in collection.api.methods:
+            try:
+                collection.api.post('stop', path=[key])
+            except APIError:
+                # Most likely already stopped
+                pass
+        collection.delete(key)
+
+    run(graph, delete, workers)
+    return doomed
+
+
+def rebuild(api, planner, nodes=None, workers=8):
+    '''Create objects from the data recorded in the planner, in
+    dependency order.
+
+    :raises PlanFailed: if any creation failed.
+    '''
+    def create(node):
+        path, key = node
+        api.resolve(path).create(key, dict(planner.objects[node]))
+
+    run(planner.build_graph(nodes), create, workers)
@@ -0,0 +1,213 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Attribute the time spent in the library to phases.
+
+When profiling is enabled, time is accounted to one of the phases in
+:data:`PHASES`: downloading the specification, parsing it, generating
+types, building urls, waiting on the wire, decoding responses and
+mapping errors. Phases nest, and time is only counted once, against the
+innermost phase. Each phase also records the call sites in the calling
+code it was entered from.
+
+Profiling is enabled with :func:`enable`, or by setting the
+``SAFEPY_PROFILE`` environment variable. Set to ``1``, a report is
+printed to stderr on exit; set to a file name, the report is written
+there as json instead::
+
+    $ SAFEPY_PROFILE=1 python provision.py
+    phase         calls      total   per call
+    wire            412     8.214s    19.94ms
+    decode          412     0.031s     0.08ms
+    ...
+'''
+
+import os
+import sys
+import time
+import atexit
+import threading
+
+
+#: The phases time is accounted to.
+PHASES = ('spec', 'parse', 'types', 'url', 'wire', 'decode', 'errors')
+
+clock = getattr(time, 'perf_counter', time.time)
+
+enabled = False
+output = None
+
+_lock = threading.Lock()
+_local = threading.local()
+_phases = {}
+_sites = {}
+_registered = False
+_package = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+class NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null = NullPhase()
+
+
+def call_site():
+    '''Describe the innermost frame outside the library.'''
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not os.path.abspath(filename).startswith(_package):
+            return '{}:{} in {}'.format(filename, frame.f_lineno,
+                                        frame.f_code.co_name)
+        frame = frame.f_back
+    return '<library>'
+
+
+class Phase(object):
+    __slots__ = ('name', 'start', 'nested')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.nested = 0.0
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = clock() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+
+        record(self.name, elapsed - self.nested, call_site())
+        return False
+
+
+def phase(name):
+    '''Return a context manager accounting the time spent in it to the
+    named phase, or doing nothing while profiling is disabled.'''
+    if not enabled:
+        return _null
+    return Phase(name)
+
+
+def record(name, seconds, site):
+    with _lock:
+        stats = _phases.get(name)
+        if stats is None:
+            stats = _phases[name] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+
+        stats = _sites.get((name, site))
+        if stats is None:
+            stats = _sites[name, site] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+
+
+def enable(report_to=None, at_exit=True):
+    '''Start profiling.
+
+    :param report_to: Where the report is written on exit: None for
+        a table on stderr, otherwise the name of a json file.
+    :param at_exit: Whether to write the report on exit at all.
+    '''
+    global enabled, output, _registered
+
+    enabled = True
+    output = report_to
+    if at_exit and not _registered:
+        atexit.register(write_report)
+        _registered = True
+
+
+def disable():
+    '''Stop profiling, keeping what was recorded so far.'''
+    global enabled
+    enabled = False
+
+
+def reset():
+    '''Drop everything recorded so far.'''
+    with _lock:
+        _phases.clear()
+        _sites.clear()
+
+
+def report(top=10):
+    '''Return the recorded times as plain, json serializable, data:
+    the totals of every phase and the call sites which spent the most
+    time in any phase.'''
+    with _lock:
+        phases = dict((name, {'calls': calls, 'seconds': seconds})
+                      for name, (calls, seconds) in _phases.items())
+        sites = sorted(((seconds, calls, name, site) for (name, site),
+                        (calls, seconds) in _sites.items()), reverse=True)
+
+    return {
+        'phases': phases,
+        'library_seconds': sum(stats['seconds'] for name, stats
+                               in phases.items() if name != 'wire'),
+        'sites': [{'phase': name, 'site': site, 'calls': calls,
+                   'seconds': seconds}
+                  for seconds, calls, name, site in sites[:top]],
+    }
+
+
+def format_report(top=10):
+    '''Format the recorded times as a human readable table.'''
+    data = report(top)
+    lines = ['{:<10} {:>8} {:>10} {:>10}'.format('phase', 'calls', 'total',
+                                                 'per call')]
+    phases = sorted(data['phases'].items(), key=lambda item: PHASES.index(
+        item[0]) if item[0] in PHASES else len(PHASES))
+    for name, stats in phases:
+        lines.append('{:<10} {:>8} {:>9.3f}s {:>8.2f}ms'.format(
+            name, stats['calls'], stats['seconds'],
+            1000 * stats['seconds'] / stats['calls']))
+    lines.append('library total: {:.3f}s'.format(data['library_seconds']))
+
+    if data['sites']:
+        lines.append('')
+        lines.append('top call sites:')
+        for entry in data['sites']:
+            lines.append('{:>9.3f}s {:>8} {:<8} {}'.format(
+                entry['seconds'], entry['calls'], entry['phase'],
+                entry['site']))
+    return '\n'.join(lines)
+
+
+def write_report():
+    '''Write the report where :func:`enable` was told to.'''
+    if not _phases:
+        return
+
+    if output is None:
+        sys.stderr.write(format_report() + '\n')
+    else:
+        from . import codec
+        with open(output, 'wb') as fp:
+            fp.write(codec.dumps(report()))
+
+
+_setting = os.environ.get('SAFEPY_PROFILE')
+if _setting and _setting.lower() not in ('0', 'false', 'no'):
+    enable(None if _setting.lower() in ('1', 'true', 'yes') else _setting)
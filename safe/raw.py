@@ -0,0 +1,204 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''A lightweight client issuing SAFe REST calls by path.
+
+Unlike :func:`safe.api`, the raw client doesn't download the
+specification or generate any classes, so it's ready as soon as it's
+constructed. Errors are mapped exactly the same way::
+
+    >>> client = safe.raw.RawClient('10.10.9.100', token='A3553E08FB0DCCB80E4CE951666E16DE')
+    >>> client.call('sip/profile', 'list')
+    [u'internal']
+    >>> client.retrieve('sip/profile', 'internal')['sip-port']
+    u'5060'
+
+Should a specification be provided, calls are validated against it
+before they're sent and the request type of non-standard methods is
+taken from it. Without one, only the standard methods are known: the
+first call to any other, such as ``stop`` or ``status``, downloads the
+specification from the device to tell whether it's a GET or a POST.
+Paths may go through the keys of collection members, like
+``'sip/profile/internal/gateway'``.
+'''
+
+import copy
+import threading
+import six
+from . import codec
+from .api import apply_configuration, fetch_spec, make_session
+from .parser import SpecIndex, parse, split_path
+from .url import url_builder, unpack_rest_response
+
+
+REQUEST_TYPES = {
+    'list': 'GET',
+    'retrieve': 'GET',
+    'download': 'GET',
+    'create': 'POST',
+    'update': 'POST',
+    'delete': 'POST',
+    'upload': 'POST',
+}
+
+
+class RawObject(object):
+    '''Expose the methods of a single object of a :class:`RawClient` as
+    python methods, for code written against the generated api.'''
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = split_path(path)
+
+    @property
+    def methods(self):
+        index = self.client.index
+        if index is not None:
+            try:
+                return list(index.methods[index.locate(self.path)])
+            except KeyError:
+                return []
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self.client.call(self.path, method, *args, **kwargs)
+        call.__name__ = str(method)
+        return call
+
+
+class RawClient(object):
+    '''Issue SAFe REST calls by object path and method name.
+
+    :param host: The hostname of the device to connect to.
+    :param port: The port the SAFe framework is listening on.
+    :param scheme: Specify the scheme of the request url.
+    :param token: The api token.
+    :param spec: An optional specification, either already decoded or
+        the path to a local copy, to validate calls against. It's
+        downloaded from the device when first needed otherwise.
+    :param transport: The transport to send requests through, see
+        :mod:`safe.transport`.
+    '''
+
+    def __init__(self, host, port=80, scheme='http', token=None, spec=None,
+                 timeout=None, adapter=None, limiter=None, transport=None):
+        self.base = url_builder(host, port, scheme)
+        self.session = make_session(host, port, scheme, token, timeout,
+                                    adapter, limiter, transport)
+        self.builders = {}
+        self.index = None
+        self.lock = threading.Lock()
+
+        if isinstance(spec, six.string_types):
+            with open(spec, 'rb') as fp:
+                spec = codec.load(fp)
+        elif spec is not None:
+            # Parsing consumes the specification it's given
+            spec = copy.deepcopy(spec)
+        if spec is not None:
+            self.index = SpecIndex(parse(spec))
+
+    def load_spec(self):
+        '''Download the specification from the device and validate
+        calls against it from now on.'''
+        self.index = SpecIndex(parse(fetch_spec(self.session, self.base)))
+
+    def builder(self, path):
+        try:
+            return self.builders[path]
+        except KeyError:
+            builder = self.builders[path] = self.base.join(*path)
+            return builder
+
+    def request_type(self, path, method):
+        if self.index is None and method not in REQUEST_TYPES:
+            with self.lock:
+                if self.index is None:
+                    self.load_spec()
+
+        if self.index is not None:
+            try:
+                methods = self.index.methods[self.index.locate(path)]
+            except KeyError:
+                raise ValueError('Unknown object: {!r}'.format('/'.join(path)))
+            try:
+                return methods[method].get('request')
+            except KeyError:
+                raise ValueError('Unknown method {!r} for {!r}'.format(
+                    method, '/'.join(path)))
+        return REQUEST_TYPES[method]
+
+    def call(self, path, method, *args, **kwargs):
+        '''Call a method on an object.
+
+        :param path: The path of the object, for example
+            ``'sip/profile'``.
+        :param method: The name of the method.
+        :param args: Extra path segments, for example the key of a
+            collection member.
+        :param data: Optional json payload, sent with a POST.
+        :param request: Force the request type, ``'GET'`` or ``'POST'``.
+        :param kwargs: Query parameters.
+        :returns: The data of the response, or its raw content for
+            downloads.
+        '''
+        data = kwargs.pop('data', None)
+        path = split_path(path)
+        request = kwargs.pop('request', None) or \
+            self.request_type(path, method)
+
+        safe_url = self.builder(path).url(method, path=args)
+        params = kwargs or None
+        if request == 'GET':
+            r = self.session.get(safe_url, params=params)
+        else:
+            postdata = codec.dumps(data) if data else None
+            r = self.session.post(safe_url, data=postdata, params=params,
+                                  headers={'Content-Type': 'application/json'})
+
+        response = unpack_rest_response(r)
+        if response.mimetype == 'application/json':
+            return response.data
+        return response.content
+
+    def list(self, path):
+        return self.call(path, 'list')
+
+    def retrieve(self, path, key=None):
+        args = (key,) if key is not None else ()
+        return self.call(path, 'retrieve', *args)
+
+    def create(self, path, key, data):
+        return self.call(path, 'create', key, data=data)
+
+    def update(self, path, data, key=None):
+        args = (key,) if key is not None else ()
+        return self.call(path, 'update', *args, data=data)
+
+    def delete(self, path, key):
+        return self.call(path, 'delete', key)
+
+    def object(self, path):
+        '''Return a :class:`RawObject` for the object at path.'''
+        return RawObject(self, path)
+
+    def commit(self):
+        '''Apply the staged configuration, like
+        :meth:`safe.api.API.commit`. The specification is downloaded,
+        if needed, to find out how the device applies changes.'''
+        if self.index is None:
+            self.load_spec()
+
+        configuration = self.object('nsc/configuration')
+        apply_configuration(configuration, self.object('nsc/service'),
+                            'smartapply' in configuration.methods)
+
+    def close(self):
+        self.session.close()
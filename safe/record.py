@@ -0,0 +1,164 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Compact typed records for retrieved objects.
+
+A retrieve returns a plain dictionary, repeating every field name in
+every object. Record types are generated from the fields described in
+the specification instead, storing values in ``__slots__`` so large
+snapshots cost far less memory and compare field by field::
+
+    >>> profiles = api.sip.profile.records()
+    >>> profiles['internal'].sip_port
+    u'5060'
+    >>> profiles['internal'].diff(profiles['external'])
+    {'sip-port': (u'5060', u'5080')}
+
+Field names which aren't valid python identifiers are exposed with
+every invalid character replaced by an underscore, like the rest of
+the generated api.
+'''
+
+import re
+import keyword
+import weakref
+import six
+from six.moves import intern
+from .profiler import phase
+
+
+def attribute_name(field):
+    '''Map a SAFe field name to a valid, interned attribute name.'''
+    name = re.sub('[^a-zA-Z0-9_]', '_', field)
+    if not name or name[0].isdigit():
+        name = '_' + name
+    if keyword.iskeyword(name):
+        name += '_'
+    return intern(str(name))
+
+
+class Record(object):
+    '''Base of the generated record types. Fields missing from the
+    payload are left unset, and payload fields unknown to the
+    specification are kept aside so they survive a round trip.'''
+
+    __slots__ = ('_extra',)
+
+    #: The SAFe field names, in the order of :attr:`_attributes`.
+    _fields = ()
+    #: The attribute name each field is stored under.
+    _attributes = ()
+    #: Map of field name to attribute name.
+    _attribute_map = {}
+
+    def __init__(self, **kwargs):
+        self._extra = None
+        for attr, value in six.iteritems(kwargs):
+            setattr(self, attr, value)
+
+    @classmethod
+    def fromjson(cls, data):
+        '''Build a record straight from a decoded json payload.'''
+        record = cls.__new__(cls)
+        record._extra = None
+
+        attribute_map = cls._attribute_map
+        for field, value in six.iteritems(data):
+            attr = attribute_map.get(field)
+            if attr is not None:
+                setattr(record, attr, value)
+            else:
+                if record._extra is None:
+                    record._extra = {}
+                record._extra[field] = value
+        return record
+
+    def tojson(self):
+        '''Convert the record back into a json payload, suitable for
+        an update.'''
+        data = dict(self._extra or ())
+        for field, attr in zip(self._fields, self._attributes):
+            try:
+                data[field] = getattr(self, attr)
+            except AttributeError:
+                pass
+        return data
+
+    def items(self):
+        return six.iteritems(self.tojson())
+
+    def diff(self, other):
+        '''Compare two records field by field, returning a dictionary
+        mapping the name of every differing field to the pair of
+        values. Unset fields are reported as None.'''
+        mine, theirs = self.tojson(), other.tojson()
+        changes = {}
+        for field in set(mine) | set(theirs):
+            a, b = mine.get(field), theirs.get(field)
+            if a != b:
+                changes[field] = (a, b)
+        return changes
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.tojson() == other.tojson()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.tojson())
+
+
+def as_payload(data):
+    '''Accept either a record or a plain dictionary as a payload.'''
+    if isinstance(data, Record):
+        return data.tojson()
+    return data
+
+
+_record_types = weakref.WeakValueDictionary()
+
+
+def record_type(node):
+    '''Generate, or return the already generated, record type for an
+    object node of the specification. Nodes with the same digest share
+    their record type.'''
+    cls = _record_types.get(node.digest)
+    if cls is not None:
+        return cls
+
+    with phase('types'):
+        fields = tuple(intern(str(field.tag)) for field in node.cls)
+        attributes = []
+        reserved = set(dir(Record))
+        for field in fields:
+            attr = attribute_name(field)
+            # Avoid clashing with the record's own methods or with another
+            # field sanitized down to the same name
+            while attr in reserved:
+                attr = intern(attr + '_')
+            reserved.add(attr)
+            attributes.append(attr)
+
+        attributes = tuple(attributes)
+        typename = attribute_name(node.get('name') or node.tag)
+        cls = type(typename + 'Record', (Record,), {
+            '__slots__': attributes,
+            '_fields': fields,
+            '_attributes': attributes,
+            '_attribute_map': dict(zip(fields, attributes)),
+            '_node': node,
+        })
+        _record_types[node.digest] = cls
+    return cls
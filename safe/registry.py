@@ -0,0 +1,203 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''A thread-safe registry of live api objects, for long running
+services talking to many devices.
+
+Calling :func:`safe.api` downloads and compiles the specification and
+opens a new connection pool each time. The registry instead keeps one
+api object per (host, port, scheme, token), sharing its connection pool
+and parsed specification between all callers::
+
+    >>> registry = safe.registry.Registry(max_idle=600)
+    >>> api = registry.get('10.10.9.100', token='A3553E08FB0DCCB80E4CE951666E16DE')
+
+Entries are health checked against ``nsc/version`` when they haven't
+been checked for a while. Should the firmware version change, the
+specification is downloaded again and the api rebuilt. Entries which
+haven't been used for ``max_idle`` seconds are evicted.
+'''
+
+import time
+import logging
+import threading
+import six
+from .api import api_wrapper, build_api, fetch_spec, make_session
+from .parser import parse
+from .url import url_builder
+
+
+logger = logging.getLogger('safepy2')
+
+
+class Entry(object):
+    '''A single device tracked by the registry.'''
+
+    def __init__(self, host, port=80, scheme='http', token=None,
+                 specfile=None, timeout=None, adapter=None, limiter=None,
+                 cache=None, transport=None):
+        self.host = host
+        self.port = port
+        self.scheme = scheme
+        self.token = token
+        self.specfile = specfile
+        self.timeout = timeout
+        self.adapter = adapter
+        self.limiter = limiter
+        self.cache = cache
+        self.transport = transport
+
+        self.builder = url_builder(host, port, scheme)
+        self.session = None
+        self.api = None
+        self.ast = None
+        self.last_used = time.time()
+        self.last_checked = 0
+        self.lock = threading.Lock()
+
+    @property
+    def version(self):
+        if self.api:
+            return self.api.api.version
+
+    def connect(self):
+        rebuild = self.session is None
+        if self.session is None:
+            self.session = make_session(self.host, self.port, self.scheme,
+                                        self.token, self.timeout,
+                                        self.adapter, self.limiter,
+                                        self.transport)
+
+        wrapper = api_wrapper(self.session, self.builder, self.cache)
+        if self.ast is None or wrapper.version != self.version:
+            if self.api:
+                logger.info('Firmware on %s changed from %s to %s, '
+                            'rebuilding', self.host, self.version,
+                            wrapper.version)
+            spec = fetch_spec(self.session, self.builder, self.specfile,
+                              self.cache, wrapper.version)
+            self.ast = parse(spec)
+            rebuild = True
+
+        # Every wrapper of the api holds the session it was built with,
+        # so a new session needs a new api
+        if rebuild:
+            self.api = build_api(wrapper, self.ast)
+        self.last_checked = time.time()
+
+    def check(self):
+        '''Verify the device is still reachable and running the same
+        firmware, reconnecting and rebuilding the api if needed. Only
+        a device that can't be reached is reconnected to; errors it
+        answered with, such as a bad token or being too busy, aren't
+        cured by reconnecting and are raised.'''
+        from requests import HTTPError
+
+        try:
+            self.connect()
+        except Exception as e:
+            if self.session is None or isinstance(e, HTTPError) or \
+                    not isinstance(e, self.session.connection_errors):
+                raise
+            logger.info('Lost connection to %s, reconnecting', self.host)
+            self.close()
+            self.connect()
+
+    def acquire(self, check_interval):
+        with self.lock:
+            if self.api is None or \
+                    time.time() - self.last_checked > check_interval:
+                self.check()
+            self.last_used = time.time()
+            return self.api
+
+    def close(self):
+        # A transport given by the caller is the caller's to close
+        if self.session is not None and self.session is not self.transport:
+            self.session.close()
+        self.session = None
+
+
+class Registry(object):
+    '''Registry of live api objects keyed by (host, port, scheme,
+    token).
+
+    :param max_idle: Seconds an entry may go unused before it's evicted.
+    :type max_idle: float
+    :param check_interval: Seconds between health checks of an entry.
+    :type check_interval: float
+    '''
+
+    def __init__(self, max_idle=300, check_interval=60):
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.time()
+
+    def get(self, host, port=80, scheme='http', token=None, specfile=None,
+            timeout=None, adapter=None, limiter=None, cache=None,
+            transport=None):
+        '''Return the shared api object for a device, connecting to it
+        if needed. Takes the same arguments as :func:`safe.api`; the
+        options besides the key are only used when the entry is first
+        created.'''
+        self.sweep()
+
+        key = (host, port, scheme, token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = Entry(host, port, scheme, token, specfile=specfile,
+                              timeout=timeout, adapter=adapter,
+                              limiter=limiter, cache=cache,
+                              transport=transport)
+                self.entries[key] = entry
+
+        try:
+            return entry.acquire(self.check_interval)
+        except Exception:
+            with self.lock:
+                if self.entries.get(key) is entry and entry.api is None:
+                    del self.entries[key]
+            raise
+
+    def sweep(self):
+        '''Evict the entries which have been idle for too long.'''
+        now = time.time()
+        if now - self.last_sweep < min(self.max_idle, self.check_interval):
+            return
+
+        with self.lock:
+            self.last_sweep = now
+            expired = [key for key, entry in six.iteritems(self.entries)
+                       if now - entry.last_used > self.max_idle]
+            evicted = [self.entries.pop(key) for key in expired]
+
+        for entry in evicted:
+            logger.info('Evicting idle api for %s', entry.host)
+            entry.close()
+
+    def evict(self, host, port=80, scheme='http', token=None):
+        '''Forget about a device, closing its connections.'''
+        with self.lock:
+            entry = self.entries.pop((host, port, scheme, token), None)
+        if entry is not None:
+            entry.close()
+
+    def close(self):
+        '''Evict every entry.'''
+        with self.lock:
+            entries, self.entries = self.entries, {}
+        for entry in six.itervalues(entries):
+            entry.close()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,130 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Compare specifications across firmware versions.
+
+Every parsed node carries a digest of itself and everything below it,
+so two specifications are compared by walking them together and
+skipping any subtree whose digest didn't change::
+
+    >>> changes = safe.specdiff.diff(old_ast, new_ast)
+    >>> changes.removed['methods']
+    ['sip/profile/flush']
+    >>> changes.breaking
+    True
+
+The same digests key the generated types: an api built from an
+upgraded device's specification reuses the types of every object left
+unchanged, and :func:`share` lets trees parsed from different devices
+hold a single copy of their common subtrees.
+'''
+
+import weakref
+
+
+#: The kinds of elements reported on.
+KINDS = ('objects', 'methods', 'fields')
+
+
+class SpecDiff(object):
+    '''The differences between two specifications. Each of
+    :attr:`added`, :attr:`removed` and :attr:`changed` maps every kind
+    in :data:`KINDS` to a sorted list of slash separated paths. An
+    element is changed when its own description differs, for example a
+    method's request type or a field's validation rules.'''
+
+    def __init__(self):
+        self.added = dict((kind, []) for kind in KINDS)
+        self.removed = dict((kind, []) for kind in KINDS)
+        self.changed = dict((kind, []) for kind in KINDS)
+
+    @property
+    def breaking(self):
+        '''Whether anything was removed, which automation written
+        against the old specification might rely on.'''
+        return any(self.removed.values())
+
+    def asdict(self):
+        '''Return the report as plain, json serializable, data.'''
+        return {'added': self.added,
+                'removed': self.removed,
+                'changed': self.changed,
+                'breaking': self.breaking}
+
+    def sort(self):
+        for report in (self.added, self.removed, self.changed):
+            for paths in report.values():
+                paths.sort()
+
+    def __bool__(self):
+        return any(any(report.values()) for report in
+                   (self.added, self.removed, self.changed))
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.asdict())
+
+
+def node_path(node):
+    return '/'.join(node.path)
+
+
+def by_tag(nodes):
+    return dict((node.tag, node) for node in nodes or ())
+
+
+def compare(report, kind, old, new):
+    '''Compare two lists of sibling nodes of the same kind.'''
+    old, new = by_tag(old), by_tag(new)
+    for tag in set(old) | set(new):
+        a, b = old.get(tag), new.get(tag)
+        if a is None:
+            report.added[kind].append(node_path(b))
+        elif b is None:
+            report.removed[kind].append(node_path(a))
+        elif a.digest != b.digest:
+            if dict(a) != dict(b):
+                report.changed[kind].append(node_path(a))
+            if kind == 'objects':
+                compare(report, 'objects', a.objs, b.objs)
+                compare(report, 'methods', a.methods, b.methods)
+                compare(report, 'fields', a.cls, b.cls)
+
+
+def diff(old, new):
+    '''Compare two parsed specifications.
+
+    :param old: The abstract syntax tree of the old specification.
+    :param new: The abstract syntax tree of the new specification.
+    :returns: A :class:`SpecDiff`.
+    '''
+    report = SpecDiff()
+    compare(report, 'objects', old, new)
+    report.sort()
+    return report
+
+
+_nodes = weakref.WeakValueDictionary()
+
+
+def share(ast):
+    '''Replace every subtree of ast identical to one already shared by
+    the copy seen first, so many devices with similar firmware hold a
+    single copy of their common specification. Returns the new list of
+    top level nodes.'''
+    def visit(node):
+        shared = _nodes.get(node.digest)
+        if shared is not None:
+            return shared
+
+        if node.objs:
+            node.objs = [visit(child) for child in node.objs]
+        _nodes[node.digest] = node
+        return node
+
+    return [visit(node) for node in ast]
@@ -0,0 +1,291 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Transports carrying requests to a device.
+
+A transport takes a request and hands back the status, headers and body
+of the response; that's all the rest of the library relies on. The
+default, :class:`RequestsTransport`, sends requests through a
+:mod:`requests` session. :class:`HTTP2Transport` multiplexes every
+concurrent request to a device over a single HTTP/2 connection, and
+:class:`MemoryTransport` answers from memory, for tests::
+
+    >>> transport = safe.transport.HTTP2Transport()
+    >>> api = safe.api('10.10.9.100', scheme='https', transport=transport)
+'''
+
+import threading
+import six
+from six.moves.http_client import responses
+from . import codec
+from .profiler import phase
+
+
+class Response(object):
+    '''A response, exposing the same attributes as a
+    :class:`requests.Response` for the ones the library reads.'''
+
+    def __init__(self, status_code, headers=None, content=b'', url=None,
+                 reason=None):
+        from requests.structures import CaseInsensitiveDict
+
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = content
+        self.url = url
+        self.reason = reason if reason is not None else \
+            responses.get(status_code, '')
+
+    def json(self):
+        return codec.loads(self.content)
+
+    def __repr__(self):
+        return '<{} [{}]>'.format(self.__class__.__name__, self.status_code)
+
+
+class Transport(object):
+    '''Base of the transports. Subclasses implement :meth:`request`.
+
+    :ivar headers: Headers sent with every request, such as the api
+        token.
+    :ivar connection_errors: The exceptions raised when the device
+        can't be reached or didn't answer in time, after which it's
+        worth reconnecting. Errors the device answered with, such as
+        :class:`requests.HTTPError`, aren't among them.
+    '''
+
+    def __init__(self, timeout=None):
+        import requests
+
+        self.timeout = timeout
+        self.headers = {}
+        self.connection_errors = (requests.ConnectionError, requests.Timeout)
+
+    def merge_headers(self, headers=None):
+        merged = dict(self.headers)
+        if headers:
+            merged.update(headers)
+        return merged
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                files=None, **kwargs):
+        '''Send a request and return its response.
+
+        :param method: ``'GET'`` or ``'POST'``.
+        :param url: The full url.
+        :param params: Query parameters.
+        :param data: The body, already encoded.
+        :param headers: Headers added to the transport's own.
+        :param files: Files to upload as a multipart body, a map of
+            field name to a ``(filename, content)`` pair.
+        :param kwargs: Options of the underlying client, such as
+            ``timeout`` or ``json``.
+        '''
+        raise NotImplementedError
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        with phase('wire'):
+            return self.request('GET', url, params=params, headers=headers,
+                                **kwargs)
+
+    def post(self, url, data=None, params=None, headers=None, files=None,
+             **kwargs):
+        with phase('wire'):
+            return self.request('POST', url, params=params, data=data,
+                                headers=headers, files=files, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    '''Send requests through a :class:`requests.Session`. Responses are
+    the session's own.
+
+    :param session: The session to use, a new one by default.
+    :param timeout: Timeout of every request, in seconds.
+    '''
+
+    def __init__(self, session=None, timeout=None):
+        import requests
+
+        self.session = session if session is not None else requests.session()
+        super(RequestsTransport, self).__init__(timeout)
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    @headers.setter
+    def headers(self, headers):
+        # Keep the session's defaults, such as its User-Agent
+        self.session.headers.update(headers)
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                files=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, params=params, data=data,
+                                    headers=headers, files=files, **kwargs)
+
+    def mount(self, prefix, adapter):
+        self.session.mount(prefix, adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __getattr__(self, name):
+        # For code written against the session itself
+        if name == 'session':
+            raise AttributeError(name)
+        return getattr(self.session, name)
+
+
+class HTTP2Transport(Transport):
+    '''Send requests over HTTP/2 with :mod:`httpx`, so every concurrent
+    request to a device shares one connection instead of holding a
+    socket each. Needs httpx installed with its ``http2`` extra, and a
+    device serving HTTP/2, which in practice means over https.
+
+    :param timeout: Timeout of every request, in seconds.
+    :param kwargs: Passed on to :class:`httpx.Client`.
+    '''
+
+    def __init__(self, timeout=None, **kwargs):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HTTP/2 support needs httpx: '
+                              'pip install httpx[http2]')
+
+        super(HTTP2Transport, self).__init__(timeout)
+        self.client = httpx.Client(http2=True, timeout=timeout, **kwargs)
+        self.connection_errors = (httpx.TransportError,)
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                files=None, **kwargs):
+        r = self.client.request(method, url, params=params, content=data,
+                                headers=self.merge_headers(headers),
+                                files=files, **kwargs)
+        return Response(r.status_code, r.headers, r.content, str(r.url),
+                        r.reason_phrase)
+
+    def close(self):
+        self.client.close()
+
+
+class HeaderTransport(Transport):
+    '''Send requests through another transport with extra headers,
+    such as the api token, leaving that transport's own headers alone.
+    The other transport stays its owner's to close.
+
+    :param transport: The transport to send requests through.
+    :param headers: The headers added to every request.
+    '''
+
+    def __init__(self, transport, headers):
+        super(HeaderTransport, self).__init__(getattr(transport, 'timeout',
+                                                      None))
+        self.transport = transport
+        self.headers = dict(headers)
+        self.connection_errors = transport.connection_errors
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                files=None, **kwargs):
+        return self.transport.request(method, url, params=params, data=data,
+                                      headers=self.merge_headers(headers),
+                                      files=files, **kwargs)
+
+    def __getattr__(self, name):
+        if name == 'transport':
+            raise AttributeError(name)
+        return getattr(self.transport, name)
+
+
+class Request(object):
+    '''A request received by a :class:`MemoryTransport`.'''
+
+    def __init__(self, method, url, params=None, data=None, headers=None,
+                 files=None):
+        self.method = method
+        self.url = url
+        self.params = params
+        self.data = data
+        self.headers = headers
+        self.files = files
+
+    def json(self):
+        if self.data:
+            return codec.loads(self.data)
+
+    def __repr__(self):
+        return '<{} [{} {}]>'.format(self.__class__.__name__, self.method,
+                                     self.url)
+
+
+def make_response(status, body=None, headers=None, url=None):
+    '''Build a :class:`Response`. Bodies other than bytes are encoded
+    as json.'''
+    headers = dict(headers or {})
+    if isinstance(body, six.binary_type):
+        headers.setdefault('content-type', 'application/x-gzip')
+        content = body
+    else:
+        headers.setdefault('content-type', 'application/json')
+        content = codec.dumps(body)
+    return Response(status, headers, content, url)
+
+
+class MemoryTransport(Transport):
+    '''Answer requests from memory. Responses are either registered
+    ahead for a method and url with :meth:`add`, or built by a handler
+    called with each :class:`Request`, returning a :class:`Response`
+    or a ``(status, body)`` pair. Anything else is answered with a
+    404. Every request received is kept in :attr:`requests`.
+
+    :param handler: Optional function building responses.
+    '''
+
+    def __init__(self, handler=None):
+        super(MemoryTransport, self).__init__()
+        self.handler = handler
+        self.responses = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def add(self, method, url, body=None, status=200, headers=None):
+        '''Answer every request for method and url with body.'''
+        self.responses[method.upper(), url] = (status, body, headers)
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                files=None, json=None, **kwargs):
+        # Other options, such as timeout, mean nothing in memory
+        if json is not None:
+            data = codec.dumps(json)
+        request = Request(method, url, params, data,
+                          self.merge_headers(headers), files)
+        with self.lock:
+            self.requests.append(request)
+
+        registered = self.responses.get((method.upper(), url))
+        if registered is not None:
+            status, body, headers = registered
+            return make_response(status, body, headers, url)
+
+        result = self.handler(request) if self.handler else None
+        if result is None:
+            return make_response(404, {'status': False,
+                                       'error': 'Not Found'}, url=url)
+        if isinstance(result, Response):
+            return result
+        status, body = result
+        return make_response(status, body, url=url)
@@ -16,11 +16,10 @@ builder used to accumulate and store this information to render urls on
 demand.
 '''
 
-import json
-import itertools
-import requests
-from six.moves.urllib.parse import urljoin
-from .library import APIError, raise_from_json
+import six
+from six.moves.urllib.parse import quote
+from . import codec
+from .profiler import phase
 
 
 class APIResponse(object):
@@ -28,13 +27,23 @@ class APIResponse(object):
         self.mimetype = response.headers['content-type']
 
         if self.mimetype == 'application/json':
-            self.content = response.json()
+            with phase('decode'):
+                self.content = codec.decode(response)
         elif self.mimetype == 'application/x-gzip':
             self.content = response.content
         else:
+            from .library import APIError
             raise APIError("Unsupported content type: "
                            "{!r}".format(self.mimetype))
 
+    @classmethod
+    def fromcontent(cls, content, mimetype='application/json'):
+        '''Wrap already decoded content, for example from a cache.'''
+        response = cls.__new__(cls)
+        response.mimetype = mimetype
+        response.content = content
+        return response
+
     @property
     def data(self):
         if self.mimetype == 'application/json':
@@ -53,10 +62,15 @@ class APIResponse(object):
 def raise_for_status(r):
     """Raises stored :class:`requests.HTTPError`, if one occurred."""
 
+    # The library, and so requests, is only needed once something went
+    # wrong, keep it off the import path
     http_error_msg = None
     if 400 <= r.status_code < 500:
         if r.headers['content-type'] == 'application/json':
-            raise raise_from_json(r)
+            from .library import raise_from_json
+            with phase('errors'):
+                error = raise_from_json(r, codec.decode(r))
+            raise error
         http_error_msg = '{} Client Error: {} for url: '\
                          '{}'.format(r.status_code, r.reason, r.url)
     elif 500 <= r.status_code < 600:
@@ -64,6 +78,7 @@ def raise_for_status(r):
                          '{}'.format(r.status_code, r.reason, r.url)
 
     if http_error_msg:
+        import requests
         raise requests.HTTPError(http_error_msg, response=r)
 
 
@@ -76,15 +91,31 @@ def unpack_rest_response(r):
     return APIResponse(r)
 
 
+def quote_segment(segment):
+    '''Escape a single path segment so reserved characters, including
+    slashes, survive the trip into the url.'''
+    if not isinstance(segment, six.string_types):
+        segment = str(segment)
+    if six.PY2 and isinstance(segment, six.text_type):
+        segment = segment.encode('utf-8')
+    return quote(segment, safe='')
+
+
 class UrlBuilder(object):
     '''Builder for SAFe REST api urls. A functional structure which
     stores a path and allows itself to be cloned to append more
     information.
+
+    The rendered prefix for every (section, method) pair is cached on
+    the builder, so rendering a url only costs a concatenation plus
+    quoting of the trailing path.
     '''
 
     def __init__(self, base, segments=None):
         self.base = base
         self.segments = segments or ()
+        self.path = ''.join(quote_segment(s) + '/' for s in self.segments)
+        self.prefixes = {}
 
     def join(self, *segments):
         '''Create a new copy of the url builder with more segments
@@ -94,6 +125,18 @@ class UrlBuilder(object):
         '''
         return UrlBuilder(self.base, self.segments + segments)
 
+    def prefix(self, method, section='api'):
+        '''Render, and cache, the url up to and including this builder's
+        segments, with a trailing slash.'''
+        try:
+            return self.prefixes[section, method]
+        except KeyError:
+            parts = (section, method) if method else (section,)
+            prefix = self.base + ''.join(quote_segment(p) + '/' for p in parts)
+            prefix += self.path
+            self.prefixes[section, method] = prefix
+            return prefix
+
     def url(self, method, path=None, section='api'):
         '''Render a specific url to string.
 
@@ -102,9 +145,11 @@ class UrlBuilder(object):
         :param method: The optional method, if generating a method call.
         :type method: str
         '''
-        prefix = (section, method) if method else (section,)
-        segments = itertools.chain(prefix, self.segments, path or [])
-        return urljoin(self.base, '/'.join(segments))
+        with phase('url'):
+            prefix = self.prefix(method, section)
+            if path:
+                return prefix + '/'.join(quote_segment(p) for p in path)
+            return prefix[:-1]
 
 
 def url_builder(host, port=80, scheme='http'):
@@ -127,18 +172,24 @@ def url_builder(host, port=80, scheme='http'):
     return UrlBuilder(base_url)
 
 
-def get_documentation(host, port=80, scheme='http', token=None, timeout=None):
+def get_documentation(host, port=80, scheme='http', token=None, timeout=None,
+                      transport=None):
+    from .transport import RequestsTransport
+
     headers = {}
     if token:
         headers['X-API-KEY'] = token
 
     builder = url_builder(host, port, scheme)
     safeurl = builder.url(None, section='doc')
-    r = requests.get(safeurl, headers=headers, timeout=timeout)
+    if transport is not None:
+        r = transport.get(safeurl, headers=headers)
+    else:
+        with RequestsTransport(timeout=timeout) as transport:
+            r = transport.get(safeurl, headers=headers)
     return unpack_rest_response(r).content
 
 
 def dump_docs(filepath, *args, **kwargs):
-    with open(filepath, 'w') as fp:
-        json.dump(get_documentation(*args, **kwargs),
-                  fp, sort_keys=True, indent=4, separators=(',', ': '))
+    with open(filepath, 'wb') as fp:
+        fp.write(codec.dumps(get_documentation(*args, **kwargs), pretty=True))
@@ -0,0 +1,88 @@
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+
+# Copyright (C) 2016  Sangoma Technologies Corp.
+# All Rights Reserved.
+# Author(s)
+# Simon Gomizelj <sgomizelj@sangoma.com>
+
+'''Cheap polling of SAFe objects for changes.
+
+Requests are made conditional with ``If-None-Match`` and
+``If-Modified-Since`` whenever the device provided an ``ETag`` or
+``Last-Modified`` header. When it didn't, the body is hashed and
+compared with the previous one, so unchanged responses are never
+decoded::
+
+    >>> for status in api.nsc.configuration.watch('status', interval=5):
+    ...     print(safe.library.parse_messages(status))
+'''
+
+import time
+import hashlib
+from .url import APIResponse, raise_for_status
+
+
+class Poller(object):
+    '''Conditionally poll a single GET method of an object.
+
+    :param api: The :class:`safe.api.APIWrapper` of the object.
+    :param method: The name of the method to poll.
+    :param path: Optional extra path segments.
+    :param params: Optional query parameters.
+    '''
+
+    def __init__(self, api, method, path=None, params=None):
+        self.api = api
+        self.url = api.builder.url(method, path=path)
+        self.params = params or None
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.response = None
+
+    def poll(self):
+        '''Fetch the method again. Returns the new
+        :class:`safe.url.APIResponse` if it changed since the last poll,
+        otherwise None.'''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        r = self.api.session.get(self.url, params=self.params,
+                                 headers=headers)
+        if r.status_code == 304:
+            return None
+
+        raise_for_status(r)
+        self.etag = r.headers.get('etag')
+        self.last_modified = r.headers.get('last-modified')
+
+        digest = hashlib.sha1(r.content).digest()
+        if digest == self.digest:
+            return None
+
+        self.digest = digest
+        self.response = APIResponse(r)
+        return self.response
+
+
+def watch(obj, method='retrieve', interval=5.0, *args, **kwargs):
+    '''Poll a method of a generated object every interval seconds,
+    yielding its data the first time and then only when it changes.
+
+    :param obj: The generated object to watch, for example
+        ``api.nsc.configuration``.
+    :param method: The GET method to poll.
+    :type method: str
+    :param interval: Seconds between polls.
+    :type interval: float
+    '''
+    poller = Poller(obj.api, method, path=args, params=kwargs)
+    while True:
+        start = time.time()
+        response = poller.poll()
+        if response is not None:
+            yield response.data
+        time.sleep(max(0, start + interval - time.time()))
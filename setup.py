@@ -9,7 +9,9 @@ setup_params = dict(
     author_email='sgomizelj@sangoma.com',
     url='http://github.com/sangoma/safepy2',
     packages=setuptools.find_packages(),
+    entry_points={'console_scripts': ['safe = safe.cli:main']},
     install_requires=['six', 'requests'],
+    extras_require={'speedups': ['orjson'], 'http2': ['httpx[http2]']},
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
     classifiers=['Development Status :: 3 - Alpha',
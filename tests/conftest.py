@@ -0,0 +1,113 @@
+import pytest
+from six.moves.urllib.parse import unquote
+from safe.transport import MemoryTransport
+
+
+class Device(object):
+    '''A SAFe device held in memory, answering requests through a
+    :class:`safe.transport.MemoryTransport`.
+
+    Collections are maps of key to data, stored under their path, and
+    answer list, retrieve, create, update and delete. Other objects
+    answer retrieve and update. Any other method is answered by the
+    function registered for it in :attr:`handlers`, under the method
+    and the path of the object, and called with the remaining path
+    segments and the decoded body.
+    '''
+
+    def __init__(self, spec, collections=None, objects=None, host='gw',
+                 version=(2, 3, 1)):
+        self.spec = spec
+        self.collections = dict((path, dict(members)) for path, members
+                                in (collections or {}).items())
+        self.objects = dict((path, dict(data)) for path, data
+                            in (objects or {}).items())
+        self.handlers = {}
+
+        root = 'http://{}:80/SAFe/sng_rest/'.format(host)
+        self.base = root + 'api/'
+        self.doc_url = root + 'doc'
+        self.config_url = root + 'config'
+
+        self.transport = MemoryTransport(self.handle)
+        self.transport.add('GET', self.doc_url, spec)
+        self.transport.add('GET', self.base + 'retrieve/nsc/version', {
+            'status': True, 'data': {'major_version': str(version[0]),
+                                     'minor_version': str(version[1]),
+                                     'patch_version': str(version[2])}})
+
+    @property
+    def requests(self):
+        return self.transport.requests
+
+    def sent(self, method):
+        '''Return the paths of every request made for method.'''
+        prefix = self.base + method + '/'
+        return [r.url[len(prefix):] for r in self.requests
+                if r.url.startswith(prefix)]
+
+    def missing(self, path, method, key):
+        return 404, {'status': False, 'module': path.split('/')[0],
+                     'method': method, 'name': key,
+                     'error': {'message': 'Not Found'}}
+
+    def handle(self, request):
+        if not request.url.startswith(self.base):
+            return None
+
+        method, _, rest = request.url[len(self.base):].partition('/')
+        segments = [unquote(s) for s in rest.split('/')] if rest else []
+        data = request.json()
+
+        for i in range(len(segments), -1, -1):
+            handler = self.handlers.get((method, '/'.join(segments[:i])))
+            if handler is not None:
+                return 200, {'status': True,
+                             'data': handler(segments[i:], data)}
+
+        path = '/'.join(segments)
+        if path in self.collections and method == 'list':
+            members = self.collections[path]
+            keys = sorted(members)
+            if data and data.get('filter'):
+                keys = [key for key in keys if all(
+                    members[key].get(field) == value
+                    for field, value in data['filter'].items())]
+            return 200, {'status': True, 'data': keys}
+
+        if path in self.objects:
+            if method == 'retrieve':
+                return 200, {'status': True, 'data': self.objects[path]}
+            if method == 'update':
+                self.objects[path].update(data or {})
+                return 200, {'status': True}
+
+        if not segments:
+            return None
+        parent, key = '/'.join(segments[:-1]), segments[-1]
+        members = self.collections.get(parent)
+        if members is None:
+            return None
+
+        if method == 'create':
+            if key in members:
+                return 409, {'status': False, 'name': key,
+                             'error': {'message': 'Conflict'}}
+            members[key] = dict(data or {})
+            return 200, {'status': True}
+        if key not in members:
+            return self.missing(parent, method, key)
+        if method == 'retrieve':
+            return 200, {'status': True, 'data': members[key]}
+        if method == 'update':
+            members[key].update(data or {})
+            return 200, {'status': True}
+        if method == 'delete':
+            del members[key]
+            return 200, {'status': True}
+
+
+@pytest.fixture
+def make_device():
+    '''Build in-memory devices, see :class:`Device`.'''
+    return Device
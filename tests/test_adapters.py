@@ -0,0 +1,153 @@
+import json
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+import safe.adapters
+from safe.adapters import (LimitedAdapter, RecordingAdapter, ReplayAdapter,
+                           endpoint)
+from safe.concurrency import AdaptiveLimiter
+from safe.url import url_builder, unpack_rest_response
+
+
+class MockAdapter(BaseAdapter):
+    def __init__(self):
+        super(MockAdapter, self).__init__()
+        self.count = 0
+
+    def send(self, request, **kwargs):
+        self.count += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers['content-type'] = 'application/json'
+        response._content = json.dumps({
+            'status': True,
+            'data': {'count': self.count, 'body': request.body},
+        }).encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def session_with(adapter):
+    session = requests.session()
+    session.mount('http://192.0.2.1:80', adapter)
+    return session
+
+
+@pytest.mark.parametrize('filename', ['cassette.jsonl', 'cassette.jsonl.gz'])
+def test_record_replay(tmpdir, filename):
+    cassette = str(tmpdir.join(filename))
+    builder = url_builder('192.0.2.1').join('sip', 'profile')
+
+    session = session_with(RecordingAdapter(cassette, MockAdapter()))
+    recorded = [unpack_rest_response(session.get(builder.url('list'))).data,
+                unpack_rest_response(session.get(builder.url('list'))).data,
+                unpack_rest_response(session.post(builder.url('create'),
+                                                  data='{"a":1}')).data]
+    session.close()
+
+    session = session_with(ReplayAdapter(cassette))
+    replayed = [unpack_rest_response(session.get(builder.url('list'))).data,
+                unpack_rest_response(session.get(builder.url('list'))).data,
+                unpack_rest_response(session.post(builder.url('create'),
+                                                  data='{"a":1}')).data]
+
+    assert replayed == recorded
+    assert replayed[0]['count'] == 1
+    assert replayed[1]['count'] == 2
+
+    # Exhausted recordings keep serving the last response
+    assert unpack_rest_response(session.get(builder.url('list'))).data == recorded[1]
+
+    with pytest.raises(requests.ConnectionError):
+        session.get(builder.url('retrieve', path=['missing']))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class ScriptedAdapter(BaseAdapter):
+    '''Answer every request with the status and latency, on a fake
+    clock, given by respond.'''
+
+    def __init__(self, clock, respond):
+        super(ScriptedAdapter, self).__init__()
+        self.clock = clock
+        self.respond = respond
+
+    def send(self, request, **kwargs):
+        status, latency = self.respond(request)
+        self.clock.now += latency
+        if status is None:
+            raise requests.ConnectionError('Connection refused')
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers['content-type'] = 'application/json'
+        response._content = b'{"status": true}'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_endpoint():
+    builder = url_builder('192.0.2.1').join('sip', 'profile')
+    internal = requests.Request('GET', builder.url('retrieve',
+                                                   path=['internal']))
+    external = requests.Request('GET', builder.url('retrieve',
+                                                   path=['external']))
+    doc = requests.Request('GET', url_builder('192.0.2.1').url(
+        None, section='doc'))
+
+    assert endpoint(internal) == endpoint(external) == \
+        ('GET', 'api', 'retrieve', 'sip', 'profile')
+    assert endpoint(doc) == ('GET', 'doc')
+
+
+def test_limited_adapter(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(safe.adapters, 'time', clock)
+    builder = url_builder('192.0.2.1')
+    profiles = builder.join('sip', 'profile').url('list')
+    backup = builder.join('nsc', 'backup').url('download', path=['full'])
+
+    responses = {profiles: (200, 0.01), backup: (200, 2.0)}
+    limiter = AdaptiveLimiter(initial=8, maximum=16)
+    session = session_with(LimitedAdapter(
+        limiter, ScriptedAdapter(clock, lambda r: responses[r.url])))
+
+    for _ in range(10):
+        assert session.get(profiles).status_code == 200
+    assert limiter.limit == 8
+
+    # Inherently slow calls are only compared to each other
+    for _ in range(3):
+        session.get(backup)
+    assert limiter.limit == 8
+
+    # A list suddenly taking fifty times as long is congestion
+    responses[profiles] = (200, 0.5)
+    session.get(profiles)
+    assert limiter.limit == 4
+
+    responses[profiles] = (503, 0.01)
+    assert session.get(profiles).status_code == 503
+    assert limiter.limit == 2
+
+    responses[profiles] = (None, 0.01)
+    with pytest.raises(requests.ConnectionError):
+        session.get(profiles)
+    assert limiter.limit == 1
+    assert limiter.inflight == 0
@@ -0,0 +1,66 @@
+import pytest
+import safe.url
+from safe.api import API, APIWrapper, add_children, build_api
+from safe.parser import parse
+
+
+def profile_ast():
+    return parse({
+        "sip": {
+            "name": "SIP",
+            "object": {
+                "profile": {
+                    "name": "Profile",
+                    "methods": {
+                        "list": {"request": "GET"},
+                        "retrieve": {"request": "GET"},
+                        "stop": {"request": "POST"}
+                    },
+                    "object": {
+                        "limit": {
+                            "name": "Limit",
+                            "methods": {"list": {"request": "GET"}}
+                        }
+                    }
+                }
+            }
+        }
+    })
+
+
+def profile_collection():
+    builder = safe.url.url_builder('192.0.2.1')
+    root = APIWrapper(None, (2, 3, 0), None, builder)
+    api_cls = type('API', (API,), dict(add_children(profile_ast())))
+    return api_cls(root).sip.profile
+
+
+def test_member_types_are_shared():
+    profiles = profile_collection()
+    internal = profiles.api.get_child('internal')
+    external = profiles.api.get_child('external')
+
+    assert type(internal) is type(external)
+    assert type(internal).__name__ == 'Profile'
+    assert internal.ident == 'internal'
+    assert hasattr(internal, 'stop')
+
+
+def test_member_urls():
+    profiles = profile_collection()
+    internal = profiles.api.get_child('internal')
+
+    assert internal.api.builder.url('stop') == \
+        'http://192.0.2.1:80/SAFe/sng_rest/api/stop/sip/profile/internal'
+    assert internal.limit.api.builder.url('list') == \
+        'http://192.0.2.1:80/SAFe/sng_rest/api/list/sip/profile/internal/limit'
+
+
+def test_resolve():
+    builder = safe.url.url_builder('192.0.2.1')
+    api = build_api(APIWrapper(None, (2, 3, 0), None, builder), profile_ast())
+
+    assert api.resolve('sip/profile') is api.sip.profile
+    assert api.resolve(('sip', 'profile')) is api.sip.profile
+    with pytest.raises(KeyError):
+        api.resolve('sip/trunk')
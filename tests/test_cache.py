@@ -0,0 +1,129 @@
+import threading
+import pytest
+import safe
+from safe.cache import MemoryCache, SQLiteCache, make_key, make_prefix
+from safe.library import APIError
+
+
+BASE = 'http://192.0.2.1:80/SAFe/sng_rest/'
+VERSION = (2, 3, 1)
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                    "update": {"request": "POST"},
+                    "delete": {"request": "POST"}
+                }
+            }
+        }
+    }
+}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmpdir):
+    if request.param == 'memory':
+        cache = MemoryCache()
+    else:
+        cache = SQLiteCache(str(tmpdir.join('cache.db')))
+    with cache:
+        yield cache
+
+
+def test_get_set(cache):
+    key = make_key(BASE, VERSION, 'network/ip/ip_1/', 'retrieve')
+    assert cache.get(key) is None
+
+    cache.set(key, {'address': '192.0.2.1'})
+    assert cache.get(key) == {'address': '192.0.2.1'}
+
+
+def test_expiry(cache):
+    key = make_key(BASE, VERSION, 'nsc/version/', 'retrieve')
+    cache.set(key, {'major_version': '2'}, ttl=-1)
+    assert cache.get(key) is None
+
+
+def test_invalidate(cache):
+    keys = [make_key(BASE, VERSION, path, 'retrieve')
+            for path in ('sip/profile/a/', 'sip/profile/a/limit/b/',
+                         'sip/profile/ab/', 'network/ip/ip_1/')]
+    for key in keys:
+        cache.set(key, {})
+
+    cache.invalidate(make_prefix(BASE, VERSION, 'sip/profile/a/'))
+    assert [cache.get(key) for key in keys] == [None, None, {}, {}]
+
+
+def test_version_isolation(cache):
+    cache.set(make_key(BASE, VERSION, '', 'doc'), {'sip': {}})
+    assert cache.get(make_key(BASE, (2, 3, 2), '', 'doc')) is None
+
+
+def test_sqlite_close(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    key = make_key(BASE, VERSION, 'nsc/version/', 'retrieve')
+
+    with SQLiteCache(path) as cache:
+        cache.set(key, {'major_version': '2'})
+        thread = threading.Thread(target=cache.get, args=(key,))
+        thread.start()
+        thread.join()
+        connections = list(cache.connections)
+        assert len(connections) == 2
+
+    assert cache.connections == []
+    for db in connections:
+        with pytest.raises(Exception):
+            db.execute('SELECT 1')
+
+    # Closing only drops the connections, not the entries
+    assert cache.get(key) == {'major_version': '2'}
+    cache.close()
+
+
+def test_api_cache(cache, make_device):
+    device = make_device(SPEC, collections={
+        'sip/profile': {'internal': {'sip-port': '5060'}}})
+    profiles = safe.api('gw', transport=device.transport,
+                        cache=cache).sip.profile
+
+    def retrieves():
+        return len([path for path in device.sent('retrieve')
+                    if path.startswith('sip/')])
+
+    assert profiles.retrieve('internal') == {'sip-port': '5060'}
+    assert profiles['internal'].retrieve() == {'sip-port': '5060'}
+    assert retrieves() == 1
+
+    # The specification is cached as well
+    again = safe.api('gw', transport=device.transport, cache=cache)
+    assert again.sip.profile.retrieve('internal') == {'sip-port': '5060'}
+    assert len([r for r in device.requests if r.url == device.doc_url]) == 1
+    assert retrieves() == 1
+
+    # Writes through either api invalidate what's below them
+    again.sip.profile['internal'].update({'sip-port': '5070'})
+    assert profiles.retrieve('internal') == {'sip-port': '5070'}
+    assert retrieves() == 2
+
+    profiles.update('internal', {'sip-port': '5080'})
+    assert profiles['internal'].retrieve() == {'sip-port': '5080'}
+    assert retrieves() == 3
+
+    profiles.create('external', {'sip-port': '5090'})
+    assert profiles.retrieve('external') == {'sip-port': '5090'}
+    assert profiles.keys() == ['external', 'internal']
+
+    profiles.delete('internal')
+    with pytest.raises(APIError):
+        profiles.retrieve('internal')
+    assert profiles.keys() == ['external']
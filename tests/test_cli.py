@@ -0,0 +1,175 @@
+import io
+import json
+import threading
+from safe.cli import Runner, read_operations
+from safe.raw import RawClient
+
+
+class MockClient(object):
+    def __init__(self):
+        self.objects = {}
+        self.history = {}
+        self.lock = threading.Lock()
+
+    def record(self, key, what):
+        with self.lock:
+            self.history.setdefault(key, []).append(what)
+
+    def create(self, path, key, data):
+        if key in self.objects:
+            raise ValueError('Conflict')
+        self.objects[key] = data
+        self.record(key, 'create')
+
+    def update(self, path, data, key=None):
+        self.objects[key].update(data)
+        self.record(key, 'update')
+
+    def delete(self, path, key):
+        del self.objects[key]
+        self.record(key, 'delete')
+
+    def call(self, path, method, *args, **kwargs):
+        if args[0] not in self.objects:
+            raise KeyError(args[0])
+        self.record(args[0], method)
+
+
+def stream(*operations):
+    lines = [json.dumps(op) if isinstance(op, dict) else op
+             for op in operations]
+    return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+
+def test_read_operations():
+    operations = list(read_operations(stream({'op': 'delete'}, '', '# comment',
+                                             'garbage')))
+    assert operations[0] == (1, {'op': 'delete'})
+    assert operations[1][0] == 4
+    assert isinstance(operations[1][1], ValueError)
+
+
+def test_runner():
+    clients = {'a': MockClient(), 'b': MockClient()}
+    operations = []
+    for i in range(50):
+        key = 'p{}'.format(i)
+        operations.append({'op': 'create', 'path': 'sip/profile', 'key': key,
+                           'data': {'sip-port': i}})
+        operations.append({'op': 'update', 'path': 'sip/profile', 'key': key,
+                           'data': {'sip-port': i + 1}})
+    operations.append({'op': 'delete', 'path': 'sip/profile', 'key': 'p0',
+                       'host': 'b'})
+    operations.append({'op': 'create', 'path': 'sip/profile', 'key': 'p1',
+                       'host': 'a'})
+
+    output, status = io.StringIO(), io.StringIO()
+    runner = Runner(clients, workers=4, progress=60, output=output,
+                    status=status)
+    runner.run(read_operations(stream(*operations)))
+
+    assert runner.done == 202
+    assert runner.failures == {'a': 1, 'b': 0}
+    assert clients['a'].objects['p7'] == {'sip-port': 8}
+    assert 'p0' not in clients['b'].objects
+
+    failure = json.loads(output.getvalue())
+    assert failure['host'] == 'a'
+    assert failure['key'] == 'p1'
+    assert failure['error'] == 'Conflict'
+
+
+def lifecycle(key):
+    return [
+        {'op': 'create', 'path': 'sip/profile', 'key': key,
+         'data': {'sip-port': 5080}},
+        {'op': 'update', 'path': 'sip/profile', 'key': key,
+         'data': {'sip-port': 5090}},
+        {'op': 'call', 'path': 'sip/profile', 'method': 'stop',
+         'args': [key]},
+        {'op': 'delete', 'path': 'sip/profile', 'key': key},
+    ]
+
+
+def test_calls_routed_with_their_object():
+    runner = Runner({'a': MockClient()}, workers=8)
+    for lineno, operation in enumerate(lifecycle('example'), 1):
+        runner.submit(lineno, operation)
+
+    queued = [tasks.qsize() for tasks in runner.queues]
+    assert sorted(queued) == [0] * 7 + [4]
+
+
+def test_operations_on_an_object_keep_input_order():
+    client = MockClient()
+    operations = [operation for i in range(50)
+                  for operation in lifecycle('p{}'.format(i))]
+
+    runner = Runner({'a': client}, workers=8, progress=60,
+                    output=io.StringIO(), status=io.StringIO())
+    runner.run(read_operations(stream(*operations)))
+
+    assert runner.failed == 0
+    assert client.objects == {}
+    assert all(history == ['create', 'update', 'stop', 'delete']
+               for history in client.history.values())
+
+
+def test_unknown_host():
+    client = MockClient()
+    operations = [
+        {'op': 'create', 'path': 'sip/profile', 'key': 'a', 'host': 'gw9'},
+        {'op': 'create', 'path': 'sip/profile', 'key': 'b', 'host': ['a']},
+        {'op': 'create', 'path': 'sip/profile', 'key': 'c'},
+    ]
+
+    output = io.StringIO()
+    runner = Runner({'a': client}, workers=2, progress=60, output=output,
+                    status=io.StringIO())
+    runner.run(read_operations(stream(*operations)))
+
+    # The rest of the input still ran, and host a can still commit
+    assert list(client.objects) == ['c']
+    assert runner.failures == {'a': 0}
+    assert runner.failed == 2
+    errors = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(error['host'], error['error']) for error in errors] == \
+        [('gw9', 'Unknown host'), (['a'], 'Unknown host')]
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                    "update": {"request": "POST"},
+                    "delete": {"request": "POST"},
+                    "stop": {"request": "POST"}
+                }
+            }
+        }
+    }
+}
+
+
+def test_calls_without_spec(make_device):
+    device = make_device(SPEC, collections={'sip/profile': {}})
+    stopped = []
+    device.handlers['stop', 'sip/profile'] = \
+        lambda args, data: stopped.append(args[0])
+
+    # As given without --spec
+    client = RawClient('gw', transport=device.transport)
+    runner = Runner({'gw': client}, workers=2, progress=60,
+                    output=io.StringIO(), status=io.StringIO())
+    runner.run(read_operations(stream(*lifecycle('example'))))
+
+    assert runner.failed == 0
+    assert stopped == ['example']
+    assert [r.method for r in device.requests
+            if '/stop/' in r.url] == ['POST']
@@ -0,0 +1,92 @@
+import pytest
+from six.moves import reload_module
+import safe.codec
+import safe.url
+
+
+@pytest.fixture
+def codec(monkeypatch):
+    '''The codec, back to selecting its backend on first use.'''
+    monkeypatch.delenv('SAFEPY_JSON', raising=False)
+    yield reload_module(safe.codec)
+    reload_module(safe.codec)
+
+
+def unavailable():
+    raise ImportError('not installed')
+
+
+@pytest.mark.parametrize('backend', ['orjson', 'ujson', 'json'])
+def test_roundtrip(codec, backend):
+    try:
+        codec.set_backend(backend)
+    except ImportError:
+        pytest.skip('{} is not installed'.format(backend))
+
+    payload = {'sip-ip': 'ip_3', 'sip-port': 5080, 'name': u'caf\xe9'}
+    encoded = codec.dumps(payload)
+    assert isinstance(encoded, bytes)
+    assert codec.loads(encoded) == payload
+    assert codec.loads(encoded.decode('utf-8')) == payload
+
+    # Keys other than strings are converted, like the standard library
+    assert codec.loads(codec.dumps({5060: 'internal'})) == \
+        {'5060': 'internal'}
+    assert codec.loads(codec.dumps(payload, pretty=True)) == payload
+
+
+def test_pretty_is_the_same_for_every_backend(codec):
+    payload = {'sip': {'name': u'caf\xe9', 'url': '/sip/profile',
+                       'ports': [5060, 5080], 'ratio': 0.1}}
+    encoded = set()
+    for backend in codec.BACKENDS:
+        try:
+            codec.set_backend(backend)
+        except ImportError:
+            continue
+        encoded.add(codec.dumps(payload, pretty=True))
+
+    codec.set_backend('json')
+    assert encoded == set([codec.dumps(payload, pretty=True)])
+    assert codec.dumps(payload, pretty=True).startswith(b'{\n    "sip"')
+
+
+def test_default_backend(codec, monkeypatch):
+    monkeypatch.setitem(codec._loaders, 'orjson', unavailable)
+    monkeypatch.setitem(codec._loaders, 'ujson', unavailable)
+
+    assert codec.loads(b'{"status": true}') == {'status': True}
+    assert codec.backend == 'json'
+
+
+def test_backend_from_environment(codec, monkeypatch):
+    monkeypatch.setenv('SAFEPY_JSON', 'json')
+    assert codec.dumps([1]) == b'[1]'
+    assert codec.backend == 'json'
+
+
+def test_bad_backend_from_environment(codec, monkeypatch):
+    monkeypatch.setenv('SAFEPY_JSON', 'yaml')
+    with pytest.raises(ValueError):
+        codec.loads(b'{}')
+    assert codec.backend is None
+
+
+def test_missing_backend(codec, monkeypatch):
+    monkeypatch.setitem(codec._loaders, 'orjson', unavailable)
+    monkeypatch.setenv('SAFEPY_JSON', 'orjson')
+    with pytest.raises(ImportError):
+        codec.dumps({})
+    assert codec.backend is None
+
+
+def test_dump_docs(tmpdir, make_device):
+    spec = {'sip': {'name': 'SIP', 'object': {}}}
+    device = make_device(spec)
+    path = str(tmpdir.join('doc.json'))
+
+    safe.url.dump_docs(path, 'gw', transport=device.transport)
+    with open(path, 'rb') as fp:
+        content = fp.read()
+    assert b'\n' in content
+    assert safe.codec.loads(content) == spec
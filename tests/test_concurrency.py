@@ -0,0 +1,214 @@
+import copy
+import time
+import threading
+import pytest
+from safe.concurrency import (AdaptiveLimiter, Call, GraphRunner, ReadAhead,
+                              SingleFlight)
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def run_flight(monkeypatch, func, callers=5, flights=None):
+    '''Call func through a SingleFlight from several threads at once,
+    only letting the leader finish once every other caller is waiting
+    on it. Returns what each caller got, a result or an exception.'''
+    flights = flights if flights is not None else SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    waiting = threading.Condition()
+    followers = []
+
+    wait = Call.wait
+
+    def counted_wait(call):
+        with waiting:
+            followers.append(call)
+            waiting.notify_all()
+        return wait(call)
+
+    monkeypatch.setattr(Call, 'wait', counted_wait)
+
+    def leader():
+        started.set()
+        release.wait()
+        return func()
+
+    outcomes = []
+
+    def worker():
+        try:
+            outcomes.append(flights.do('list', leader))
+        except BaseException as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(callers)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+
+    with waiting:
+        while len(followers) < callers - 1:
+            waiting.wait()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not flights.calls
+    return outcomes
+
+
+def test_single_flight_shares_result(monkeypatch):
+    calls = []
+
+    def func():
+        calls.append(1)
+        return {'data': ['internal']}
+
+    results = run_flight(monkeypatch, func)
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_single_flight_copies_result(monkeypatch):
+    calls = []
+
+    def func():
+        calls.append(1)
+        return {'data': ['internal']}
+
+    results = run_flight(monkeypatch, func,
+                         flights=SingleFlight(copy.deepcopy))
+    assert len(calls) == 1
+    assert all(result == {'data': ['internal']} for result in results)
+    assert len(set(id(result) for result in results)) == 5
+    assert len(set(id(result['data']) for result in results)) == 5
+
+    # Without anyone to share with, nothing is copied
+    flights = SingleFlight(copy.deepcopy)
+    result = {'data': []}
+    assert flights.do('list', lambda: result) is result
+
+
+def test_single_flight_shares_errors(monkeypatch):
+    def failing():
+        raise ValueError('boom')
+
+    errors = run_flight(monkeypatch, failing)
+    assert len(errors) == 5
+    assert isinstance(errors[0], ValueError)
+    assert all(error is errors[0] for error in errors)
+
+
+def test_single_flight_shares_interrupts(monkeypatch):
+    def interrupted():
+        raise Interrupted()
+
+    errors = run_flight(monkeypatch, interrupted)
+    assert len(errors) == 5
+    assert all(isinstance(error, Interrupted) for error in errors)
+
+
+def test_limiter_additive_increase():
+    limiter = AdaptiveLimiter(initial=2, maximum=4)
+    for _ in range(50):
+        tokens = [limiter.acquire() for _ in range(int(limiter.limit))]
+        for token in tokens:
+            limiter.release(token, latency=0.01)
+
+    assert limiter.limit == 4
+    assert limiter.inflight == 0
+
+
+def test_limiter_single_decrease_per_window():
+    limiter = AdaptiveLimiter(initial=8)
+    tokens = [limiter.acquire() for _ in range(8)]
+    for token in tokens:
+        limiter.release(token, failed=True)
+
+    assert limiter.limit == 4
+
+
+def test_limiter_latency_congestion():
+    limiter = AdaptiveLimiter(initial=8, tolerance=2.0)
+    limiter.release(limiter.acquire(), latency=0.01)
+    before = limiter.limit
+    limiter.release(limiter.acquire(), latency=0.5)
+
+    assert limiter.limit == before / 2
+
+
+def test_graph_runner_order():
+    order = []
+    prerequisites = {'a': [], 'b': ['a'], 'c': ['a'], 'd': ['b', 'c']}
+    failures, skipped = GraphRunner(prerequisites, workers=4).run(order.append)
+
+    assert not failures and not skipped
+    assert order[0] == 'a'
+    assert order[-1] == 'd'
+    assert sorted(order) == ['a', 'b', 'c', 'd']
+
+
+def test_graph_runner_skips_after_failure():
+    def func(node):
+        if node == 'b':
+            raise ValueError(node)
+
+    prerequisites = {'a': [], 'b': ['a'], 'c': ['b'], 'd': ['a']}
+    failures, skipped = GraphRunner(prerequisites).run(func)
+
+    assert list(failures) == ['b']
+    assert skipped == set(['c'])
+
+
+def test_graph_runner_cycle():
+    with pytest.raises(ValueError):
+        GraphRunner({'a': ['b'], 'b': ['a']})
+
+
+def test_read_ahead_order():
+    def slow(item):
+        time.sleep(0.01 * (item % 3))
+        return item * 2
+
+    assert list(ReadAhead(slow, range(20), window=4)) == \
+        [(i, i * 2) for i in range(20)]
+
+
+def test_read_ahead_bounded():
+    started = []
+    release = threading.Event()
+
+    def func(item):
+        started.append(item)
+        release.wait()
+        return item
+
+    reader = ReadAhead(func, range(100), window=3)
+    time.sleep(0.05)
+    assert len(started) == 3
+
+    release.set()
+    assert next(reader) == (0, 0)
+    reader.close()
+    time.sleep(0.05)
+    # The one slot freed by the consumer allowed at most one more call
+    assert len(started) <= 4
+    assert list(reader) == []
+
+
+def test_read_ahead_error():
+    def func(item):
+        if item == 2:
+            raise ValueError(item)
+        return item
+
+    reader = ReadAhead(func, range(5), window=2)
+    assert next(reader) == (0, 0)
+    assert next(reader) == (1, 1)
+    with pytest.raises(ValueError):
+        next(reader)
+    reader.close()
@@ -0,0 +1,163 @@
+import copy
+import requests
+import safe
+from safe.drift import (DigestStore, DigestTree, compare, config_paths,
+                        configuration, digest, fleet)
+
+
+GOLDEN = {
+    'network': {'ip': {'ip_1': {'address': '192.0.2.1', 'interface': 'eth0'}}},
+    'sip': {'profile': {
+        'internal': {'sip-ip': 'ip_1', 'sip-port': '5060'},
+        'external': {'sip-ip': 'ip_1', 'sip-port': '5080'},
+    }},
+}
+
+
+def test_digest_stable():
+    assert digest(GOLDEN) == digest(copy.deepcopy(GOLDEN))
+    assert digest({'a': 1, 'b': [1, 2]}).digest == \
+        digest({'b': [1, 2], 'a': 1}).digest
+    assert digest({'a': '1'}).digest != digest({'a': 1}).digest
+
+
+def test_compare():
+    config = copy.deepcopy(GOLDEN)
+    config['sip']['profile']['internal']['sip-port'] = '5070'
+    del config['sip']['profile']['external']
+    config['network']['ip']['ip_3'] = {'address': '198.51.100.5'}
+
+    drift = compare(digest(GOLDEN), digest(config))
+    assert drift.changed == [('sip', 'profile', 'internal', 'sip-port')]
+    assert drift.removed == [('sip', 'profile', 'external')]
+    assert drift.added == [('network', 'ip', 'ip_3')]
+    assert not compare(digest(GOLDEN), digest(GOLDEN))
+
+
+def test_serialization(tmpdir):
+    tree = digest(GOLDEN)
+    path = str(tmpdir.join('golden.json'))
+    tree.save(path)
+
+    loaded = DigestTree.load(path)
+    assert loaded == tree
+    assert loaded.get('sip/profile/internal') == \
+        tree.children['sip'].children['profile'].children['internal']
+
+    store = DigestStore(str(tmpdir.join('fleet.json')))
+    store.set('gw1', tree)
+    store.save()
+    assert DigestStore(store.path).get('gw1') == tree
+
+
+METHODS = {
+    "list": {"request": "GET"},
+    "retrieve": {"request": "GET"},
+}
+
+SPEC = {
+    "network": {
+        "name": "Network",
+        "object": {
+            "ip": {"name": "IP", "configurable": True, "methods": METHODS},
+            "status": {"name": "Status", "singleton": True,
+                       "methods": {"retrieve": {"request": "GET"}}}
+        }
+    },
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "configurable": True,
+                "methods": METHODS,
+                "object": {
+                    "gateway": {"name": "Gateway", "configurable": True,
+                                "methods": METHODS}
+                }
+            },
+            "settings": {"name": "Settings", "singleton": True,
+                         "configurable": True,
+                         "methods": {"retrieve": {"request": "GET"}}}
+        }
+    }
+}
+
+
+def make_gateway(make_device, host='gw'):
+    golden = copy.deepcopy(GOLDEN)
+    return make_device(SPEC, host=host, collections={
+        'network/ip': golden['network']['ip'],
+        'sip/profile': golden['sip']['profile'],
+        'sip/profile/internal/gateway': {'carrier': {'proxy': '192.0.2.9'}},
+    }, objects={
+        'network/status': {'uptime': 12345},
+        'sip/settings': {'log-level': 'info'},
+    })
+
+
+def connect(device, host='gw'):
+    return safe.api(host, transport=device.transport)
+
+
+def test_config_paths(make_device):
+    api = connect(make_gateway(make_device))
+    assert config_paths(api.spec_index) == [('network', 'ip'),
+                                            ('sip', 'profile'),
+                                            ('sip', 'settings')]
+
+
+def test_configuration_download(make_device):
+    device = make_gateway(make_device)
+    device.transport.add('GET', device.config_url, GOLDEN)
+    assert configuration(connect(device)) == GOLDEN
+    assert device.sent('retrieve') == ['nsc/version']
+
+
+def test_configuration_fallback(make_device):
+    device = make_gateway(make_device)
+    expected = copy.deepcopy(GOLDEN)
+    expected['sip']['settings'] = {'log-level': 'info'}
+
+    assert configuration(connect(device)) == expected
+    assert 'network/status' not in device.sent('retrieve')
+
+
+def test_configuration_paths(make_device):
+    device = make_gateway(make_device)
+    config = configuration(connect(device), ['sip/profile'])
+    assert config == {'sip': GOLDEN['sip']}
+
+
+def test_fleet(make_device, tmpdir):
+    devices = dict((host, make_gateway(make_device, host))
+                   for host in ('gw1', 'gw2', 'gw3'))
+    apis = dict((host, connect(device, host))
+                for host, device in devices.items())
+    golden = digest(configuration(apis['gw1'], ['network/ip', 'sip/profile']))
+    store = str(tmpdir.join('fleet.json'))
+
+    def run():
+        return fleet(golden, apis, ['network/ip', 'sip/profile'],
+                     store=store)
+
+    report = run()
+    assert not any(report.values())
+    assert all(drift.modified is None for drift in report.values())
+
+    devices['gw2'].collections['sip/profile']['internal']['sip-port'] = '5070'
+
+    def unreachable(request):
+        raise requests.ConnectionError('Connection refused')
+    devices['gw3'].transport.handler = unreachable
+
+    report = run()
+    assert report['gw1'].modified is False
+    assert report['gw2'].modified is True
+    assert report['gw2'].changed == [('sip', 'profile', 'internal',
+                                      'sip-port')]
+    assert isinstance(report['gw3'], requests.ConnectionError)
+
+    # Devices which couldn't be read keep their digests from before
+    assert DigestStore(store).get('gw3') == golden
+    assert DigestStore(store).get('gw2') != golden
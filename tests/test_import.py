@@ -0,0 +1,29 @@
+import os
+import sys
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(statement):
+    script = '{}; import sys; print(" ".join(sys.modules))'.format(statement)
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=ROOT)
+    return set(output.decode('ascii').split())
+
+
+def test_import_is_lazy():
+    modules = imported_modules('import safe')
+    assert 'safe.api' in modules
+    assert 'requests' not in modules
+    assert 'safe.library' not in modules
+
+
+def test_parse_without_requests():
+    modules = imported_modules('import safe; safe.parser.parse({})')
+    assert 'requests' not in modules
+
+
+def test_lazy_exports():
+    modules = imported_modules('import safe; safe.APIError')
+    assert 'requests' in modules
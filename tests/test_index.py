@@ -0,0 +1,138 @@
+import pytest
+import safe
+import safe.index
+
+
+class MockWrapper(object):
+    def __init__(self):
+        self.indexes = []
+
+
+class MockCollection(object):
+    def __init__(self, records):
+        self.records = records
+        self.api = MockWrapper()
+
+    def snapshot(self):
+        return dict(self.records)
+
+
+@pytest.fixture
+def ip_index():
+    collection = MockCollection({
+        'ip_1': {'address': '192.0.2.1', 'interface': 'eth0'},
+        'ip_2': {'address': '192.0.2.2', 'interface': 'eth0'},
+        'ip_3': {'address': '198.51.100.5', 'interface': 'eth1'},
+    })
+
+    index = safe.index.CollectionIndex(collection, ['address', 'interface'])
+    collection.api.indexes.append(index)
+    return index
+
+
+def test_lookup(ip_index):
+    assert ip_index.lookup('address', '198.51.100.5') == ['ip_3']
+    assert ip_index.lookup('interface', 'eth0') == ['ip_1', 'ip_2']
+    assert ip_index.lookup('address', '203.0.113.1') == []
+
+
+def test_lookup_unindexed_field(ip_index):
+    with pytest.raises(KeyError):
+        ip_index.lookup('netmask', '255.255.255.0')
+
+
+def test_find(ip_index):
+    assert ip_index.find({'interface': 'eth0', 'address': '192.0.2.2'}) == ['ip_2']
+    assert ip_index.find({}) == ['ip_1', 'ip_2', 'ip_3']
+
+
+def test_incremental_changes(ip_index):
+    ip_index.insert('ip_4', {'address': '203.0.113.1', 'interface': 'eth1'})
+    ip_index.merge('ip_1', {'interface': 'eth1'})
+    ip_index.discard('ip_3')
+
+    assert ip_index.lookup('interface', 'eth1') == ['ip_1', 'ip_4']
+    assert ip_index.lookup('address', '198.51.100.5') == []
+    assert ip_index['ip_1']['address'] == '192.0.2.1'
+
+
+def test_numeric_values_match_strings():
+    collection = MockCollection({'internal': {'sip-port': '5080'}})
+    index = safe.index.CollectionIndex(collection, ['sip-port'])
+    assert index.lookup('sip-port', 5080) == ['internal']
+
+
+def test_close(ip_index):
+    ip_index.close()
+    assert ip_index.collection.api.indexes == []
+
+
+IP_SPEC = {
+    "network": {
+        "name": "Network",
+        "object": {
+            "ip": {
+                "name": "IP",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                    "update": {"request": "POST"},
+                    "delete": {"request": "POST"}
+                }
+            }
+        }
+    }
+}
+
+
+@pytest.fixture
+def ip_api(make_device):
+    device = make_device(IP_SPEC, collections={'network/ip': {
+        'ip_1': {'address': '192.0.2.1', 'interface': 'eth0'},
+        'ip_2': {'address': '192.0.2.2', 'interface': 'eth0'},
+    }})
+    return safe.api('gw', transport=device.transport)
+
+
+def test_index_follows_collection_changes(ip_api):
+    ips = ip_api.network.ip
+    index = ips.index('address', 'interface')
+
+    ips.create('ip_3', {'address': '198.51.100.5', 'interface': 'eth1'})
+    assert index.lookup('address', '198.51.100.5') == ['ip_3']
+    assert index.lookup('interface', 'eth1') == ['ip_3']
+
+    ips.update('ip_1', {'interface': 'eth1'})
+    assert index.lookup('interface', 'eth0') == ['ip_2']
+    assert index.lookup('interface', 'eth1') == ['ip_1', 'ip_3']
+    assert index['ip_1']['address'] == '192.0.2.1'
+
+    ips.delete('ip_2')
+    assert index.lookup('address', '192.0.2.2') == []
+    assert index.lookup('interface', 'eth0') == []
+    assert 'ip_2' not in index
+
+    assert index.records == ips.snapshot()
+
+
+def test_index_follows_member_updates(ip_api):
+    ips = ip_api.network.ip
+    index = ips.index('address')
+
+    ips['ip_1'].update({'address': '203.0.113.1'})
+    assert index.lookup('address', '203.0.113.1') == ['ip_1']
+    assert index.lookup('address', '192.0.2.1') == []
+
+    ips['ip_2']['address'] = '203.0.113.2'
+    assert index.lookup('address', '203.0.113.2') == ['ip_2']
+    assert index.records == ips.snapshot()
+
+
+def test_closed_index_stops_following(ip_api):
+    ips = ip_api.network.ip
+    index = ips.index('address')
+    index.close()
+
+    ips.create('ip_3', {'address': '198.51.100.5'})
+    assert index.lookup('address', '198.51.100.5') == []
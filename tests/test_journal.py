@@ -0,0 +1,239 @@
+import io
+import json
+import pytest
+import requests
+from safe.cli import Runner, read_operations
+from safe.journal import (DONE, FAILED, PLANNED, Journal, applied, fetch,
+                          operation_id)
+from safe.raw import RawClient
+
+
+class MockClient(object):
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def retrieve(self, path, key=None):
+        if key not in self.objects:
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.HTTPError('Not found', response=response)
+        return self.objects[key]
+
+    def create(self, path, key, data):
+        self.calls.append(('create', key))
+        if key in self.objects:
+            raise ValueError('Conflict')
+        self.objects[key] = dict(data)
+
+
+def test_journal_replay(tmpdir):
+    path = str(tmpdir.join('job.journal'))
+    with Journal(path) as journal:
+        journal.plan('gw1', '1:a')
+        journal.done('gw1', '1:a')
+        journal.plan('gw1', '2:b', {'op': 'create'})
+        journal.failed('gw2', '1:a', 'Conflict')
+
+    # Simulate a crash mid-write
+    with open(path, 'ab') as fp:
+        fp.write(b'{"host": "gw1", "id": "3:c", "st')
+
+    with Journal(path) as journal:
+        assert journal.state('gw1', '1:a') == DONE
+        assert journal.state('gw1', '2:b') == PLANNED
+        assert journal.state('gw2', '1:a') == FAILED
+        assert journal.state('gw1', '3:c') is None
+        assert journal.pending() == ['2:b']
+        journal.done('gw1', '2:b')
+
+    assert Journal(path).state('gw1', '2:b') == DONE
+
+
+def test_applied():
+    client = MockClient()
+    create = {'op': 'create', 'path': 'sip/profile', 'key': 'a',
+              'data': {'sip-port': 5060}}
+    delete = {'op': 'delete', 'path': 'sip/profile', 'key': 'a'}
+
+    assert not applied(client, create)
+    assert applied(client, delete)
+    client.objects['a'] = {'sip-port': '5060'}
+    assert applied(client, create)
+    assert not applied(client, delete)
+
+
+def test_resume(tmpdir):
+    operations = [{'op': 'create', 'path': 'sip/profile', 'key': key,
+                   'data': {'sip-port': port}}
+                  for key, port in (('a', 1), ('b', 2), ('c', 3))]
+    ids = [operation_id(lineno, op) for lineno, op in enumerate(operations, 1)]
+
+    client = MockClient()
+    client.objects = {'a': {'sip-port': 1}, 'b': {'sip-port': 2}}
+
+    # The first run died with 'a' confirmed and 'b' sent but unconfirmed
+    path = str(tmpdir.join('job.journal'))
+    with Journal(path) as journal:
+        journal.plan('gw1', ids[0])
+        journal.done('gw1', ids[0])
+        journal.plan('gw1', ids[1])
+
+    stream = io.BytesIO('\n'.join(json.dumps(op) for op in operations)
+                        .encode('utf-8'))
+    with Journal(path) as journal:
+        runner = Runner({'gw1': client}, workers=2, progress=60,
+                        output=io.StringIO(), status=io.StringIO(),
+                        journal=journal)
+        runner.run(read_operations(stream))
+
+    assert runner.failed == 0
+    assert runner.skipped == 1
+    assert client.calls == [('create', 'c')]
+    assert all(Journal(path).state('gw1', ident) == DONE for ident in ids)
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                    "delete": {"request": "POST"}
+                }
+            }
+        }
+    }
+}
+
+
+class InvalidKeyDevice(object):
+    '''Report missing objects as a 400 with a message, like some
+    firmware does, rather than a 404.'''
+
+    @staticmethod
+    def missing(path, method, key):
+        return 400, {'status': False, 'error': {
+            'message': 'Invalid key {!r}'.format(key)}}
+
+
+@pytest.mark.parametrize('missing', [None, InvalidKeyDevice.missing])
+def test_fetch(make_device, missing):
+    device = make_device(SPEC, collections={
+        'sip/profile': {'internal': {'sip-port': '5060'}}})
+    if missing is not None:
+        device.missing = missing
+    client = RawClient('gw', spec=SPEC, transport=device.transport)
+
+    assert fetch(client, 'sip/profile', 'internal') == {'sip-port': '5060'}
+    assert fetch(client, 'sip/profile', 'external') is None
+
+
+def test_fetch_raises_other_errors(make_device):
+    device = make_device(SPEC, collections={
+        'sip/profile': {'internal': {'sip-port': '5060'}}})
+    device.transport.add('GET', device.base + 'retrieve/sip/profile/internal',
+                         {'status': False, 'error': 'Permission denied'},
+                         status=403)
+    device.transport.add('GET', device.base + 'retrieve/sip/profile/busy',
+                         {'status': False}, status=503)
+    client = RawClient('gw', spec=SPEC, transport=device.transport)
+
+    with pytest.raises(requests.HTTPError) as error:
+        fetch(client, 'sip/profile', 'internal')
+    assert error.value.response.status_code == 403
+    with pytest.raises(requests.HTTPError) as error:
+        fetch(client, 'sip/profile', 'busy')
+    assert error.value.response.status_code == 503
+
+
+def test_resume_after_timeout(make_device, tmpdir):
+    device = make_device(SPEC, collections={'sip/profile': {}})
+    profiles = device.collections['sip/profile']
+
+    def create(args, data):
+        # The device applies the create but the answer never arrives
+        profiles[args[0]] = data
+        raise requests.Timeout('Read timed out')
+    device.handlers['create', 'sip/profile'] = create
+
+    operations = [{'op': 'create', 'path': 'sip/profile', 'key': key,
+                   'data': {'sip-port': port}}
+                  for key, port in (('a', 1), ('b', 2))]
+    ids = [operation_id(lineno, op) for lineno, op in enumerate(operations, 1)]
+    client = RawClient('gw', spec=SPEC, transport=device.transport)
+
+    def run():
+        stream = io.BytesIO('\n'.join(json.dumps(op) for op in operations)
+                            .encode('utf-8'))
+        with Journal(path) as journal:
+            runner = Runner({'gw': client}, workers=2, progress=60,
+                            output=io.StringIO(), status=io.StringIO(),
+                            journal=journal)
+            runner.run(read_operations(stream))
+        return runner
+
+    path = str(tmpdir.join('job.journal'))
+    assert run().failed == 2
+    assert Journal(path).pending() == sorted(ids)
+    assert sorted(profiles) == ['a', 'b']
+
+    # The device answers again; resuming finds both already created
+    del device.handlers['create', 'sip/profile']
+    runner = run()
+    assert runner.failed == 0
+    # Only the first run's creates were ever sent
+    assert sorted(device.sent('create')) == ['sip/profile/a', 'sip/profile/b']
+    assert all(Journal(path).state('gw', ident) == DONE for ident in ids)
+
+
+def test_resume_checks_failed(tmpdir):
+    operation = {'op': 'create', 'path': 'sip/profile', 'key': 'a',
+                 'data': {'sip-port': 1}}
+    ident = operation_id(1, operation)
+
+    client = MockClient()
+    client.objects = {'a': {'sip-port': 1}}
+
+    # The first run saw a conflict from an attempt which went through
+    path = str(tmpdir.join('job.journal'))
+    with Journal(path) as journal:
+        journal.plan('gw1', ident)
+        journal.failed('gw1', ident, 'Conflict')
+
+    with Journal(path) as journal:
+        runner = Runner({'gw1': client}, workers=1, progress=60,
+                        output=io.StringIO(), status=io.StringIO(),
+                        journal=journal)
+        runner.run(read_operations(io.BytesIO(
+            json.dumps(operation).encode('utf-8'))))
+
+    assert runner.failed == 0
+    assert client.calls == []
+    assert Journal(path).state('gw1', ident) == DONE
+
+
+def test_rejected_operations_fail(make_device, tmpdir):
+    device = make_device(SPEC, collections={
+        'sip/profile': {'a': {'sip-port': '5060'}}})
+    client = RawClient('gw', spec=SPEC, transport=device.transport)
+    operation = {'op': 'create', 'path': 'sip/profile', 'key': 'a',
+                 'data': {'sip-port': 5080}}
+    ident = operation_id(1, operation)
+
+    # The device answered with a conflict, nothing is in doubt
+    path = str(tmpdir.join('job.journal'))
+    with Journal(path) as journal:
+        runner = Runner({'gw': client}, workers=1, progress=60,
+                        output=io.StringIO(), status=io.StringIO(),
+                        journal=journal)
+        runner.run(read_operations(io.BytesIO(
+            json.dumps(operation).encode('utf-8'))))
+
+    assert runner.failed == 1
+    assert Journal(path).state('gw', ident) == FAILED
+    assert Journal(path).pending() == []
@@ -0,0 +1,99 @@
+import threading
+from safe.monitor import Monitor, RingBuffer
+
+
+def test_ring_buffer():
+    buf = RingBuffer(4, 'i')
+    assert buf.latest() is None
+    assert buf.percentile(50) is None
+
+    for i, value in enumerate([1, 1, 2, 2, 3, 1]):
+        buf.append(float(i), value)
+
+    assert len(buf) == 4
+    assert buf.items() == [(2.0, 2), (3.0, 2), (4.0, 3), (5.0, 1)]
+    assert buf.latest() == (5.0, 1)
+    assert buf.transitions() == [(4.0, 2, 3), (5.0, 3, 1)]
+    assert buf.percentile(50) == 2
+    assert buf.percentile(100) == 3
+    assert buf.percentile(0) == 1
+
+
+class Object(object):
+    def __init__(self, func):
+        self.status = func
+
+
+class FakeDevice(object):
+    def __init__(self):
+        self.running = True
+        self.down = False
+
+    def service(self):
+        if self.down:
+            raise IOError('unreachable')
+        return {'status_text': 'RUNNING' if self.running else 'STOPPED'}
+
+    def configuration(self):
+        return {'modified': not self.running, 'reload': {'items': [
+            {'module': 'sip', 'status': 'modified',
+             'description': 'SIP profile'}]}}
+
+    def resolve(self, path):
+        if path == 'nsc/service':
+            return Object(self.service)
+        return Object(self.configuration)
+
+
+def test_monitor():
+    devices = {'gw1': FakeDevice(), 'gw2': FakeDevice()}
+    monitor = Monitor(devices, workers=2, size=8)
+
+    monitor.poll()
+    devices['gw2'].running = False
+    monitor.poll()
+    devices['gw2'].down = True
+    monitor.poll()
+
+    assert monitor.latest('gw1', 'service') == 'RUNNING'
+    assert monitor.latest('gw2', 'service') == 'STOPPED'
+    assert monitor.latest('gw2', 'up') is False
+    assert [value for _, value in monitor.series('gw2', 'up')] == \
+        [True, True, False]
+    assert [(old, new) for _, old, new in
+            monitor.transitions('gw2', 'service')] == [('RUNNING', 'STOPPED')]
+    assert monitor.percentile('gw1', 'latency', 95) >= 0
+
+    summary = monitor.summary()
+    assert summary['gw1']['pending'] == ['modified SIP profile']
+    assert summary['gw2']['modified'] is True
+    assert summary['gw2']['error'] == 'unreachable'
+    assert monitor.latest('gw3', 'service') is None
+
+
+class CountingLock(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquired = 0
+
+    def __enter__(self):
+        # Blocks forever if taken again by the thread holding it
+        assert self.lock.acquire(False), 'lock already held'
+        self.acquired += 1
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def test_summary_is_consistent():
+    devices = {'gw1': FakeDevice(), 'gw2': FakeDevice()}
+    monitor = Monitor(devices, workers=2, size=8)
+    monitor.poll()
+
+    monitor.lock = CountingLock()
+    summary = monitor.summary()
+    # Taken in one go, so samples recorded meanwhile can't tear it
+    assert monitor.lock.acquired == 1
+    assert summary['gw1']['up'] is True
+    assert summary['gw2']['service'] == 'RUNNING'
+    assert summary['gw2']['latency_p95'] >= 0
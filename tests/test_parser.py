@@ -69,3 +69,20 @@ def test_parse(safe_mock_ast):
     assert mock_obj.cls[0].tag == 'interface'
     for node in mock_obj.methods:
         assert node.tag in ('retrieve', 'update')
+
+
+def test_spec_index(safe_mock_ast):
+    index = safe.parser.SpecIndex(safe_mock_ast)
+
+    node = index.node('mock/configuration')
+    assert node is safe_mock_ast[0].objs[0]
+    assert 'mock/configuration' in index
+    assert index.method('mock/configuration', 'update')['request'] == 'POST'
+    assert index.field(('mock', 'configuration'), 'interface')['type'] == \
+        'dropdown'
+
+    assert index.with_method('retrieve') == (node,)
+    assert [f.tag for f in index.with_rule('in_list')] == ['interface']
+    assert index.with_rule('numeric') == ()
+    with pytest.raises(KeyError):
+        index.node('mock/missing')
@@ -0,0 +1,202 @@
+import pytest
+import safe
+from safe.plan import Planner, collect, rebuild, spec_references, teardown
+
+
+OBJECTS = {
+    ('network/ip', 'ip_1'): {'address': '192.0.2.1'},
+    ('network/ip', 'ip_3'): {'address': '198.51.100.5'},
+    ('sip/profile', 'internal'): {'sip-ip': 'ip_1', 'sip-port': '5060'},
+    ('sip/profile', 'external'): {'sip-ip': 'ip_3', 'sip-port': '5080'},
+    ('sip/trunk', 'carrier'): {'profile': 'external', 'codecs': ['g711']},
+}
+
+
+def test_references():
+    planner = Planner(OBJECTS)
+    assert planner.dependencies['sip/profile', 'external'] == \
+        set([('network/ip', 'ip_3')])
+    assert planner.dependents['sip/profile', 'external'] == \
+        set([('sip/trunk', 'carrier')])
+
+
+def test_declared_references():
+    planner = Planner(OBJECTS, references={'sip/profile': {'sip-ip': 'network/ip'}})
+    assert planner.dependencies['sip/profile', 'external'] == \
+        set([('network/ip', 'ip_3')])
+    assert planner.dependencies['sip/trunk', 'carrier'] == set()
+
+
+def test_teardown_includes_dependents():
+    planner = Planner(OBJECTS)
+    levels = planner.levels(planner.teardown_graph([('network/ip', 'ip_3')]))
+    assert levels == [[('sip/trunk', 'carrier')],
+                      [('sip/profile', 'external')],
+                      [('network/ip', 'ip_3')]]
+
+
+def test_build_order():
+    planner = Planner(OBJECTS)
+    levels = planner.levels(planner.build_graph())
+    assert levels[0] == [('network/ip', 'ip_1'), ('network/ip', 'ip_3')]
+    assert levels[-1] == [('sip/trunk', 'carrier')]
+
+
+def test_cycle():
+    planner = Planner({('a/x', 'one'): {'ref': 'two'},
+                       ('b/y', 'two'): {'ref': 'one'}})
+    with pytest.raises(ValueError):
+        planner.levels(planner.build_graph())
+
+
+METHODS = {
+    "list": {"request": "GET"},
+    "retrieve": {"request": "GET"},
+    "create": {"request": "POST"},
+    "delete": {"request": "POST"}
+}
+
+
+def dropdown(*options):
+    return {"type": "dropdown", "rules": "required",
+            "value": dict((option, option) for option in options)}
+
+
+SPEC = {
+    "network": {
+        "name": "Network",
+        "object": {
+            "ip": {
+                "name": "IP",
+                "methods": METHODS,
+                "class": {"address": {"type": "text"}}
+            }
+        }
+    },
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "acl": {
+                "name": "ACL",
+                "methods": METHODS,
+                "class": {"rule": {"type": "text"}}
+            },
+            "profile": {
+                "name": "Profile",
+                "methods": dict(METHODS, stop={"request": "POST"}),
+                "class": {
+                    "sip-ip": dropdown("ip_1", "ip_3"),
+                    "parent": {"rules": "in_list[internal,external,backup]"},
+                    "acl-mode": {"rules": "in_list[default,strict]"}
+                }
+            },
+            "trunk": {
+                "name": "Trunk",
+                "methods": METHODS,
+                "class": {"profile": dropdown("internal", "external",
+                                              "backup")}
+            }
+        }
+    }
+}
+
+COLLECTIONS = {
+    'network/ip': {'ip_1': {'address': '192.0.2.1'},
+                   'ip_3': {'address': '198.51.100.5'}},
+    'sip/acl': {'default': {'rule': 'allow'}},
+    'sip/profile': {
+        'internal': {'sip-ip': 'ip_1', 'acl-mode': 'default'},
+        'external': {'sip-ip': 'ip_3', 'parent': 'internal'},
+        'backup': {'sip-ip': 'ip_3', 'parent': 'external',
+                   'acl-mode': 'default'},
+    },
+    'sip/trunk': {'carrier': {'profile': 'backup'}},
+}
+
+
+@pytest.fixture
+def device(make_device):
+    device = make_device(SPEC, collections=COLLECTIONS)
+    device.stopped = []
+    device.handlers['stop', 'sip/profile'] = \
+        lambda args, data: device.stopped.append(args[0])
+    return device
+
+
+@pytest.fixture
+def api(device):
+    return safe.api('gw', transport=device.transport)
+
+
+def snapshot(api):
+    return collect(api, sorted(COLLECTIONS))
+
+
+def test_spec_references(api):
+    references = spec_references(api.spec_index, snapshot(api))
+    assert references == {
+        'sip/profile': {'sip-ip': set(['network/ip']),
+                        'parent': set(['sip/profile'])},
+        'sip/trunk': {'profile': set(['sip/profile'])},
+    }
+
+
+def test_teardown(api, device):
+    planner = Planner(snapshot(api), index=api.spec_index)
+    deleted = teardown(api, planner, [('sip/profile', 'external')])
+
+    assert deleted == [('sip/profile', 'backup'), ('sip/profile', 'external'),
+                       ('sip/trunk', 'carrier')]
+    assert device.sent('delete') == ['sip/trunk/carrier', 'sip/profile/backup',
+                                     'sip/profile/external']
+    assert device.stopped == ['backup', 'external']
+    assert sorted(device.collections['sip/profile']) == ['internal']
+    assert device.collections['sip/acl'] == {'default': {'rule': 'allow'}}
+
+
+def test_teardown_refuses_guessed_cascade(api, device):
+    planner = Planner(snapshot(api))
+    assert ('sip/profile', 'internal') in \
+        planner.teardown_set([('sip/acl', 'default')])
+
+    with pytest.raises(ValueError) as error:
+        teardown(api, planner, [('sip/acl', 'default')])
+    assert 'sip/profile/internal' in str(error.value)
+    assert device.sent('delete') == []
+
+    # Asking for exactly the objects deleted is fine
+    assert teardown(api, planner, [('sip/trunk', 'carrier')]) == \
+        [('sip/trunk', 'carrier')]
+
+
+def test_teardown_confirm(api, device):
+    planner = Planner(snapshot(api), index=api.spec_index)
+    shown = []
+
+    def confirm(nodes):
+        shown.append(nodes)
+        return False
+
+    assert teardown(api, planner, [('network/ip', 'ip_1')],
+                    confirm=confirm) == []
+    assert shown == [[('network/ip', 'ip_1'), ('sip/profile', 'backup'),
+                      ('sip/profile', 'external'), ('sip/profile', 'internal'),
+                      ('sip/trunk', 'carrier')]]
+    assert device.sent('delete') == []
+
+
+def test_rebuild(api, device):
+    objects = snapshot(api)
+    planner = Planner(objects, index=api.spec_index)
+    teardown(api, planner, stop=False)
+    assert all(not members for members in device.collections.values())
+    assert device.stopped == []
+
+    rebuild(api, planner, workers=1)
+    assert device.collections == COLLECTIONS
+
+    created = device.sent('create')
+    assert created.index('network/ip/ip_3') < \
+        created.index('sip/profile/external') < \
+        created.index('sip/profile/backup') < \
+        created.index('sip/trunk/carrier')
@@ -0,0 +1,56 @@
+import pytest
+import safe
+from safe import profiler
+from safe.transport import MemoryTransport
+
+
+BASE = 'http://gw:80/SAFe/sng_rest/'
+
+
+@pytest.fixture
+def profiling():
+    profiler.reset()
+    profiler.enable(at_exit=False)
+    yield profiler
+    profiler.disable()
+    profiler.reset()
+
+
+def test_phases(profiling):
+    transport = MemoryTransport()
+    transport.add('GET', BASE + 'api/retrieve/nsc/version', {
+        'status': True, 'data': {'major_version': '2', 'minor_version': '3',
+                                 'patch_version': '1'}})
+    transport.add('GET', BASE + 'doc', {
+        'sip': {'name': 'SIP', 'object': {'profile': {
+            'name': 'Profile', 'methods': {'list': {'request': 'GET'}}}}}})
+    transport.add('GET', BASE + 'api/list/sip/profile',
+                  {'status': True, 'data': ['internal']})
+
+    api = safe.api('gw', transport=transport)
+    assert api.sip.profile.keys() == ['internal']
+
+    report = profiler.report()
+    phases = report['phases']
+    for name in ('spec', 'parse', 'types', 'url', 'wire', 'decode'):
+        assert phases[name]['calls'] > 0, name
+    assert phases['wire']['calls'] == 3
+    assert report['library_seconds'] > 0
+    assert all(entry['site'].startswith(__file__.rstrip('c'))
+               for entry in report['sites'])
+    assert 'top call sites' in profiler.format_report()
+
+
+def test_nested_time_counted_once(profiling):
+    with profiler.phase('spec'):
+        with profiler.phase('wire'):
+            pass
+    phases = profiler.report()['phases']
+    assert phases['spec']['calls'] == phases['wire']['calls'] == 1
+
+
+def test_disabled():
+    profiler.reset()
+    with profiler.phase('wire'):
+        pass
+    assert profiler.report()['phases'] == {}
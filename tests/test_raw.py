@@ -0,0 +1,164 @@
+import pytest
+from safe.library import APIError, CommitIncomplete
+from safe.raw import RawClient, split_path
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                    "update": {"request": "POST"},
+                    "delete": {"request": "POST"},
+                    "stop": {"request": "POST"}
+                },
+                "object": {
+                    "gateway": {
+                        "name": "Gateway",
+                        "methods": {
+                            "list": {"request": "GET"},
+                            "retrieve": {"request": "GET"},
+                            "create": {"request": "POST"}
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "nsc": {
+        "name": "NSC",
+        "object": {
+            "configuration": {
+                "name": "Configuration",
+                "singleton": True,
+                "methods": {
+                    "status": {"request": "GET"},
+                    "smartapply": {"request": "POST"}
+                }
+            },
+            "service": {
+                "name": "Service",
+                "singleton": True,
+                "methods": {
+                    "status": {"request": "GET"}
+                }
+            }
+        }
+    }
+}
+
+
+@pytest.fixture
+def device(make_device):
+    device = make_device(SPEC, collections={
+        'sip/profile': {'internal': {'sip-port': '5060'}},
+        'sip/profile/internal/gateway': {'carrier': {'proxy': '192.0.2.9'}},
+    })
+    device.stopped = []
+    device.handlers['stop', 'sip/profile'] = \
+        lambda args, data: device.stopped.append(args[0])
+    return device
+
+
+def test_split_path():
+    assert split_path('sip/profile') == ('sip', 'profile')
+    assert split_path('/sip/profile/') == ('sip', 'profile')
+    assert split_path(['sip', 'profile']) == ('sip', 'profile')
+
+
+def test_request_type_without_spec(device):
+    client = RawClient('gw', transport=device.transport)
+    assert client.request_type(('sip', 'profile'), 'list') == 'GET'
+    assert client.request_type(('sip', 'profile'), 'delete') == 'POST'
+    assert client.index is None
+    assert not device.requests
+
+    # Other methods are looked up in the device's specification
+    assert client.request_type(('sip', 'profile'), 'stop') == 'POST'
+    assert client.request_type(('nsc', 'configuration'), 'status') == 'GET'
+    assert [r.url for r in device.requests] == [device.doc_url]
+
+    client.call('sip/profile', 'stop', 'internal')
+    assert device.stopped == ['internal']
+
+
+def test_request_type_with_spec():
+    client = RawClient('192.0.2.1', spec=SPEC)
+    assert client.request_type(('sip', 'profile'), 'stop') == 'POST'
+
+    with pytest.raises(ValueError):
+        client.call('sip/profile', 'download', 'internal')
+    with pytest.raises(ValueError):
+        client.call('sip/trunk', 'list')
+
+
+def test_nested_paths_with_spec():
+    client = RawClient('192.0.2.1', spec=SPEC)
+    path = split_path('sip/profile/internal/gateway')
+    assert client.request_type(path, 'create') == 'POST'
+    assert sorted(client.object(path).methods) == \
+        ['create', 'list', 'retrieve']
+
+    with pytest.raises(ValueError):
+        client.request_type(split_path('sip/profile/internal/trunk'), 'list')
+    with pytest.raises(ValueError):
+        client.request_type(split_path('sip/profile/a/b/gateway'), 'list')
+    with pytest.raises(ValueError):
+        client.request_type(split_path('nsc/configuration/x'), 'status')
+
+
+@pytest.mark.parametrize('spec', [None, SPEC])
+def test_calls(device, spec):
+    client = RawClient('gw', spec=spec, transport=device.transport)
+
+    assert client.list('sip/profile') == ['internal']
+    assert client.retrieve('sip/profile', 'internal') == {'sip-port': '5060'}
+
+    client.create('sip/profile', 'external', {'sip-port': 5080})
+    client.update('sip/profile', {'sip-port': 5090}, key='external')
+    assert client.retrieve('sip/profile', 'external') == {'sip-port': 5090}
+
+    client.call('sip/profile', 'stop', 'external', data={})
+    assert device.stopped == ['external']
+
+    client.delete('sip/profile', 'external')
+    assert client.list('sip/profile') == ['internal']
+    with pytest.raises(APIError):
+        client.retrieve('sip/profile', 'external')
+
+
+def test_nested_calls(device):
+    client = RawClient('gw', spec=SPEC, transport=device.transport)
+    gateways = client.object('sip/profile/internal/gateway')
+
+    assert gateways.list() == ['carrier']
+    gateways.create('backup', data={'proxy': '192.0.2.10'})
+    assert client.retrieve('sip/profile/internal/gateway', 'backup') == \
+        {'proxy': '192.0.2.10'}
+    assert device.sent('create') == ['sip/profile/internal/gateway/backup']
+
+
+def test_commit(device):
+    applied = []
+    status = {'modified': True}
+    device.handlers['status', 'nsc/configuration'] = \
+        lambda args, data: status
+    device.handlers['smartapply', 'nsc/configuration'] = \
+        lambda args, data: applied.append(status.update(modified=False))
+
+    client = RawClient('gw', transport=device.transport)
+    client.commit()
+    assert len(applied) == 1
+    # The specification was needed to find smartapply
+    assert client.index is not None
+
+    status['modified'] = True
+    device.handlers['smartapply', 'nsc/configuration'] = \
+        lambda args, data: None
+    with pytest.raises(CommitIncomplete):
+        client.commit()
@@ -0,0 +1,55 @@
+import pytest
+from safe.parser import parse
+from safe.record import record_type
+
+
+@pytest.fixture
+def profile_record():
+    ast = parse({
+        "sip": {
+            "object": {
+                "profile": {
+                    "name": "Profile",
+                    "class": {
+                        "sip-ip": {"rules": "required"},
+                        "sip-port": {"rules": "required"},
+                        "sip_port": {},
+                        "tojson": {},
+                        "class": {}
+                    }
+                }
+            }
+        }
+    })
+    return record_type(ast[0].objs[0])
+
+
+def test_record_type_cached(profile_record):
+    assert record_type(profile_record._node) is profile_record
+    assert profile_record.__name__ == 'ProfileRecord'
+
+
+def test_record_attributes(profile_record):
+    record = profile_record.fromjson({'sip-ip': 'ip_3', 'sip-port': '5080',
+                                      'sip_port': '1', 'tojson': 'a',
+                                      'class': 'b'})
+    assert record.sip_ip == 'ip_3'
+    assert not hasattr(record, '__dict__')
+    assert sorted(record._attributes) == ['class_', 'sip_ip', 'sip_port',
+                                          'sip_port_', 'tojson_']
+    assert getattr(record, record._attribute_map['sip-port']) == '5080'
+
+
+def test_record_roundtrip(profile_record):
+    payload = {'sip-ip': 'ip_3', 'sip-port': '5080', 'unknown': True}
+    record = profile_record.fromjson(payload)
+    assert record.tojson() == payload
+
+
+def test_record_compare(profile_record):
+    internal = profile_record.fromjson({'sip-ip': 'ip_3', 'sip-port': '5060'})
+    external = profile_record.fromjson({'sip-ip': 'ip_3', 'sip-port': '5080'})
+
+    assert internal != external
+    assert internal == profile_record.fromjson(internal.tojson())
+    assert internal.diff(external) == {'sip-port': ('5060', '5080')}
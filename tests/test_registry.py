@@ -0,0 +1,197 @@
+import pytest
+import requests
+import safe.registry
+from safe.library import APIError
+from safe.registry import Registry
+from safe.transport import MemoryTransport
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"}
+                }
+            }
+        }
+    }
+}
+
+UPGRADED_SPEC = {
+    "sip": SPEC["sip"],
+    "sngms": {
+        "name": "Media",
+        "object": {}
+    }
+}
+
+
+class Transport(MemoryTransport):
+    '''A transport to a shared device, remembering whether it was
+    closed, which raises :attr:`error` while it's set.'''
+
+    def __init__(self, device):
+        super(Transport, self).__init__(device.handle)
+        self.responses = device.transport.responses
+        self.closed = False
+        self.error = None
+
+    def request(self, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return super(Transport, self).request(*args, **kwargs)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def device(make_device):
+    return make_device(SPEC, collections={
+        'sip/profile': {'internal': {'sip-port': '5060'}}})
+
+
+@pytest.fixture
+def transports(device, monkeypatch):
+    '''Make the registry open its own transports to the device.'''
+    opened = []
+
+    def make_session(*args):
+        opened.append(Transport(device))
+        return opened[-1]
+
+    monkeypatch.setattr(safe.registry, 'make_session', make_session)
+    return opened
+
+
+def test_entries_are_shared(device):
+    registry = Registry()
+    api = registry.get('gw', transport=device.transport)
+
+    assert registry.get('gw', transport=device.transport) is api
+    assert registry.get('gw') is api
+    assert ('gw', 80, 'http', None) in registry
+    assert len(device.sent('retrieve')) == 1
+    assert api.sip.profile.keys() == ['internal']
+
+    other = registry.get('gw', token='secret', transport=device.transport)
+    assert other is not api
+    assert len(registry) == 2
+
+
+def test_failed_connection_is_not_kept():
+    registry = Registry()
+    with pytest.raises(requests.HTTPError):
+        registry.get('gw', transport=MemoryTransport())
+    assert len(registry) == 0
+
+
+def test_reconnect(device, transports):
+    registry = Registry(check_interval=0)
+    api = registry.get('gw')
+    assert api.session is transports[0]
+
+    transports[0].error = requests.ConnectionError('Connection refused')
+    reconnected = registry.get('gw')
+
+    assert transports[0].closed
+    assert len(transports) == 2
+    # The api is rebuilt around the new transport, children included
+    assert reconnected is not api
+    assert reconnected.session is transports[1]
+    assert reconnected.sip.profile.api.session is transports[1]
+    assert reconnected.sip.profile.keys() == ['internal']
+
+
+def test_other_errors_are_raised(device, transports):
+    registry = Registry(check_interval=0)
+    registry.get('gw')
+
+    transports[0].error = ValueError('Bug')
+    with pytest.raises(ValueError):
+        registry.get('gw')
+    assert len(transports) == 1
+
+
+@pytest.mark.parametrize('error', [
+    APIError('Invalid API key'),
+    requests.HTTPError('503 Server Error: Service Unavailable'),
+])
+def test_device_errors_are_raised(device, transports, error):
+    registry = Registry(check_interval=0)
+    registry.get('gw')
+
+    transports[0].error = error
+    with pytest.raises(requests.HTTPError):
+        registry.get('gw')
+    assert len(transports) == 1
+    assert not transports[0].closed
+
+
+def test_caller_transport_is_not_closed(device):
+    registry = Registry(check_interval=0)
+    transport = Transport(device)
+    registry.get('gw', transport=transport)
+    registry.close()
+    assert not transport.closed
+
+
+def test_firmware_upgrade(device):
+    registry = Registry(check_interval=0)
+    api = registry.get('gw', transport=device.transport)
+    assert registry.get('gw') is api
+
+    device.transport.add('GET', device.doc_url, UPGRADED_SPEC)
+    device.transport.add('GET', device.base + 'retrieve/nsc/version', {
+        'status': True, 'data': {'major_version': '2', 'minor_version': '4',
+                                 'patch_version': '0'}})
+
+    upgraded = registry.get('gw')
+    assert upgraded is not api
+    assert upgraded.api.version == (2, 4, 0)
+    assert hasattr(upgraded, 'sngms')
+    assert not hasattr(api, 'sngms')
+
+
+def test_sweep(device, transports):
+    registry = Registry(max_idle=60, check_interval=60)
+    registry.get('gw', token='idle')
+    registry.get('gw', token='busy')
+
+    entry = registry.entries['gw', 80, 'http', 'idle']
+    entry.last_used -= 120
+    registry.last_sweep -= 120
+    registry.sweep()
+
+    assert ('gw', 80, 'http', 'idle') not in registry
+    assert ('gw', 80, 'http', 'busy') in registry
+    assert transports[0].closed
+    assert not transports[1].closed
+
+
+def test_sweep_is_rate_limited(device, transports):
+    registry = Registry(max_idle=60, check_interval=60)
+    registry.get('gw')
+    registry.entries['gw', 80, 'http', None].last_used -= 120
+
+    registry.sweep()
+    assert len(registry) == 1
+
+
+def test_evict(device, transports):
+    registry = Registry()
+    api = registry.get('gw')
+    registry.evict('gw')
+
+    assert len(registry) == 0
+    assert transports[0].closed
+    assert registry.get('gw') is not api
+    assert len(transports) == 2
+
+    registry.close()
+    assert len(registry) == 0
+    assert transports[1].closed
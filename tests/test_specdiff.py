@@ -0,0 +1,81 @@
+import copy
+import pytest
+from safe.api import APICollection, build_type
+from safe.parser import parse
+from safe.specdiff import diff, share
+
+
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "class": {
+                    "sip-ip": {"rules": "required"},
+                    "sip-port": {"rules": "required|numeric"},
+                },
+                "methods": {
+                    "retrieve": {"request": "GET"},
+                    "flush": {"request": "POST"},
+                },
+            },
+            "trunk": {
+                "name": "Trunk",
+                "class": {"profile": {"rules": "required"}},
+                "methods": {"retrieve": {"request": "GET"}},
+            },
+        },
+    },
+}
+
+
+@pytest.fixture
+def upgraded():
+    spec = copy.deepcopy(SPEC)
+    profile = spec['sip']['object']['profile']
+    del profile['methods']['flush']
+    profile['methods']['kill'] = {"request": "POST"}
+    profile['class']['sip-port']['rules'] = 'required'
+    profile['class']['tls'] = {}
+    return spec
+
+
+def test_identical():
+    changes = diff(parse(copy.deepcopy(SPEC)), parse(copy.deepcopy(SPEC)))
+    assert not changes
+    assert not changes.breaking
+
+
+def test_report(upgraded):
+    changes = diff(parse(copy.deepcopy(SPEC)), parse(upgraded))
+    assert changes.added == {'objects': [],
+                             'methods': ['sip/profile/kill'],
+                             'fields': ['sip/profile/tls']}
+    assert changes.removed['methods'] == ['sip/profile/flush']
+    assert changes.changed['fields'] == ['sip/profile/sip-port']
+    assert changes.breaking
+    assert changes.asdict()['breaking'] is True
+
+
+def test_types_reused(upgraded):
+    old = parse(copy.deepcopy(SPEC))[0].objs
+    new = parse(upgraded)[0].objs
+    old, new = by_tag(old), by_tag(new)
+
+    assert build_type(new['trunk'], APICollection) is \
+        build_type(old['trunk'], APICollection)
+    assert build_type(new['profile'], APICollection) is not \
+        build_type(old['profile'], APICollection)
+
+
+def test_share(upgraded):
+    old = share(parse(copy.deepcopy(SPEC)))
+    new = share(parse(upgraded))
+    assert by_tag(new[0].objs)['trunk'] is by_tag(old[0].objs)['trunk']
+    assert by_tag(new[0].objs)['profile'] is not \
+        by_tag(old[0].objs)['profile']
+
+
+def by_tag(nodes):
+    return dict((node.tag, node) for node in nodes)
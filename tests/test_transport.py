@@ -0,0 +1,131 @@
+import json
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+import safe
+from safe.api import make_session
+from safe.library import APIError
+from safe.transport import MemoryTransport, RequestsTransport
+
+
+BASE = 'http://gw:80/SAFe/sng_rest/api/'
+SPEC = {
+    "sip": {
+        "name": "SIP",
+        "object": {
+            "profile": {
+                "name": "Profile",
+                "methods": {
+                    "list": {"request": "GET"},
+                    "retrieve": {"request": "GET"},
+                    "create": {"request": "POST"},
+                }
+            }
+        }
+    }
+}
+
+
+def memory_transport():
+    profiles = {'internal': {'sip-port': '5060'}}
+
+    def handler(request):
+        if request.url == BASE + 'list/sip/profile':
+            return 200, {'status': True, 'data': sorted(profiles)}
+        if request.url.startswith(BASE + 'retrieve/sip/profile/'):
+            key = request.url.rsplit('/', 1)[-1]
+            if key not in profiles:
+                return 404, {'status': False, 'name': key,
+                             'error': {'message': 'Not found'}}
+            return 200, {'status': True, 'data': profiles[key]}
+        if request.url.startswith(BASE + 'create/sip/profile/'):
+            profiles[request.url.rsplit('/', 1)[-1]] = request.json()
+            return 200, {'status': True}
+
+    transport = MemoryTransport(handler)
+    transport.add('GET', BASE + 'retrieve/nsc/version', {
+        'status': True, 'data': {'major_version': '2', 'minor_version': '3',
+                                 'patch_version': '1'}})
+    transport.add('GET', 'http://gw:80/SAFe/sng_rest/doc', SPEC)
+    return transport
+
+
+def test_memory_transport():
+    transport = memory_transport()
+    api = safe.api('gw', token='secret', transport=transport)
+
+    assert api.session.transport is transport
+    assert api.sip.profile.keys() == ['internal']
+    api.sip.profile.create('external', {'sip-port': '5080'})
+    assert api.sip.profile.retrieve('external') == {'sip-port': '5080'}
+    assert all(r.headers['X-API-KEY'] == 'secret' for r in transport.requests)
+    # The caller's transport can be shared with other devices
+    assert transport.headers == {}
+
+    with pytest.raises(APIError) as excinfo:
+        api.sip.profile.retrieve('missing')
+    assert 'Not found' in str(excinfo.value)
+
+
+def test_adapter_needs_requests():
+    with pytest.raises(ValueError):
+        safe.api('gw', adapter=object(), transport=memory_transport())
+
+
+def test_requests_transport():
+    transport = RequestsTransport(timeout=5)
+    transport.headers['X-API-KEY'] = 'secret'
+    assert transport.session.headers['X-API-KEY'] == 'secret'
+    # Anything else is forwarded to the session
+    assert transport.verify is True
+    transport.close()
+
+
+class CapturingAdapter(BaseAdapter):
+    def __init__(self):
+        super(CapturingAdapter, self).__init__()
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['content-type'] = 'application/json'
+        response._content = b'{"status": true}'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_requests_transport_options():
+    adapter = CapturingAdapter()
+    transport = RequestsTransport(timeout=5)
+    transport.mount('http://gw:80', adapter)
+
+    transport.get(BASE + 'list/sip/profile')
+    transport.get(BASE + 'list/sip/profile', timeout=1, verify=False)
+    transport.post(BASE + 'create/sip/profile/external',
+                   json={'sip-port': '5080'})
+
+    (_, first), (_, second), (posted, third) = adapter.sent
+    assert first['timeout'] == 5
+    assert second['timeout'] == 1 and second['verify'] is False
+    assert third['timeout'] == 5
+    assert json.loads(posted.body.decode('utf-8')) == {'sip-port': '5080'}
+
+
+def test_token_leaves_caller_transport_alone():
+    adapter = CapturingAdapter()
+    transport = RequestsTransport()
+    transport.mount('http://gw:80', adapter)
+
+    session = make_session('gw', token='secret', transport=transport)
+    session.get(BASE + 'list/sip/profile')
+    transport.get(BASE + 'list/sip/profile')
+
+    assert 'X-API-KEY' not in transport.headers
+    assert [r.headers.get('X-API-KEY') for r, _ in adapter.sent] == \
+        ['secret', None]
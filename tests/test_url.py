@@ -0,0 +1,31 @@
+import safe.url
+
+
+BASE = 'http://192.0.2.1:80/SAFe/sng_rest/'
+
+
+def test_url():
+    builder = safe.url.url_builder('192.0.2.1').join('sip', 'profile')
+    assert builder.url('list') == BASE + 'api/list/sip/profile'
+    assert builder.url('retrieve', path=['internal']) == \
+        BASE + 'api/retrieve/sip/profile/internal'
+
+
+def test_url_section():
+    builder = safe.url.url_builder('192.0.2.1')
+    assert builder.url(None, section='doc') == BASE + 'doc'
+    assert builder.url(None, section='config') == BASE + 'config'
+
+
+def test_url_quoting():
+    builder = safe.url.url_builder('192.0.2.1').join('sip', 'profile', 'a b/c')
+    assert builder.url('retrieve') == BASE + 'api/retrieve/sip/profile/a%20b%2Fc'
+    assert builder.url('download', path=['x?y', 5]) == \
+        BASE + 'api/download/sip/profile/a%20b%2Fc/x%3Fy/5'
+
+
+def test_prefix_cached():
+    builder = safe.url.url_builder('192.0.2.1').join('nsc', 'version')
+    builder.url('retrieve')
+    assert builder.prefix('retrieve') is builder.prefix('retrieve')
+
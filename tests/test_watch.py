@@ -0,0 +1,98 @@
+import json
+import safe
+import safe.url
+import safe.watch
+from safe.watch import Poller
+
+
+class MockResponse(object):
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = {'content-type': 'application/json'}
+        self.headers.update(headers or {})
+        self.content = json.dumps(data).encode('utf-8')
+
+
+class MockSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def get(self, url, params=None, headers=None):
+        self.headers.append(headers)
+        return self.responses.pop(0)
+
+
+class MockWrapper(object):
+    def __init__(self, session):
+        self.session = session
+        self.builder = safe.url.url_builder('192.0.2.1').join('nsc', 'configuration')
+
+
+def test_poll_hash_comparison():
+    status = {'status': True, 'data': {'modified': False}}
+    session = MockSession([MockResponse(200, status),
+                           MockResponse(200, status),
+                           MockResponse(200, {'status': True,
+                                              'data': {'modified': True}})])
+    poller = Poller(MockWrapper(session), 'status')
+
+    assert poller.poll().data == {'modified': False}
+    assert poller.poll() is None
+    assert poller.poll().data == {'modified': True}
+
+
+def test_poll_conditional_request():
+    status = {'status': True, 'data': {'modified': False}}
+    session = MockSession([MockResponse(200, status, {'etag': '"abc"'}),
+                           MockResponse(304)])
+    poller = Poller(MockWrapper(session), 'status')
+
+    assert poller.poll().data == {'modified': False}
+    assert poller.poll() is None
+    assert session.headers[1] == {'If-None-Match': '"abc"'}
+
+
+SPEC = {
+    "nsc": {
+        "name": "NSC",
+        "object": {
+            "configuration": {
+                "name": "Configuration",
+                "singleton": True,
+                "methods": {
+                    "retrieve": {"request": "GET"},
+                    "status": {"request": "GET"}
+                }
+            }
+        }
+    }
+}
+
+
+def test_watch(make_device, monkeypatch):
+    device = make_device(SPEC)
+    states = [{'modified': False}, {'modified': False}, {'modified': True},
+              {'modified': True}, {'modified': True}, {'modified': False}]
+    polls = []
+
+    def status(args, data):
+        polls.append(args)
+        return states[len(polls) - 1]
+    device.handlers['status', 'nsc/configuration'] = status
+
+    sleeps = []
+    monkeypatch.setattr(safe.watch.time, 'sleep', sleeps.append)
+
+    api = safe.api('gw', transport=device.transport)
+    watcher = api.nsc.configuration.watch('status', interval=5)
+
+    assert next(watcher) == {'modified': False}
+    assert next(watcher) == {'modified': True}
+    assert len(polls) == 3
+    assert next(watcher) == {'modified': False}
+    assert len(polls) == 6
+    # Slept between every poll, never longer than the interval
+    assert len(sleeps) == 5
+    assert all(0 <= seconds <= 5 for seconds in sleeps)
+    watcher.close()